@@ -0,0 +1,184 @@
+# alerts.py
+# 門檻告警規則引擎：寫入端每寫一個 tick 就對全部設備評估一次（跟原始資料同一個 transaction 寫入 alerts 表）
+#   LOW_EFFICIENCY   RUN 狀態下效率低於 LOW_EFF_THRESHOLD，連續 LOW_EFF_TICKS 個 RUN tick
+#                    （IDLE 的效率本來就低，不計入也不中斷計數）
+#   ZERO_OUTPUT      RUN 狀態卻沒有產出，連續 ZERO_OUTPUT_TICKS 個 tick
+#   MTTR_EXCEEDED    單次 ERROR 持續超過 MTTR_BUDGET_SEC（仍在維修中就觸發，不等修好）
+#   RATE_DRIFT       每 tick 產量的短期均值偏離該機長期均值超過 DRIFT_RATIO
+#                    （兩者皆為指數移動平均；再除以全廠的中位數比值，班別換班等全廠一起變動時不會整批告警）
+# 每台設備的狀態是固定大小的陣列元素（計數器、EWMA、ERROR 起點），每個 tick 的成本 O(設備數)，與歷史長度無關；
+# 全部以 NumPy 對整個機群一次計算（同 simulator.VectorEngine）。每條規則條件成立時只觸發一次，解除後才會再觸發
+import datetime as dt
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models import Alert
+
+# ====== 可調參數（tick 數以 TICK_SECONDS = 5 秒計） ======
+LOW_EFF_THRESHOLD = 0.6
+LOW_EFF_TICKS = 6             # 30 秒
+ZERO_OUTPUT_TICKS = 3         # 15 秒
+MTTR_BUDGET_SEC = 600         # 10 分鐘
+DRIFT_SHORT_TICKS = 12        # 短期均值約 1 分鐘
+DRIFT_LONG_TICKS = 720        # 長期均值約 1 小時
+DRIFT_MIN_SAMPLES = 60        # RUN 滿 5 分鐘才開始比較
+DRIFT_RATIO = 0.3             # 偏離 30% 觸發，回到 15% 以內才解除
+
+RULES = ("LOW_EFFICIENCY", "ZERO_OUTPUT", "MTTR_EXCEEDED", "RATE_DRIFT")
+_STATUS = {"RUN": 0, "IDLE": 1, "ERROR": 2}
+RUN, IDLE, ERROR = 0, 1, 2
+EPOCH = dt.datetime(1970, 1, 1)
+
+
+class AlertEngine:
+    FIELDS = {
+        "have_prev": (bool, False),
+        "prev_prod": (np.int64, 0),
+        "prev_day": (np.int64, 0),
+        "low_eff": (np.int32, 0),          # 連續低效率的 RUN tick 數
+        "zero_out": (np.int32, 0),         # 連續 RUN 無產出的 tick 數
+        "error_since": (float, np.nan),    # 這次 ERROR 的起點（epoch 秒；不在 ERROR 為 NaN）
+        "mttr_fired": (bool, False),
+        "short": (float, 0.0),             # 每 tick 產量的 EWMA（短 / 長）
+        "long": (float, 0.0),
+        "samples": (np.int32, 0),
+        "drift_fired": (bool, False),
+    }
+
+    def __init__(self):
+        self.ids = []
+        self.pos = {}
+        for f, (dtype, fill) in self.FIELDS.items():
+            setattr(self, f, np.full(0, fill, dtype=dtype))
+
+    def _index(self, eids):
+        """eids 對應的陣列位置；新設備附加在最後（刪除的設備留著，狀態很小）"""
+        if eids == self.ids:
+            return slice(None)
+        new = [eid for eid in dict.fromkeys(eids) if eid not in self.pos]
+        if new:
+            for eid in new:
+                self.pos[eid] = len(self.ids)
+                self.ids.append(eid)
+            for f, (dtype, fill) in self.FIELDS.items():
+                setattr(self, f, np.concatenate([getattr(self, f), np.full(len(new), fill, dtype=dtype)]))
+            if eids == self.ids:
+                return slice(None)
+        return np.fromiter(map(self.pos.__getitem__, eids), np.intp, len(eids))
+
+    def snapshot(self):
+        """目前狀態的複本：寫入失敗時用 restore 還原，重送同一批 tick 不會重複計數"""
+        return list(self.ids), dict(self.pos), {f: getattr(self, f).copy() for f in self.FIELDS}
+
+    def restore(self, state):
+        ids, pos, arrays = state
+        self.ids, self.pos = ids, pos
+        for f, values in arrays.items():
+            setattr(self, f, values)
+
+    def seed(self, open_errors, now: dt.datetime = None):
+        """
+        重啟後接續進行中的 ERROR（{equipment_id: start_ts}，來自 error_windows），維修超時才算得準；
+        到 now 已經超時的視為已經告警過（重啟前就觸發了），不再重複觸發
+        """
+        now = now or dt.datetime.utcnow()
+        idx = self._index(list(open_errors))
+        since = np.array([(ts - EPOCH).total_seconds() for ts in open_errors.values()], dtype=float)
+        self.error_since[idx] = since
+        self.mttr_fired[idx] = (now - EPOCH).total_seconds() - since > MTTR_BUDGET_SEC
+
+    def evaluate(self, rows):
+        """
+        rows: 一個 tick 的 [{"equipment_id", "ts", "status", "production", "efficiency"}]（同一個 ts）
+        回傳這個 tick 觸發的告警 [{"equipment_id", "rule", "ts", "value", "threshold"}]
+        """
+        if not rows:
+            return []
+        n = len(rows)
+        ts = rows[0]["ts"]
+        now_s = (ts - EPOCH).total_seconds()
+        i = self._index([r["equipment_id"] for r in rows])
+        status = np.fromiter((_STATUS.get(r["status"], IDLE) for r in rows), np.int8, n)
+        prod = np.fromiter((r["production"] for r in rows), np.int64, n)
+        eff = np.fromiter((r["efficiency"] for r in rows), float, n)
+
+        # 每 tick 產量 = 累積值的差（累積值每個 UTC 日歸零）
+        day = ts.toordinal()
+        valid = self.have_prev[i] & (self.prev_day[i] == day)
+        delta = np.maximum(prod - self.prev_prod[i], 0)
+        self.have_prev[i] = True
+        self.prev_prod[i] = prod
+        self.prev_day[i] = day
+        run, err = status == RUN, status == ERROR
+
+        # LOW_EFFICIENCY / ZERO_OUTPUT：連續計數，剛好到門檻那一個 tick 觸發
+        # LOW_EFFICIENCY 只看 RUN 的 tick：非 RUN 時計數維持不變
+        low_eff = np.where(run, np.where(eff < LOW_EFF_THRESHOLD, self.low_eff[i] + 1, 0), self.low_eff[i])
+        self.low_eff[i] = low_eff
+        zero_out = np.where(run & valid & (delta == 0), self.zero_out[i] + 1, 0)
+        self.zero_out[i] = zero_out
+
+        # MTTR_EXCEEDED：記下進入 ERROR 的時間，超過預算觸發一次
+        since = self.error_since[i]
+        since = np.where(err, np.where(np.isnan(since), now_s, since), np.nan)
+        self.error_since[i] = since
+        repair = np.where(err, now_s - since, 0.0)
+        mttr = err & (repair > MTTR_BUDGET_SEC) & ~self.mttr_fired[i]
+        self.mttr_fired[i] = err & (self.mttr_fired[i] | mttr)
+
+        # RATE_DRIFT：只用 RUN 且有前一筆的 tick 更新均值
+        upd = run & valid
+        first = upd & (self.samples[i] == 0)
+        short, long_ = self.short[i], self.long[i]
+        short = np.where(first, delta, np.where(upd, short + (delta - short) * (2 / (DRIFT_SHORT_TICKS + 1)), short))
+        long_ = np.where(first, delta, np.where(upd, long_ + (delta - long_) * (2 / (DRIFT_LONG_TICKS + 1)), long_))
+        samples = self.samples[i] + upd
+        self.short[i], self.long[i], self.samples[i] = short, long_, samples
+        ready = upd & (samples >= DRIFT_MIN_SAMPLES) & (long_ > 0)
+        drift = np.zeros(n)
+        if ready.any():
+            ratio = np.divide(short, long_, out=np.ones(n), where=long_ > 0)
+            drift = ratio / max(float(np.median(ratio[ready])), 1e-9) - 1
+            drift[~ready] = 0.0
+        fired_drift = ready & (np.abs(drift) > DRIFT_RATIO) & ~self.drift_fired[i]
+        # 只有可比較的 tick（ready）能解除：IDLE / ERROR / 樣本不足時 drift 為 0，不代表已回到正常
+        self.drift_fired[i] = np.where(ready & (np.abs(drift) < DRIFT_RATIO / 2), False,
+                                       self.drift_fired[i] | fired_drift)
+
+        out = []
+        for rule, mask, value, threshold in (
+            ("LOW_EFFICIENCY", run & (low_eff == LOW_EFF_TICKS), eff, LOW_EFF_THRESHOLD),
+            ("ZERO_OUTPUT", zero_out == ZERO_OUTPUT_TICKS, delta, 0),
+            ("MTTR_EXCEEDED", mttr, repair, MTTR_BUDGET_SEC),
+            ("RATE_DRIFT", fired_drift, drift, DRIFT_RATIO),
+        ):
+            for k in np.flatnonzero(mask).tolist():   # 觸發的很少，逐筆組即可
+                out.append({"equipment_id": rows[k]["equipment_id"], "rule": rule, "ts": ts,
+                            "value": round(float(value[k]), 4), "threshold": threshold})
+        return out
+
+
+ENGINE = AlertEngine()
+
+
+def record(db: Session, fired):
+    """寫入端呼叫（不 commit，跟原始資料同一個 transaction）"""
+    if fired:
+        db.execute(Alert.__table__.insert(), fired)
+
+
+def query_alerts(db: Session, since: dt.datetime, limit: int = None):
+    """since 之後觸發的規則告警（新到舊），格式同 events.query_events（type 為規則名稱）"""
+    q = (
+        db.query(Alert.equipment_id, Alert.rule, Alert.ts, Alert.value, Alert.threshold)
+        .filter(Alert.ts >= since)
+        .order_by(Alert.ts.desc(), Alert.id.desc())
+    )
+    if limit:
+        q = q.limit(limit)
+    return [to_event(eid, rule, ts, value, threshold) for eid, rule, ts, value, threshold in q.all()]
+
+
+def to_event(eid, rule, ts, value, threshold):
+    return {"equipment_id": eid, "type": rule, "ts": ts.isoformat(), "value": value, "threshold": threshold}
@@ -1,29 +1,122 @@
 from fastapi import FastAPI, Depends, Request, HTTPException, Query
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse, JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import datetime as dt
-from collections import defaultdict
-
-from database import Base, engine, get_db
-from models import EquipmentMetric, Equipment
-
-app = FastAPI(title="雲端智慧工廠監控平台")
-Base.metadata.create_all(bind=engine)
-
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+from database import get_db, get_read_db, get_async_read_db, run_read, ReadSessionLocal
+from models import Equipment
+from simulator import TICK_SECONDS, epoch_seconds
+import rollup
+import state_cache
+import live_stream
+import events
+import alerts
+import migrations
+import response_cache
+import columnar
+import instrumentation
+import ingest
+import export
+import storage
+import bus
+
+# ---------- 啟動 / 關閉 ----------
+# 遷移在開始接請求前跑完（之後的查詢都需要最新 schema）；匯流排連線與快取重建放到背景，
+# worker 一啟動就能回 /api/health，/api/ready 等快取暖好、資料夠新才回 200。
+# 快取暖好前進來的請求等同一次重建（data_version），不會各自重建
+READY_MAX_LAG_SECONDS = float(os.environ.get("READY_MAX_LAG_SECONDS", 6 * TICK_SECONDS))  # 0 = 不檢查資料新鮮度
+READY_DB_TIMEOUT = 2.0
+
+_startup_ms = {}        # 各啟動階段的耗時（/api/ready 也會回報）
+_warmup = None          # 背景的匯流排連線 + 快取重建
+
+async def warm_up():
+    t0 = time.perf_counter()
+    bus.subscribe(bus.TICKS, on_ingested)
+    bus.subscribe(bus.FLEET, on_fleet_changed)
+    bus.subscribe(bus.ALERTS, on_alerts)
+    await bus.start(on_resync)
+    t1 = time.perf_counter()
+    try:
+        await state_cache.resync_async(run_read)   # 重建期間收到的 tick 會在重建完補上
+    except Exception as e:   # 例如 DB 暫時被鎖：之後第一個請求會再重建，/api/ready 在那之前回 503
+        print(f"[startup] 快取重建失敗：{e!r}")
+    t2 = time.perf_counter()
+    _startup_ms.update(bus=round((t1 - t0) * 1000, 1), cache=round((t2 - t1) * 1000, 1))
+    print(f"[startup] worker {os.getpid()}：匯流排 {_startup_ms['bus']:.0f} ms、快取 {_startup_ms['cache']:.0f} ms")
+    if ingest.ENABLED:   # 行程內模擬器（SIMULATOR_INPROCESS=1）
+        await ingest.start()
+
+async def warmed():
+    """背景的快取重建還沒完成就等它（不另外重建）"""
+    if _warmup is not None and not _warmup.done():
+        await asyncio.shield(_warmup)
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    global _warmup
+    t0 = time.perf_counter()
+    await asyncio.to_thread(migrations.migrate, TICK_SECONDS)   # 建表 / 補索引 / 一次性資料回填（依 schema 版本只跑一次）
+    _startup_ms["migrate"] = round((time.perf_counter() - t0) * 1000, 1)
+    print(f"[startup] worker {os.getpid()}：遷移 {_startup_ms['migrate']:.0f} ms")
+    _warmup = asyncio.create_task(warm_up())
+    try:
+        yield
+    finally:
+        _warmup.cancel()
+        await asyncio.gather(_warmup, return_exceptions=True)
+        await ingest.stop()
+        await bus.stop()
+
+app = FastAPI(title="雲端智慧工廠監控平台", lifespan=lifespan)
+# 大於 1 KB 的回應用 gzip（SSE 與已壓縮過的快取回應會自動略過）
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+
+def on_ingested(data):
+    """寫入端（行程內模擬器或 simulator.py）commit 後：直接更新快取、叫醒即時推播，不必等輪詢 DB"""
+    state_cache.apply_ticks(bus.decode_ticks(data))
+    live_stream.notify()
+
+def on_alerts(data):
+    """寫入端觸發的規則告警：跟下一則即時推播一起送出；沒有人連著即時推播就不累積（之後由 /api/alerts 讀取）"""
+    if not live_stream.SUBSCRIBERS:
+        _stream_alerts.clear()
+        return
+    _stream_alerts.extend(data)
+    live_stream.notify()
+
+def on_fleet_changed(_data):
+    """任一個 worker 改了設備清單"""
+    state_cache.invalidate_fleet()
+    live_stream.notify()
+
+def on_resync():
+    """匯流排可能漏掉了 tick（斷線太久、中繼重啟）：從 DB 重建快取"""
+    async def resync():
+        await state_cache.resync_async(run_read)
+        live_stream.notify()
+    asyncio.get_running_loop().create_task(resync())
+
+# 每個請求的延遲、SQL 筆數 / DB 時間（Server-Timing 標頭 + /api/debug/metrics）
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    return await instrumentation.track(request, call_next)
 
-# 關掉 /static 快取，確保每次取到最新 JS/CSS
+# /static 每次都向伺服器驗證（ETag / Last-Modified），檔案沒改就回 304，改了馬上生效
 @app.middleware("http")
-async def no_cache_static(request: Request, call_next):
+async def revalidate_static(request: Request, call_next):
     response = await call_next(request)
     if request.url.path.startswith("/static/"):
-        response.headers["Cache-Control"] = "no-store, max-age=0"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
+        response.headers["Cache-Control"] = "no-cache"
     return response
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -34,32 +127,94 @@ def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 # ---------- 健康檢查 ----------
+# liveness：行程活著就回 200，不碰 DB
 @app.get("/api/health")
 def health():
-    return {"ok": True}
+    return {"ok": True, "worker": os.getpid()}
+
+def db_status(db: Session):
+    """DB 連得上（讀 schema 版本）+ 最新一筆原始資料的 ts"""
+    return migrations.current_version(db), storage.newest_ts(db)
 
-# 最近告警（預設 12 小時內）
+# readiness：DB 連得上、schema 已遷移到 LATEST_VERSION、快取暖好、最新資料不超過 READY_MAX_LAG_SECONDS 才回 200，否則 503
+@app.get("/api/ready")
+async def ready():
+    now = dt.datetime.utcnow()
+    t0 = time.perf_counter()
+    db_ok, error, schema, last_ts = True, None, None, None
+    try:
+        schema, last_ts = await asyncio.wait_for(run_read(db_status), READY_DB_TIMEOUT)
+    except Exception as e:
+        db_ok, error = False, repr(e)
+    db_ms = round((time.perf_counter() - t0) * 1000, 1)
+    lag = round((now - last_ts).total_seconds(), 1) if last_ts is not None else None
+    fresh = READY_MAX_LAG_SECONDS <= 0 or (lag is not None and lag <= READY_MAX_LAG_SECONDS)
+    cache_ts = state_cache.cursor_ts()
+    schema_ok = schema is not None and schema >= migrations.LATEST_VERSION
+    ok = db_ok and schema_ok and state_cache.is_warm() and fresh
+    body = {
+        "ready": ok,
+        "worker": os.getpid(),
+        "db": {"ok": db_ok, "ms": db_ms, **({"error": error} if error else {})},
+        "schema": {"ok": schema_ok, "version": schema, "latest": migrations.LATEST_VERSION},
+        "cache": {"warm": state_cache.is_warm(), "version": state_cache.version(),
+                  "lagSeconds": round((now - cache_ts).total_seconds(), 1) if cache_ts is not None else None},
+        "ingest": {"lastTs": last_ts.isoformat() if last_ts is not None else None,
+                   "lagSeconds": lag, "maxLagSeconds": READY_MAX_LAG_SECONDS},
+        "startupMs": _startup_ms,
+    }
+    return JSONResponse(body, status_code=200 if ok else 503)
+
+# ---------- 效能指標（Prometheus 文字格式） ----------
+@app.get("/api/debug/metrics", response_class=PlainTextResponse)
+def debug_metrics():
+    return PlainTextResponse(instrumentation.render(), media_type="text/plain; version=0.0.4")
+
+# ---------- 回應快取：資料版本沒變就回上次的結果（ETag / 304） ----------
+REFRESH_INTERVAL = 0.5                         # 多個請求之間最多隔這麼久才去 DB 看有沒有新資料
+BUS_REFRESH_INTERVAL = 30.0                    # 匯流排有在送 tick 時，查 DB 只是保險
+response_cache.MAX_AGE_SECONDS = TICK_SECONDS  # 沒有新資料時，時間視窗類的結果最多沿用一個 tick
+
+async def data_version() -> int:
+    """先讀入新資料，回傳目前的資料版本（模擬器每寫一個 tick 就會變）"""
+    await warmed()
+    interval = BUS_REFRESH_INTERVAL if bus.live() else REFRESH_INTERVAL
+    await state_cache.refresh_async(run_read, min_interval=interval)
+    return state_cache.version()
+
+# 最近告警（預設 12 小時內）：ERROR 進出事件 + 規則告警，依時間新到舊合併
 @app.get("/api/alerts")
-def api_alerts(hours: int = Query(12, ge=1, le=168), db: Session = Depends(get_db)):
-    since = dt.datetime.utcnow() - dt.timedelta(hours=hours)
-    events, _ = build_error_events_and_windows(db, since)
-    return {"events": events[:20]}  # 只回前 20 筆最新
+async def api_alerts(request: Request, hours: int = Query(12, ge=1, le=168)):
+    async def compute():
+        since = dt.datetime.utcnow() - dt.timedelta(hours=hours)
+        status_events, rule_alerts = await asyncio.gather(
+            run_read(events.query_events, since, limit=20),
+            run_read(alerts.query_alerts, since, limit=20),
+        )
+        merged = sorted(status_events + rule_alerts, key=lambda x: x["ts"], reverse=True)
+        return {"events": merged[:20]}  # 只回前 20 筆最新
+    return await response_cache.cached(request, await data_version(), compute)
 
 # 維修紀錄（預設 24 小時內）
 @app.get("/api/maintenance")
-def api_maintenance(hours: int = Query(24, ge=1, le=168), db: Session = Depends(get_db)):
-    since = dt.datetime.utcnow() - dt.timedelta(hours=hours)
-    _, windows = build_error_events_and_windows(db, since)
-    return {"records": windows}
+async def api_maintenance(request: Request, hours: int = Query(24, ge=1, le=168),
+                          db: AsyncSession = Depends(get_async_read_db)):
+    async def compute():
+        since = dt.datetime.utcnow() - dt.timedelta(hours=hours)
+        return {"records": await db.run_sync(events.query_windows, since)}
+    return await response_cache.cached(request, await data_version(), compute)
 
 
 # ========== 內部小工具 ==========
-#設台灣當地時間更新當日產量數據
-def taipei_midnight_utc_naive() -> dt.datetime:
-    """回傳『台灣當地今日 00:00』換算成 UTC 的 naive datetime"""
-    tz_taipei = dt.timezone(dt.timedelta(hours=8))
-    today_local = dt.datetime.now(tz_taipei).replace(hour=0, minute=0, second=0, microsecond=0)
-    return today_local.astimezone(dt.timezone.utc).replace(tzinfo=None)
+def parse_utc(value: str, name: str) -> dt.datetime:
+    """查詢參數的 ISO 時間 → 不帶時區的 UTC（DB 的儲存方式）；帶時區的會先換算成 UTC"""
+    try:
+        ts = dt.datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} 格式錯誤")
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return ts
 
 def build_series(rows):
     """
@@ -80,229 +235,135 @@ def build_series(rows):
     items_by_equipment = [{"equipment_id": eid, "points": pts} for eid, pts in per_eqp.items()]
     return items_total, items_by_equipment
 
-def fetch_recent_ticks(db: Session, ticks: int = 120, eqp_guess: int = 8):
-    """
-    取最近 N 個 tick（不看時間）。每個 tick 會有『設備數量』筆資料，
-    所以先抓 ticks*eqp_guess，再在程式內排序＆組裝。
+def fetch_recent_rows(db: Session, ticks: int = 120):
     """
-    limit_rows = ticks * eqp_guess
-    raw = (
-        db.query(
-            EquipmentMetric.equipment_id,
-            EquipmentMetric.ts,
-            EquipmentMetric.production
-        )
-        .order_by(desc(EquipmentMetric.ts))
-        .limit(limit_rows)
-        .all()
-    )
-    rows = list(reversed(raw))  # 升冪
-    return build_series(rows)
-
-def build_error_events_and_windows(db: Session, since: dt.datetime):
-    """
-    從 EquipmentMetric(ts,status) 偵測：
-      - 事件：ERROR_START / ERROR_END
-      - 維修區段：start_ts, end_ts, duration_sec
-    僅掃描 since 之後資料；若 since 之前已在 ERROR，中斷點以 since 為近似 start。
+    取最近 N 個 tick（不看時間），回傳升冪的 [(equipment_id, ts, production)]，由 build_series 組裝。
+    同一個 tick 的所有設備共用一個 ts：先由新到舊取 N 個不重複的 ts，
+    再從第 N 個 ts 起做範圍掃描 → 讀取量 ~ N × 實際設備數，不必猜設備數
     """
-    # since 前最後狀態（判斷是否已在 ERROR）
-    subq_prev = (
-        db.query(
-            EquipmentMetric.equipment_id,
-            func.max(EquipmentMetric.ts).label("ts")
-        )
-        .filter(EquipmentMetric.ts < since)
-        .group_by(EquipmentMetric.equipment_id)
-        .subquery()
-    )
-    prev_rows = (
-        db.query(EquipmentMetric.equipment_id, EquipmentMetric.status)
-        .join(subq_prev,
-              and_(EquipmentMetric.equipment_id == subq_prev.c.equipment_id,
-                   EquipmentMetric.ts == subq_prev.c.ts))
-        .all()
-    )
-    prev_status = {eid: st for eid, st in prev_rows}
-
-    # since 之後的序列
-    rows = (
-        db.query(EquipmentMetric.equipment_id, EquipmentMetric.ts, EquipmentMetric.status)
-        .filter(EquipmentMetric.ts >= since)
-        .order_by(EquipmentMetric.equipment_id.asc(), EquipmentMetric.ts.asc())
-        .all()
-    )
-
-    events = []   # [{equipment_id, type, ts}]
-    windows = []  # [{equipment_id, start_ts, end_ts, duration_sec, ongoing}]
-    now = dt.datetime.utcnow()
-    curr_err_start = {}  # eid -> start_ts
-    last_seen_status = prev_status.copy()
-
-    # 若 since 時已在 ERROR，視為自 since 開始
-    for eid, st in prev_status.items():
-        if st == "ERROR":
-            curr_err_start[eid] = since
-
-    # 掃描狀態變化
-    for eid, ts, st in rows:
-        prev = last_seen_status.get(eid)
-        if prev != "ERROR" and st == "ERROR":
-            curr_err_start[eid] = ts
-            events.append({"equipment_id": eid, "type": "ERROR_START", "ts": ts.isoformat()})
-        elif prev == "ERROR" and st != "ERROR":
-            if eid in curr_err_start:
-                start = curr_err_start[eid]
-                end = ts
-                duration = int((end - start).total_seconds())
-                windows.append({
-                    "equipment_id": eid,
-                    "start_ts": start.isoformat(),
-                    "end_ts": end.isoformat(),
-                    "duration_sec": duration,
-                    "ongoing": False
-                })
-                del curr_err_start[eid]
-            events.append({"equipment_id": eid, "type": "ERROR_END", "ts": ts.isoformat()})
-        last_seen_status[eid] = st
-
-    # 還在 ERROR 中 → 進行中
-    for eid, start in curr_err_start.items():
-        duration = int((now - start).total_seconds())
-        windows.append({
-            "equipment_id": eid,
-            "start_ts": start.isoformat(),
-            "end_ts": None,
-            "duration_sec": duration,
-            "ongoing": True
-        })
-
-    events.sort(key=lambda x: x["ts"], reverse=True)
-    windows.sort(key=lambda x: x["start_ts"], reverse=True)
-    return events, windows
+    stamps = storage.recent_stamps(db, ticks)
+    if not stamps:
+        return []
+    return storage.production_since(db, stamps[-1])
 
+def fetch_rows_after(db: Session, after: dt.datetime, limit: int):
+    """after 之後（不含）的原始資料（升冪），最多 limit 筆"""
+    return storage.production_after(db, after, limit)
 
 # ---------- KPI 摘要（台灣午夜起算 + 加總全部設備；無資料時做友善回退） ----------
 @app.get("/api/summary")
-def get_summary(db: Session = Depends(get_db)):
+async def get_summary(request: Request):
     """
-    當日產量（台灣 0:00 起算、即時更新）：
-    若尚未跨 UTC 午夜：    daily = latest_>=S - last_<S
-    若已跨過 UTC 午夜：    daily = (last_<U - last_<S) + latest_>=U
-      其中 S 為台灣 0:00（轉 UTC），U 為「今天的 UTC 午夜」。
+    當日產量（台灣 0:00 起算、即時更新）由 state_cache 增量維護：
+    每次只讀入上次之後新增的 metrics，再以 O(設備數) 加總，
+    跨台灣/UTC 午夜的處理見 state_cache._rebuild / apply_row。
     """
-    S = taipei_midnight_utc_naive()           # 台灣 0:00 -> UTC naive
-    now_utc = dt.datetime.utcnow()
-    U = dt.datetime(now_utc.year, now_utc.month, now_utc.day)  # 今天 UTC 午夜（naive）
-
-    # ---- 取設備清單（沒有資料的設備也要計入 0）----
-    eq_ids = [e.equipment_id for e in db.query(Equipment).all()]
-
-    # ---- 共同子查詢工具：取某一「區間的邊界點」----
-    def last_before(ts_cut):
-        """回傳 {eid: production_at_last_ts_before_cut}"""
-        subq = (
-            db.query(
-                EquipmentMetric.equipment_id,
-                func.max(EquipmentMetric.ts).label("ts")
-            )
-            .filter(EquipmentMetric.ts < ts_cut)
-            .group_by(EquipmentMetric.equipment_id)
-            .subquery()
-        )
-        rows = (
-            db.query(EquipmentMetric.equipment_id, EquipmentMetric.production)
-            .join(
-                subq,
-                and_(
-                    EquipmentMetric.equipment_id == subq.c.equipment_id,
-                    EquipmentMetric.ts == subq.c.ts,
-                ),
-            )
-            .all()
-        )
-        return {eid: int(prod) for eid, prod in rows}
-
-    def latest_after(ts_cut):
-        """回傳 {eid: production_at_latest_ts_after_or_equal_cut}"""
-        subq = (
-            db.query(
-                EquipmentMetric.equipment_id,
-                func.max(EquipmentMetric.ts).label("ts")
-            )
-            .filter(EquipmentMetric.ts >= ts_cut)
-            .group_by(EquipmentMetric.equipment_id)
-            .subquery()
-        )
-        rows = (
-            db.query(EquipmentMetric.equipment_id, EquipmentMetric.production)
-            .join(
-                subq,
-                and_(
-                    EquipmentMetric.equipment_id == subq.c.equipment_id,
-                    EquipmentMetric.ts == subq.c.ts,
-                ),
-            )
-            .all()
-        )
-        return {eid: int(prod) for eid, prod in rows}
-
-    # ---- 取各邊界值 ----
-    before_S = last_before(S)          # 台灣日開始前的基準
-    latest_ge_S = latest_after(S)      # 台灣日開始後目前最新
-
-    crossed_utc_midnight = now_utc >= U  # 是否已跨過 UTC 午夜
-
-    if not crossed_utc_midnight:
-        # 未跨 UTC 午夜：同一個 UTC 天內，直接差值
-        daily_total = 0
-        for eid in eq_ids:
-            curr = latest_ge_S.get(eid, None)
-            base = before_S.get(eid, 0)
-            inc = max(0, (curr - base)) if curr is not None else 0
-            daily_total += inc
-    else:
-        # 已跨 UTC 午夜：分兩段累加
-        before_U = last_before(U)      # UTC 午夜前最後一筆
-        latest_ge_U = latest_after(U)  # UTC 午夜後目前最新（已從 0 累積）
-
-        partA = 0  # S~U 之間的增量 = last_<U - last_<S
-        partB = 0  # U~now 的增量 = latest_>=U （因為 UTC 日重置為 0）
-        for eid in eq_ids:
-            a = max(0, before_U.get(eid, 0) - before_S.get(eid, 0))
-            b = max(0, latest_ge_U.get(eid, 0))
-            partA += a
-            partB += b
-        daily_total = partA + partB
-
-    # 其它 KPI：沿用最新一筆
-    latest = db.query(EquipmentMetric).order_by(desc(EquipmentMetric.ts)).first()
+    async def compute():
+        return state_cache.summary()
+    return await response_cache.cached(request, await data_version(), compute)
+
+# ---------- 即時推播（SSE）：取代前端 summary/metrics/alerts/設備的輪詢 ----------
+_stream_cursor = None  # 已推播到的 state_cache 流水號
+STREAM_ALERTS_MAX = 200  # 還沒推播的規則告警最多留幾則（推播卡住時丟最舊的）
+_stream_alerts = deque(maxlen=STREAM_ALERTS_MAX)   # 匯流排送來、還沒推播的規則告警
+
+def compute_stream_tick():
+    """
+    由 live_stream 的背景 task 呼叫（全行程只有一個）：讀新資料、算一次增量。
+    回傳 {summary, items_total, items_by_equipment, events, equipment}；沒新資料回 None
+    """
+    global _stream_cursor
+    if not bus.live() or state_cache.stale_fleet():   # 匯流排有在送 tick 時快取已是最新
+        db = ReadSessionLocal()
+        try:
+            state_cache.refresh(db)
+        finally:
+            db.close()
+    if _stream_cursor is None:
+        _stream_cursor = state_cache.cursor()
+        return None
+    rows, complete, _stream_cursor = state_cache.rows_since(_stream_cursor)
+    rule_alerts = [_stream_alerts.popleft() for _ in range(len(_stream_alerts))]   # 另一個執行緒可能同時 append
+    if not rows and complete and not rule_alerts:
+        return None
+
+    new_events = rule_alerts
+    for _, eid, ts, st, _, _, prev in rows:
+        if prev != "ERROR" and st == "ERROR":
+            new_events.append({"equipment_id": eid, "type": "ERROR_START", "ts": ts.isoformat()})
+        elif prev == "ERROR" and st != "ERROR":
+            new_events.append({"equipment_id": eid, "type": "ERROR_END", "ts": ts.isoformat()})
+    new_events.sort(key=lambda x: x["ts"], reverse=True)
 
+    items_total, items_by_equipment = build_series([(eid, ts, prod) for _, eid, ts, _, prod, _, _ in rows])
+    latest_by_eqp = {eid: (st, prod, eff) for _, eid, _, st, prod, eff, _ in rows}
     return {
-        "dailyProduction": int(daily_total),
-        "efficiency": round(latest.efficiency, 2) if latest else 0,
-        "status": latest.status if latest else "N/A",
-        "activeEquipment": 1 if latest and latest.status == "RUN" else 0,
-        "totalEquipment": db.query(Equipment).count(),
-        "updatedAt": dt.datetime.utcnow().isoformat(),
+        "summary": state_cache.summary(),
+        "items_total": items_total,
+        "items_by_equipment": items_by_equipment,
+        "events": new_events,
+        "equipment": [{"equipment_id": eid, "status": st, "production": prod, "efficiency": round(eff, 2)}
+                      for eid, (st, prod, eff) in latest_by_eqp.items()],
+        "resync": not complete,
     }
 
+@app.get("/api/stream")
+async def stream(request: Request):
+    """text/event-stream：連上先送一次 summary，之後每個模擬 tick 推一則增量"""
+    q = live_stream.subscribe()
+    live_stream.ensure_pump(compute_stream_tick)
+
+    async def gen():
+        try:
+            await warmed()
+            await state_cache.refresh_async(run_read)
+            yield live_stream.format_sse({"summary": state_cache.summary()})
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(q.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            live_stream.unsubscribe(q)
+
+    return StreamingResponse(gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # ---------- 產量趨勢（總量 + 各機；realtime 忽略時間；其他範圍查不到則回退） ----------
+REALTIME_TICKS = 60     # realtime 範圍的 tick 數（約 5 分鐘）
+METRICS_FORMATS = ("json", "columnar", "binary")
+
 @app.get("/api/metrics")
-def get_metrics(
+async def get_metrics(
+    request: Request,
     range: str = Query("realtime", description="範圍: realtime, 5m, 1h, 1d, 1mo"),
-    db: Session = Depends(get_db)
+    format: str = Query("json", description="json（預設）、columnar（共用時間軸的陣列）、binary（TypedArray 用）"),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    now = dt.datetime.utcnow()
-
-    # ✅ realtime：取最近 60 筆（約 5 分鐘，TICK=5s）
+    if format not in METRICS_FORMATS:   # 不認得的格式不要默默回 JSON、另佔一個快取項目
+        raise HTTPException(status_code=400, detail="format 只能是 json、columnar 或 binary")
+
+    async def compute():
+        now = dt.datetime.utcnow()
+        rows, resolution = await fetch_metric_rows(range, now, db)
+        # 組序列是純 CPU，丟到 thread 以免卡住 event loop
+        if format == "columnar":
+            return await asyncio.to_thread(columnar.to_json, rows, resolution, int(epoch_seconds(now)))
+        if format == "binary":
+            return await asyncio.to_thread(columnar.to_binary, rows, resolution, int(epoch_seconds(now)))
+        return await asyncio.to_thread(series_payload, rows, resolution, now)
+
+    media_type = columnar.BINARY_MEDIA_TYPE if format == "binary" else "application/json"
+    return await response_cache.cached(request, await data_version(), compute, media_type=media_type)
+
+async def fetch_metric_rows(range: str, now: dt.datetime, db: AsyncSession):
+    """回傳 ([(equipment_id, ts, production)] 升冪, resolution)；realtime 的 resolution 為 None"""
+    # ✅ realtime：取最近 60 筆（約 5 分鐘，TICK=5s）；state_cache 最近套用的資料夠用就不查 DB
     if range == "realtime":
-        items_total, items_by_equipment = fetch_recent_ticks(db, ticks=60, eqp_guess=12)
-        if not items_total:
-            return {"items": [{"ts": now.isoformat(), "production": 0}],
-                    "items_total": [{"ts": now.isoformat(), "production": 0}],
-                    "items_by_equipment": []}
-        return {"items": items_total, "items_total": items_total, "items_by_equipment": items_by_equipment}
+        rows = state_cache.recent_ticks(REALTIME_TICKS)
+        if rows is None:
+            rows = await db.run_sync(fetch_recent_rows, ticks=REALTIME_TICKS)
+        return rows, None
 
     # 其他時間窗：用 since 過濾；若為空則回退到最近 N 個 tick
     if range == "5m":
@@ -316,39 +377,132 @@ def get_metrics(
     else:
         since = now - dt.timedelta(minutes=5)
 
-    filtered = (
-        db.query(
-            EquipmentMetric.equipment_id,
-            EquipmentMetric.ts,
-            EquipmentMetric.production
-        )
-        .filter(EquipmentMetric.ts >= since)
-        .order_by(EquipmentMetric.ts.asc())
-        .all()
-    )
-    if filtered:
-        items_total, items_by_equipment = build_series(filtered)
-    else:
-        # 回退
-        items_total, items_by_equipment = fetch_recent_ticks(db, ticks=120, eqp_guess=12)
+    # 長區間改讀彙總表（1m/15m/1h），讓每條序列最多約 MAX_POINTS_PER_SERIES 個點
+    tier = rollup.pick_tier((now - since).total_seconds(), TICK_SECONDS)
+    filtered = await db.run_sync(rollup.query_series, tier, since) if tier else []
+    resolution = tier[0] if filtered else "raw"
 
+    # 彙總表沒資料（例如舊資料尚未重建）→ 讀原始資料
+    if not filtered:
+        filtered = await db.run_sync(storage.production_since, since)
+    if not filtered:
+        # 回退
+        filtered = await db.run_sync(fetch_recent_rows, ticks=120)
+    return filtered, resolution
+
+@app.get("/api/metrics/since")
+async def get_metrics_since(
+    request: Request,
+    cursor: str = Query(..., description="上次拿到的最後一個 ts（ISO 格式，即 items_total 最後一點的 ts）"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    realtime 圖表的增量：只回 cursor 之後的新 tick 與新的 cursor，成本 ~ O(新資料筆數)。
+    落後超過一個 realtime 視窗就回 resync=True，由前端改抓整段 /api/metrics?range=realtime
+    """
+    after = parse_utc(cursor, "cursor")
+
+    async def compute():
+        limit = REALTIME_TICKS * max(len(state_cache.FLEET), 1)
+        rows = state_cache.recent_after(after)
+        if rows is None:
+            rows = await db.run_sync(fetch_rows_after, after, limit + 1)
+        if len(rows) > limit:
+            return {"items_total": [], "items_by_equipment": [], "cursor": cursor, "resync": True}
+        items_total, items_by_equipment = await asyncio.to_thread(build_series, rows)
+        return {"items_total": items_total, "items_by_equipment": items_by_equipment,
+                "cursor": items_total[-1]["ts"] if items_total else cursor, "resync": False}
+    return await response_cache.cached(request, await data_version(), compute)
+
+def series_payload(rows, resolution, now: dt.datetime):
+    """預設（json）格式：每個點一個 {ts, production}"""
+    items_total, items_by_equipment = build_series(rows)
     if not items_total:
         return {"items": [{"ts": now.isoformat(), "production": 0}],
                 "items_total": [{"ts": now.isoformat(), "production": 0}],
                 "items_by_equipment": []}
+    payload = {"items": items_total, "items_total": items_total, "items_by_equipment": items_by_equipment}
+    if resolution is not None:
+        payload["resolution"] = resolution
+    return payload
+
+# ---------- OEE / 狀態時間（全在 SQL 裡由彙總表加總） ----------
+def oee_entry(run_sec, idle_sec, error_sec, eff_sum, samples, production):
+    """可用率 = RUN 秒數 / 有資料的秒數；表現 = 平均效率；OEE = 可用率 × 表現（模擬器沒有良率資料）"""
+    total = run_sec + idle_sec + error_sec
+    availability = run_sec / total if total else None
+    performance = eff_sum / samples if samples else None
+    oee = availability * performance if availability is not None and performance is not None else None
+    return {
+        "run_sec": int(run_sec), "idle_sec": int(idle_sec), "error_sec": int(error_sec),
+        "availability": round(availability, 4) if availability is not None else None,
+        "performance": round(performance, 4) if performance is not None else None,
+        "oee": round(oee, 4) if oee is not None else None,
+        "production": int(production),
+    }
 
-    return {"items": items_total, "items_total": items_total, "items_by_equipment": items_by_equipment}
+@app.get("/api/oee")
+async def api_oee(
+    request: Request,
+    since: str = Query(None, alias="from", description="起點（ISO，UTC；預設 24 小時前）"),
+    until: str = Query(None, alias="to", description="終點（ISO，UTC；預設現在）"),
+    equipment: str = Query(None, description="只看某台設備"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """每台設備與全廠在區間內的 RUN/IDLE/ERROR 秒數、可用率、表現、OEE 與產量增量"""
+    now = dt.datetime.utcnow()
+    end = parse_utc(until, "to") if until else now
+    start = parse_utc(since, "from") if since else end - dt.timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="from 必須早於 to")
+
+    async def compute():
+        # 區間對齊到整分鐘（起點往前、終點往後取整），再由 rollup.split_window 拆成各粒度
+        start_b = rollup.bucket_start(start, 60)
+        end_b = rollup.bucket_start(end - dt.timedelta(microseconds=1), 60) + dt.timedelta(minutes=1)
+        rows = await db.run_sync(rollup.query_oee, start_b, end_b, equipment)
+
+        per_eqp = [dict(equipment_id=eid, **oee_entry(*vals)) for eid, *vals in rows]
+        fleet = oee_entry(*(sum(r[i] for r in rows) for i in range(1, 7)))
+        fleet["equipment"] = len(rows)
+        return {"from": start_b.isoformat(), "to": end_b.isoformat(), "fleet": fleet, "equipment": per_eqp}
+    return await response_cache.cached(request, await data_version(), compute)
+
+# ---------- 原始資料匯出（串流，記憶體用量與區間長短無關） ----------
+@app.get("/api/export")
+def api_export(
+    since: str = Query(None, alias="from", description="起點（ISO，UTC；預設 24 小時前）"),
+    until: str = Query(None, alias="to", description="終點（ISO，UTC；預設現在）"),
+    equipment: str = Query(None, description="只匯出某台設備"),
+    format: str = Query("csv", description="csv（預設）、ndjson、parquet（需安裝 pyarrow）"),
+):
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="format 只能是 csv、ndjson 或 parquet")
+    if not export.available(format):
+        raise HTTPException(status_code=501, detail="parquet 匯出需要安裝 pyarrow")
+    end = parse_utc(until, "to") if until else dt.datetime.utcnow()
+    start = parse_utc(since, "from") if since else end - dt.timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="from 必須早於 to")
+
+    filename = f"metrics_{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}.{format}"
+    return StreamingResponse(export.stream(format, start, end, equipment), media_type=export.FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 # ---------- 設備 CRUD ----------
 @app.get("/api/equipment")
-def get_equipment(db: Session = Depends(get_db)):
+def get_equipment(db: Session = Depends(get_read_db)):
     return db.query(Equipment).all()
 
 @app.post("/api/equipment")
 def add_equipment(equip: dict, db: Session = Depends(get_db)):
+    if db.query(Equipment.id).filter(Equipment.equipment_id == equip["equipment_id"]).first():
+        raise HTTPException(status_code=409, detail="設備 ID 已存在")
     new_e = Equipment(equipment_id=equip["equipment_id"])
     db.add(new_e)
     db.commit()
+    state_cache.invalidate_fleet()
+    bus.publish(bus.FLEET, None)   # 其他 worker
     db.refresh(new_e)
     return new_e
 
@@ -357,8 +511,12 @@ def update_equipment(equip_id: int, equip: dict, db: Session = Depends(get_db)):
     e = db.query(Equipment).filter(Equipment.id == equip_id).first()
     if not e:
         raise HTTPException(status_code=404, detail="設備不存在")
+    if db.query(Equipment.id).filter(Equipment.equipment_id == equip["equipment_id"], Equipment.id != equip_id).first():
+        raise HTTPException(status_code=409, detail="設備 ID 已存在")
     e.equipment_id = equip["equipment_id"]
     db.commit()
+    state_cache.invalidate_fleet()
+    bus.publish(bus.FLEET, None)   # 其他 worker
     db.refresh(e)
     return e
 
@@ -369,4 +527,6 @@ def delete_equipment(equip_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="設備不存在")
     db.delete(e)
     db.commit()
+    state_cache.invalidate_fleet()
+    bus.publish(bus.FLEET, None)   # 其他 worker
     return {"ok": True}
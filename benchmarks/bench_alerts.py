@@ -0,0 +1,172 @@
+# benchmarks/bench_alerts.py
+# alerts.AlertEngine（寫入端每個 tick 評估的規則告警）：
+#   - 情境檢查：人工組出每條規則的觸發條件，確認各觸發剛好一次、條件解除前不重複觸發；
+#     寫入端重啟後接續維修中的設備，已告警過的不重複觸發
+#   - 延遲：用 simulator.VectorEngine 產生 N 台設備的 tick，量 evaluate 每個 tick 的耗時（不含 DB）
+#   - 佔比：generate_batch（完整寫入一個 tick）有 / 沒有規則評估的耗時（逐 tick 交替，取中位數）
+# 用法：python benchmarks/bench_alerts.py --machines 1000 5000 --ticks 200
+import argparse
+import contextlib
+import datetime as dt
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TICK = dt.timedelta(seconds=5)
+
+
+def rows_for(t, specs):
+    """specs: {equipment_id: (status, production, efficiency)} → 一個 tick 的 rows"""
+    return [{"equipment_id": eid, "ts": t, "status": st, "production": prod, "efficiency": eff}
+            for eid, (st, prod, eff) in specs.items()]
+
+
+def scenario() -> int:
+    """
+    20 台設備正常運轉（每 tick +100、效率 0.9），其中：
+      LOW  第 10~19 tick 效率 0.4        → LOW_EFFICIENCY 一次
+      ZERO 第 10~19 tick RUN 但產量不動  → ZERO_OUTPUT 一次
+      ERR  第 10 tick 起 ERROR 15 分鐘   → MTTR_EXCEEDED 一次
+      SLOW 第 100 tick 起每 tick 只 +50  → RATE_DRIFT 一次（中間第 250~269 tick IDLE，回來仍偏離 → 不重複觸發）
+      IDLE 第 10~69 tick IDLE、效率 0.5  → 不觸發（IDLE 的效率本來就低）
+    """
+    import alerts
+
+    engine = alerts.AlertEngine()
+    t = dt.datetime(2024, 1, 1, 8)
+    prod = {f"M{i}": 0 for i in range(20)}
+    fired = []
+    for k in range(400):
+        specs = {}
+        for eid in prod:
+            status, eff, step = "RUN", 0.9, 100
+            if eid == "M1" and 10 <= k < 20:
+                eff = 0.4
+            if eid == "M2" and 10 <= k < 20:
+                step = 0
+            if eid == "M3" and 10 <= k < 190:
+                status, eff, step = "ERROR", 0.0, 0
+            if eid == "M4" and k >= 100:
+                step = 50
+            if eid == "M4" and 250 <= k < 270:
+                status, eff, step = "IDLE", 0.5, 0
+            if eid == "M5" and 10 <= k < 70:
+                status, eff, step = "IDLE", 0.5, 0
+            prod[eid] += step
+            specs[eid] = (status, prod[eid], eff)
+        fired += engine.evaluate(rows_for(t, specs))
+        t += TICK
+
+    got = sorted((a["rule"], a["equipment_id"]) for a in fired)
+    want = [("LOW_EFFICIENCY", "M1"), ("MTTR_EXCEEDED", "M3"), ("RATE_DRIFT", "M4"), ("ZERO_OUTPUT", "M2")]
+    ok = got == want
+    print("情境檢查：" + ("✅ 每條規則各觸發一次" if ok else f"❌ 觸發 {got}，預期 {want}"))
+    return 0 if ok else 1
+
+
+def restart_scenario() -> int:
+    """
+    寫入端重啟：從 error_windows 接續兩台維修中的設備
+      OLD 重啟前 15 分鐘就進入 ERROR（重啟前已告警過） → 不再觸發
+      NEW 重啟前 5 分鐘進入 ERROR                      → 再過 5 分鐘多觸發一次
+    """
+    import alerts
+
+    engine = alerts.AlertEngine()
+    t = dt.datetime(2024, 1, 1, 8)
+    engine.seed({"OLD": t - dt.timedelta(minutes=15), "NEW": t - dt.timedelta(minutes=5)}, t)
+    fired = []
+    for k in range(120):   # 10 分鐘
+        fired += engine.evaluate(rows_for(t, {"OLD": ("ERROR", 0, 0.0), "NEW": ("ERROR", 0, 0.0)}))
+        t += TICK
+    got = sorted((a["rule"], a["equipment_id"]) for a in fired)
+    want = [("MTTR_EXCEEDED", "NEW")]
+    ok = got == want
+    print("重啟接續檢查：" + ("✅ 已告警過的維修不重複觸發" if ok else f"❌ 觸發 {got}，預期 {want}"))
+    return 0 if ok else 1
+
+
+def evaluate_latency(n: int, ticks: int):
+    """回傳每 tick evaluate 耗時（ms）的 (p50, p99)；前 DRIFT_MIN_SAMPLES 個 tick 先暖機（讓產能偏移開始計算）"""
+    import alerts
+    import simulator
+
+    vec = simulator.VectorEngine(1)
+    engine = alerts.AlertEngine()
+    eids = [f"M{i}" for i in range(1, n + 1)]
+    t = dt.datetime(2024, 1, 1, 8)
+    vec.sync(eids, simulator.epoch_seconds(t))
+    total = np.zeros(n, dtype=np.int64)
+    status_names = np.array(["RUN", "IDLE", "ERROR"])
+    times = []
+    for k in range(alerts.DRIFT_MIN_SAMPLES + ticks):
+        produced, mode, eff = vec.step(simulator.epoch_seconds(t), 1.0)
+        total += produced
+        rows = [{"equipment_id": eid, "ts": t, "status": st, "production": p, "efficiency": e}
+                for eid, st, p, e in zip(eids, status_names[mode].tolist(), total.tolist(), eff.tolist())]
+        t0 = time.perf_counter()
+        engine.evaluate(rows)
+        if k >= alerts.DRIFT_MIN_SAMPLES:
+            times.append(time.perf_counter() - t0)
+        t += TICK
+    times = np.array(times) * 1000
+    return float(np.percentile(times, 50)), float(np.percentile(times, 99))
+
+
+def batch_cost(n: int, ticks: int):
+    """
+    generate_batch 每 tick 耗時的中位數（ms）：(含規則評估, 不含)
+    有 / 沒有規則逐 tick 交替跑，DB 變大、WAL checkpoint 等漂移兩邊平均分攤
+    """
+    import alerts
+    import simulator
+
+    simulator.DEFAULT_EQUIP_IDS = [f"M{i}" for i in range(1, n + 1)]
+    evaluate = alerts.ENGINE.evaluate
+    times = {True: [], False: []}
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator.generate_batch()   # 暖機：建立設備、初始化狀態
+        for k in range(2 * ticks):
+            on = k % 2 == 0
+            alerts.ENGINE.evaluate = evaluate if on else (lambda rows: [])
+            t0 = time.perf_counter()
+            simulator.generate_batch()
+            times[on].append((time.perf_counter() - t0) * 1000)
+    alerts.ENGINE.evaluate = evaluate
+    return float(np.median(times[True])), float(np.median(times[False]))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--machines", type=int, nargs="+", default=[1000, 5000])
+    ap.add_argument("--ticks", type=int, default=200, help="量 evaluate 延遲的 tick 數")
+    ap.add_argument("--batch-ticks", type=int, default=10, help="量 generate_batch 佔比的 tick 數（有 / 沒有規則各這麼多個；0 = 略過）")
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work, 'bench.db')}"
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    failed = scenario() | restart_scenario()
+    print(f"{'machines':>8} {'evaluate p50 ms':>16} {'p99 ms':>8}")
+    for n in args.machines:
+        p50, p99 = evaluate_latency(n, args.ticks)
+        print(f"{n:>8} {p50:>16.2f} {p99:>8.2f}")
+
+    if args.batch_ticks:
+        n = args.machines[0]
+        with_rules, without = batch_cost(n, args.batch_ticks)
+        print(f"generate_batch（{n} 台，p50）：含規則 {with_rules:.1f} ms/tick、不含 {without:.1f} ms/tick"
+              f"（{with_rules - without:+.1f} ms，TICK_SECONDS=5 的 {(with_rules - without) / 50:.2f}%）")
+
+    import database
+    database.engine.dispose()
+    shutil.rmtree(work, ignore_errors=True)
+    sys.exit(failed)
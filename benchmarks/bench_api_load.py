@@ -0,0 +1,124 @@
+# benchmarks/bench_api_load.py
+# API 負載測試：N 個併發 client 輪流打 /api/summary、/api/metrics、/api/alerts、/api/maintenance，
+# 量各端點 p50 / p99 延遲；可加 --baseline <git ref> 跟舊版（例如同步端點）比較
+# 用法：python benchmarks/bench_api_load.py --clients 50 500 --seconds 15 --baseline HEAD~1
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URLS = ["/api/summary", "/api/metrics?range=realtime", "/api/metrics?range=1d",
+        "/api/alerts", "/api/maintenance"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def _load(base: str, clients: int, seconds: float):
+    latencies, errors = defaultdict(list), [0]
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=base, timeout=120, limits=limits) as c:
+        async def client(i):
+            n = i
+            while time.perf_counter() < deadline:
+                url = URLS[n % len(URLS)]
+                t0 = time.perf_counter()
+                try:
+                    ok = (await c.get(url)).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies[url].append((time.perf_counter() - t0) * 1000)
+                else:
+                    errors[0] += 1
+                n += 1
+
+        await asyncio.gather(*(client(i) for i in range(clients)))
+    return latencies, errors[0]
+
+
+def run(code_dir: str, db_path: str, clients: int, seconds: float):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+    port = _free_port()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+                               "--log-level", "warning", "--backlog", "4096"],
+                              cwd=code_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(150):
+            try:
+                httpx.get(base + "/api/health", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        return asyncio.run(_load(base, clients, seconds))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:   # 還有卡住的請求時不等 graceful shutdown
+            server.kill()
+            server.wait()
+
+
+def report(label, clients, seconds, latencies, errors):
+    total = sum(len(v) for v in latencies.values())
+    print(f"\n[{label}] {clients} clients：{total / seconds:.1f} req/s，錯誤 {errors}")
+    print(f"  {'endpoint':<28} {'n':>6} {'p50 ms':>9} {'p99 ms':>9}")
+    for url in URLS:
+        v = latencies.get(url, [])
+        print(f"  {url:<28} {len(v):>6} {_percentile(v, 0.5):>9.1f} {_percentile(v, 0.99):>9.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, nargs="+", default=[50, 500])
+    ap.add_argument("--seconds", type=float, default=15)
+    ap.add_argument("--machines", type=int, default=20)
+    ap.add_argument("--span", default="2d", help="先用 simulator 回填多長的歷史資料")
+    ap.add_argument("--baseline", metavar="REF", default=None, help="另外跑一次這個 git ref 的 app 做比較")
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp()
+    seed_db = os.path.join(work, "seed.db")
+    subprocess.run([sys.executable, "simulator.py", "--backfill", args.span, "--machines", str(args.machines),
+                    "--seed", "1"], cwd=ROOT, env=dict(os.environ, DATABASE_URL=f"sqlite:///{seed_db}"),
+                   check=True, stdout=subprocess.DEVNULL)
+
+    targets = [("current", ROOT)]
+    if args.baseline:
+        wt = os.path.join(work, "baseline")
+        subprocess.run(["git", "worktree", "add", "--detach", wt, args.baseline], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        targets.insert(0, (args.baseline, wt))
+    try:
+        for clients in args.clients:
+            for label, code_dir in targets:
+                db = os.path.join(work, f"{label.replace('/', '_')}-{clients}.db")
+                shutil.copy(seed_db, db)   # 每次都從同一份資料開始（舊版也能跑自己的 migration）
+                report(label, clients, args.seconds, *run(code_dir, db, clients, args.seconds))
+    finally:
+        if args.baseline:
+            subprocess.run(["git", "worktree", "remove", "--force", os.path.join(work, "baseline")], cwd=ROOT)
+        shutil.rmtree(work, ignore_errors=True)
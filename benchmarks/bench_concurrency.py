@@ -0,0 +1,131 @@
+# benchmarks/bench_concurrency.py
+# 讀寫併發：simulator 全速寫入的同時，K 個 client 不斷打 /api/summary 與 /api/metrics，
+# 比較 journal_mode=DELETE（舊預設）與 WAL 的 API 延遲、錯誤數與寫入吞吐量
+# 用法：python benchmarks/bench_concurrency.py --clients 4 16 --seconds 10 --machines 100
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URLS = ["/api/summary", "/api/metrics?range=realtime", "/api/metrics?range=5m"]
+
+# 寫入端：不 sleep，連續呼叫 generate_batch 直到時間到
+WRITER = """
+import sys, time, contextlib, io
+import simulator
+simulator.DEFAULT_EQUIP_IDS = [f"M{i}" for i in range(1, int(sys.argv[1]) + 1)]
+deadline = time.time() + float(sys.argv[2])
+ticks = errors = 0
+with contextlib.redirect_stdout(io.StringIO()):
+    while time.time() < deadline:
+        try:
+            simulator.generate_batch()
+            ticks += 1
+        except Exception:
+            errors += 1
+print(ticks, errors)
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(mode: str, clients: int, seconds: float, machines: int) -> dict:
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", SQLITE_JOURNAL_MODE=mode)
+    py = [sys.executable, "-c"]
+
+    # 先備一小時歷史資料，讓 /api/metrics 有東西可讀
+    subprocess.run([sys.executable, "simulator.py", "--backfill", "1h", "--machines", str(machines)],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    port = _free_port()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+                               "--log-level", "warning"],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(base + "/api/health", timeout=1)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+
+        latencies, errors, lock = [], [0], threading.Lock()
+        deadline = time.time() + seconds
+
+        def client(i):
+            with httpx.Client(base_url=base, timeout=30) as c:
+                n = i
+                while time.time() < deadline:
+                    t0 = time.perf_counter()
+                    try:
+                        ok = c.get(URLS[n % len(URLS)]).status_code == 200
+                    except httpx.HTTPError:
+                        ok = False
+                    ms = (time.perf_counter() - t0) * 1000
+                    with lock:
+                        latencies.append(ms)
+                        if not ok:
+                            errors[0] += 1
+                    n += 1
+
+        writer = subprocess.Popen(py + [WRITER, str(machines), str(seconds)], cwd=ROOT, env=env,
+                                  stdout=subprocess.PIPE, text=True)
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        ticks, write_errors = map(int, writer.communicate()[0].split())
+    finally:
+        server.terminate()
+        server.wait()
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    return {
+        "req_per_s": len(latencies) / seconds,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p99_ms": _percentile(latencies, 0.99),
+        "http_errors": errors[0],
+        "ticks_per_s": ticks / seconds,
+        "write_errors": write_errors,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, nargs="+", default=[4, 16])
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--machines", type=int, default=100)
+    ap.add_argument("--modes", nargs="+", default=["DELETE", "WAL"])
+    args = ap.parse_args()
+
+    print(f"{'mode':>6} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'http err':>8} "
+          f"{'ticks/s':>8} {'write err':>9}")
+    for k in args.clients:
+        for mode in args.modes:
+            r = run(mode, k, args.seconds, args.machines)
+            print(f"{mode:>6} {k:>7} {r['req_per_s']:>8.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+                  f"{r['http_errors']:>8} {r['ticks_per_s']:>8.1f} {r['write_errors']:>9}")
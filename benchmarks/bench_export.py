@@ -0,0 +1,97 @@
+# benchmarks/bench_export.py
+# /api/export 的串流匯出：
+#   - 每種格式的筆數與 DB 裡 COUNT(*) 一致（parquet 需要 pyarrow，沒裝就跳過）
+#   - 量整個請求的 rows/s（TestClient 串流讀取，不在用戶端累積 body）
+#   - 用 tracemalloc 量伺服器端產生器的峰值記憶體：區間變長（筆數變多）峰值應維持在同一水準
+# 用法：python benchmarks/bench_export.py --machines 200 --span 1d
+import argparse
+import datetime as dt
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_export(client, url: str, fmt: str):
+    """串流讀完一次匯出，回傳 (筆數, bytes)；csv / ndjson 只數換行，parquet 要整份才能讀 footer"""
+    lines, size, parquet = 0, 0, []
+    with client.stream("GET", url, headers={"Accept-Encoding": "identity"}) as r:
+        r.raise_for_status()
+        for chunk in r.iter_bytes():
+            size += len(chunk)
+            if fmt == "parquet":
+                parquet.append(chunk)
+            else:
+                lines += chunk.count(b"\n")
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(io.BytesIO(b"".join(parquet))).metadata.num_rows, size
+    return (lines - 1 if fmt == "csv" else lines), size   # csv 第一行是標題
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--machines", type=int, default=200)
+    ap.add_argument("--span", default="1d", help="先用 simulator 回填多長的歷史資料")
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work, 'bench.db')}"
+    subprocess.run([sys.executable, "simulator.py", "--backfill", args.span, "--machines", str(args.machines),
+                    "--seed", "1"], cwd=ROOT, env=os.environ, check=True, stdout=subprocess.DEVNULL)
+
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+    import app as app_module
+    import database
+    import export
+    import partitions
+
+    end = dt.datetime.utcnow() + dt.timedelta(minutes=1)
+    with database.ReadSessionLocal() as db:
+        first = partitions.earliest_ts(db)
+    windows = [first + (end - first) * k / 8 for k in (7, 4, 0)]   # 最近 1/8、1/2、全部
+
+    failed = 0
+    print(f"{args.machines} 台設備，回填 {args.span}")
+    print(f"  {'format':<8} {'window':>8} {'rows':>10} {'bytes':>12} {'rows/s':>10} {'峰值 KB':>9}")
+    with TestClient(app_module.app) as client:
+        for fmt in export.FORMATS:
+            if not export.available(fmt):
+                print(f"  {fmt:<8} 略過（未安裝 pyarrow）")
+                continue
+            for start in windows:
+                with database.ReadSessionLocal() as db:
+                    expect = sum(db.query(func.count()).select_from(m).filter(m.c.ts >= start, m.c.ts < end).scalar()
+                                 for m in partitions.overlapping(db, start, end))
+
+                url = f"/api/export?format={fmt}&from={start.isoformat()}&to={end.isoformat()}"
+                t0 = time.perf_counter()
+                rows, size = read_export(client, url, fmt)
+                elapsed = time.perf_counter() - t0
+
+                tracemalloc.start()
+                for _ in export.stream(fmt, start, end):
+                    pass
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                ok = rows == expect
+                failed += not ok
+                hours = (end - start).total_seconds() / 3600
+                print(f"  {fmt:<8} {hours:>7.1f}h {rows:>10,} {size:>12,} {rows / elapsed:>10,.0f} {peak / 1024:>9,.0f}"
+                      + ("" if ok else f"  ❌ 預期 {expect:,} 筆"))
+
+    database.engine.dispose()
+    database.read_engine.dispose()
+    shutil.rmtree(work, ignore_errors=True)
+    print("筆數全部一致" if not failed else f"❌ {failed} 項筆數不符")
+    sys.exit(1 if failed else 0)
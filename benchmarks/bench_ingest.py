@@ -0,0 +1,49 @@
+# benchmarks/bench_ingest.py
+# 量測 simulator.generate_batch 的吞吐量（ticks/sec）
+# 用法：python benchmarks/bench_ingest.py --machines 4 100 1000 --ticks 20
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(n_machines: int, ticks: int) -> float:
+    # 每個機台數各用一個全新的 DB 檔，模組要在設定 DATABASE_URL 之後才 import
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    for mod in ["database", "models", "partitions", "queries", "rollup", "events", "alerts", "migrations", "simulator"]:
+        sys.modules.pop(mod, None)
+    sys.path.insert(0, ROOT)
+    import database
+    import simulator
+
+    simulator.DEFAULT_EQUIP_IDS = [f"M{i}" for i in range(1, n_machines + 1)]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulator.generate_batch()  # 暖機：建立設備、初始化狀態
+            t0 = time.perf_counter()
+            for _ in range(ticks):
+                simulator.generate_batch()
+            elapsed = time.perf_counter() - t0
+    finally:
+        database.engine.dispose()
+        os.remove(path)
+    return ticks / elapsed
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--machines", type=int, nargs="+", default=[4, 100, 1000])
+    ap.add_argument("--ticks", type=int, default=20)
+    args = ap.parse_args()
+
+    print(f"{'machines':>8} {'ticks/s':>10} {'machine-ticks/s':>16}")
+    for n in args.machines:
+        tps = run(n, args.ticks)
+        print(f"{n:>8} {tps:>10.2f} {tps * n:>16.0f}")
@@ -0,0 +1,130 @@
+# benchmarks/bench_metrics_format.py
+# /api/metrics 三種格式比較：json（預設）、columnar、binary
+#   - 先確認三種格式解出來的數值一致
+#   - 再量各範圍的回應大小（原始 / gzip）與序列化時間
+# 用法：python benchmarks/bench_metrics_format.py --machines 200 --span 1d
+import argparse
+import asyncio
+import datetime as dt
+import gzip
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RANGES = ["5m", "1h", "1d"]
+
+
+def decode_binary(buf: bytes):
+    """與 static/main.js 的 decodeColumnar 相同的解法"""
+    assert buf[:4] == b"SFC1"
+    hlen = struct.unpack_from("<I", buf, 4)[0]
+    header = json.loads(buf[8:8 + hlen])
+    n, eqps = header["n"], header["equipment"]
+    off = 8 + hlen
+    delta = np.frombuffer(buf, "<i4", n, off)
+    off += n * 4 + (-(n * 4) % 8)
+    total = np.frombuffer(buf, "<f8", n, off)
+    off += n * 8
+    production = np.frombuffer(buf, "<i4", len(eqps) * n, off).reshape(len(eqps), n)
+    return header, header["ts_base"] + np.cumsum(delta), total, production
+
+
+def check_equal(js, col, binary):
+    """三種格式的 (ts, total, 每台每點產量) 必須一致"""
+    epoch = lambda s: int(np.datetime64(s, "s").astype(np.int64))
+    ts = [epoch(p["ts"]) for p in js["items_total"]]
+    total = [p["production"] for p in js["items_total"]]
+    per = {s["equipment_id"]: {epoch(p["ts"]): p["production"] for p in s["points"]}
+           for s in js["items_by_equipment"]}
+
+    col_ts = (col["ts_base"] + np.cumsum(col["ts_delta"])).tolist()
+    assert col_ts == ts, "columnar ts 不一致"
+    assert col["total"] == total, "columnar total 不一致"
+    assert sorted(per) == col["equipment"], "columnar 設備不一致"
+
+    header, b_ts, b_total, b_prod = decode_binary(binary)
+    assert b_ts.tolist() == ts and b_total.tolist() == total, "binary ts/total 不一致"
+    for k, eid in enumerate(col["equipment"]):
+        expect = [per[eid].get(t, -1) for t in ts]
+        assert col["production"][k] == expect, f"columnar {eid} 不一致"
+        assert b_prod[k].tolist() == expect, f"binary {eid} 不一致"
+
+
+def _timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return out, best * 1000
+
+
+def measure(client, app_module, rng, repeat):
+    """同一批 rows 組三種格式：確認數值一致，並量序列化時間、大小與整個請求的時間"""
+    import database
+    import response_cache
+    from fastapi.responses import JSONResponse
+
+    now = dt.datetime.utcnow()
+
+    async def fetch():
+        async with database.AsyncReadSessionLocal() as db:
+            return await app_module.fetch_metric_rows(rng, now, db)
+
+    rows, resolution = asyncio.run(fetch())
+    epoch = int(app_module.epoch_seconds(now))
+    encoders = {
+        "json": lambda: JSONResponse(app_module.series_payload(rows, resolution, now)).body,
+        "columnar": lambda: JSONResponse(columnar.to_json(rows, resolution, epoch)).body,
+        "binary": lambda: columnar.to_binary(rows, resolution, epoch),
+    }
+    bodies, results = {}, []
+    for fmt, encode in encoders.items():
+        body, ser_ms = _timed(encode, repeat=repeat)
+        bodies[fmt] = body
+
+        def request():
+            response_cache.clear()   # 量的是實際查詢 + 組裝，不是快取命中
+            r = client.get(f"/api/metrics?range={rng}&format={fmt}", headers={"Accept-Encoding": "identity"})
+            assert r.status_code == 200, (rng, fmt, r.status_code)
+        _, req_ms = _timed(request, repeat=repeat)
+        results.append((fmt, len(body), len(gzip.compress(body, 6)), ser_ms, req_ms))
+    check_equal(json.loads(bodies["json"]), json.loads(bodies["columnar"]), bodies["binary"])
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--machines", type=int, default=200)
+    ap.add_argument("--span", default="1d", help="先用 simulator 回填多長的歷史資料")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp()
+    db = os.path.join(work, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db}"
+    subprocess.run([sys.executable, "simulator.py", "--backfill", args.span, "--machines", str(args.machines),
+                    "--seed", "1"], cwd=ROOT, env=os.environ, check=True, stdout=subprocess.DEVNULL)
+
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from fastapi.testclient import TestClient
+    import app as app_module
+    import columnar
+
+    with TestClient(app_module.app) as client:
+        print(f"{args.machines} 台設備，回填 {args.span}")
+        print(f"  {'range':<6} {'format':<9} {'bytes':>11} {'gzip':>10} {'序列化 ms':>9} {'請求 ms':>9}")
+        for rng in RANGES:
+            for fmt, size, gz, ser_ms, req_ms in measure(client, app_module, rng, args.repeat):
+                print(f"  {rng:<6} {fmt:<9} {size:>11,} {gz:>10,} {ser_ms:>11.1f} {req_ms:>10.1f}")
+        print("三種格式數值一致")
+    shutil.rmtree(work, ignore_errors=True)
@@ -0,0 +1,158 @@
+# benchmarks/bench_storage.py
+# 比較兩個原始資料儲存後端（storage.SQLiteStore / storage.ColumnarStore）：
+#   - 同一份模擬資料（simulator.VectorEngine）分批寫入兩邊，量寫入速度與佔用空間
+#   - 各種熱門讀取的 p50：每台最新一筆、realtime 最近 N 個 tick、游標之後的新資料、1 小時 / 1 天範圍、
+#     單一設備整段歷史、整天匯出
+# 預設是 30 天、500 台、5 秒一個 tick（約 2.6 億筆，需要數十 GB 與數小時）；
+# 機器不夠時可以加大 --tick 縮小資料量，例如 --tick 300
+# 用法：python benchmarks/bench_storage.py --days 30 --machines 500 --tick 300
+import argparse
+import datetime as dt
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def disk_usage(path: str) -> int:
+    """實際佔用的 bytes（欄式 chunk 預先配置成稀疏檔，看 st_blocks 才準）"""
+    if os.path.isfile(path):
+        return os.stat(path).st_blocks * 512
+    return sum(os.stat(os.path.join(d, f)).st_blocks * 512 for d, _, files in os.walk(path) for f in files)
+
+
+def populate(stores, db, eids, start, end, tick: int, batch_rows: int):
+    """逐 tick 模擬、依 UTC 日分批寫入各 store；回傳 (筆數, 各 store 的寫入秒數)"""
+    import simulator
+
+    engine = simulator.VectorEngine(1)
+    engine.sync(eids, simulator.epoch_seconds(start))
+    modes = np.array(simulator.MODE_NAMES, dtype=object)
+    daily = np.zeros(len(eids), dtype=np.int64)
+    spent = [0.0] * len(stores)
+    pending, total, day = [], 0, None
+
+    def flush():
+        for k, store in enumerate(stores):
+            t0 = time.perf_counter()
+            store.append(db, pending)
+            db.commit()
+            spent[k] += time.perf_counter() - t0
+        pending.clear()
+
+    t = start
+    while t < end:
+        if t.date() != day:
+            if pending:
+                flush()
+            day = t.date()
+            daily[:] = 0
+        produced, mode, eff = engine.step(simulator.epoch_seconds(t), simulator.shift_multiplier(t))
+        daily += produced
+        pending.extend(zip(eids, [t] * len(eids), modes[mode].tolist(), daily.tolist(), np.round(eff, 2).tolist()))
+        total += len(eids)
+        if len(pending) >= batch_rows:
+            flush()
+        t += dt.timedelta(seconds=tick)
+        if t.hour == 0 and t.minute == 0 and t.second < tick:
+            print(f"  {t:%Y-%m-%d}  {total:,} 筆")
+    if pending:
+        flush()
+    return total, spent
+
+
+def timed(fn, repeat: int):
+    """回傳 (p50 ms, 最後一次的結果)"""
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times), result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=float, default=30)
+    ap.add_argument("--machines", type=int, default=500)
+    ap.add_argument("--tick", type=int, default=5, help="模擬的 tick 秒數")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp()
+    db_path = os.path.join(work, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import database
+    import migrations
+    import storage
+    from models import Equipment
+
+    migrations.migrate(args.tick)
+    eids = [f"M{i}" for i in range(1, args.machines + 1)]
+    with database.SessionLocal() as db:
+        db.add_all(Equipment(equipment_id=eid, status="RUN", production=0, efficiency=0.0) for eid in eids)
+        db.commit()
+    size0 = disk_usage(db_path)
+
+    names = ("SQLite", "欄式")
+    stores = [storage.SQLiteStore(), storage.ColumnarStore(os.path.join(work, "tsdata"))]
+    end = dt.datetime.utcnow().replace(microsecond=0)
+    end -= dt.timedelta(seconds=end.timestamp() % args.tick)
+    start = end - dt.timedelta(days=args.days)
+    print(f"寫入 {args.days:g} 天、{args.machines} 台、每 {args.tick} 秒一個 tick ...")
+    with database.SessionLocal() as db:
+        rows, spent = populate(stores, db, eids, start, end, args.tick, batch_rows=200_000)
+    with database.engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    sizes = [disk_usage(db_path) - size0, disk_usage(stores[1].root)]
+
+    print(f"\n{rows:,} 筆")
+    print(f"  {'':<28} {names[0]:>12} {names[1]:>12}")
+    print(f"  {'寫入（筆/秒）':<26} {rows / spent[0]:>12,.0f} {rows / spent[1]:>12,.0f}")
+    print(f"  {'佔用空間（MB）':<26} {sizes[0] / 2**20:>12,.1f} {sizes[1] / 2**20:>12,.1f}")
+    print(f"  {'每筆 bytes':<28} {sizes[0] / rows:>12.1f} {sizes[1] / rows:>12.1f}")
+
+    last = end - dt.timedelta(seconds=args.tick)
+    midnight = dt.datetime.combine(last.date(), dt.time.min)
+    day_start = max(start, last - dt.timedelta(days=1))
+
+    def realtime(store, db):
+        stamps = store.recent_stamps(db, 60)
+        return store.production_since(db, stamps[-1])
+
+    cases = [
+        ("每台最新一筆", lambda s, db: s.latest(db)),
+        ("每台午夜前最後一筆", lambda s, db: s.latest(db, before=midnight)),
+        ("realtime（最近 60 tick）", realtime),
+        ("游標之後的新資料（1 tick）", lambda s, db: s.rows_after(db, last - dt.timedelta(seconds=args.tick))),
+        ("最近 1 小時", lambda s, db: s.production_since(db, last - dt.timedelta(hours=1))),
+        ("最近 1 天", lambda s, db: s.production_since(db, day_start)),
+        ("單一設備整段匯出", lambda s, db: [r for b in s.scan(db, start, end, "M1") for r in b]),
+        ("整天匯出", lambda s, db: sum(len(b) for b in s.scan(db, day_start, end))),
+    ]
+    print(f"\n  {'讀取 p50（ms）':<26} {names[0]:>12} {names[1]:>12} {'比值':>8}")
+    failed = 0
+    for label, fn in cases:
+        results, times = [], []
+        for store in stores:
+            with database.ReadSessionLocal() as db:
+                ms, result = timed(lambda: fn(store, db), 1 if label == "整天匯出" else args.repeat)
+            results.append([tuple(r) for r in result] if isinstance(result, list) else result)
+            times.append(ms)
+        same = results[0] == results[1]
+        failed += not same
+        print(f"  {label:<26} {times[0]:>12.1f} {times[1]:>12.1f} {times[0] / max(times[1], 1e-9):>7.1f}x"
+              + ("" if same else "  ❌ 結果不同"))
+
+    database.engine.dispose()
+    database.read_engine.dispose()
+    shutil.rmtree(work, ignore_errors=True)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,196 @@
+# benchmarks/bench_suite.py
+# 可重現的效能基準：用 simulator 自己的模型回填（設備數 × 天數）到暫存 SQLite，
+# 量 API（TestClient，不需網路）與內部函式的 ops/s、p50 / p99、峰值記憶體，結果寫成 JSON；
+# 另可比較兩份結果，標出變慢的項目（有退步時以非 0 結束，可放進 CI）
+# 用法：
+#   python benchmarks/bench_suite.py run --machines 20 --days 1 --out before.json
+#   python benchmarks/bench_suite.py run --machines 20 --days 1 --out after.json
+#   python benchmarks/bench_suite.py compare before.json after.json --threshold 0.15
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RANGES = ["realtime", "5m", "1h", "1d", "1mo"]
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(fn, min_runs: int, min_seconds: float):
+    """
+    先跑一次暖機，再至少跑 min_runs 次、且累計至少 min_seconds 秒；
+    峰值記憶體另外用 tracemalloc 多跑一次量（避免 tracemalloc 拖慢計時）
+    """
+    fn()
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < min_runs or time.perf_counter() - start < min_seconds:
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "runs": len(latencies),
+        "ops_per_sec": round(len(latencies) / sum(latencies), 2),
+        "p50_ms": round(_percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "peak_mem_kb": round(peak / 1024, 1),
+    }
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(n_machines: int, days: float, min_runs: int, min_seconds: float, only=None):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)  # app 以相對路徑掛 static / templates
+
+    import database
+    import simulator
+
+    simulator.DEFAULT_EQUIP_IDS = [f"M{i}" for i in range(1, n_machines + 1)]
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator.backfill(dt.timedelta(days=days))
+    seed_seconds = time.perf_counter() - t0
+
+    from fastapi.testclient import TestClient
+    import app as app_module
+    import events
+    import response_cache
+    import storage
+
+    def api(url):
+        def call():
+            response_cache.clear()   # 量的是實際計算，不是快取命中
+            client.get(url).raise_for_status()
+        return call
+
+    def error_events(hours):
+        def call():
+            since = dt.datetime.utcnow() - dt.timedelta(hours=hours)
+            with database.ReadSessionLocal() as db:
+                events.build_error_events_and_windows(db, since)
+        return call
+
+    def ingest():
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulator.generate_batch()
+
+    with database.ReadSessionLocal() as db:
+        rows_1h = [tuple(r) for r in storage.production_since(db, dt.datetime.utcnow() - dt.timedelta(hours=1))]
+
+    # 會寫入的 ingest 放最後，前面的讀取都看同一份資料
+    cases = {"summary": api("/api/summary")}
+    cases.update({f"metrics_{r}": api(f"/api/metrics?range={r}") for r in RANGES})
+    cases.update({
+        "oee_1d": api("/api/oee"),
+        "oee_30d": api("/api/oee?from=" + (dt.datetime.utcnow() - dt.timedelta(days=30, minutes=7)).isoformat()),
+        "error_events_12h": error_events(12),
+        "error_events_168h": error_events(168),
+        "build_series_1h": lambda: app_module.build_series(rows_1h),
+        "ingest_generate_batch": ingest,
+    })
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()), TestClient(app_module.app) as client:
+        for name, fn in cases.items():
+            if only and not any(o in name for o in only):
+                continue
+            results[name] = measure(fn, min_runs, min_seconds)
+            print(f"  {name:<24} {results[name]['ops_per_sec']:>10.1f} ops/s  "
+                  f"p50 {results[name]['p50_ms']:>9.2f} ms  p99 {results[name]['p99_ms']:>9.2f} ms  "
+                  f"peak {results[name]['peak_mem_kb']:>9.0f} KB", file=sys.stderr)
+
+    database.engine.dispose()
+    database.read_engine.dispose()
+    os.remove(path)
+    return {
+        "meta": {
+            "machines": n_machines, "days": days, "build_series_rows": len(rows_1h),
+            "seed_seconds": round(seed_seconds, 1), "git": _git_rev(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "created": dt.datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def compare(base_path: str, new_path: str, threshold: float) -> int:
+    """p50 變慢或 ops/s 下降超過 threshold（比例）就算退步；回傳退步項目數"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    for key in ("machines", "days"):
+        if base["meta"].get(key) != new["meta"].get(key):
+            print(f"⚠️ 兩份結果的 {key} 不同（{base['meta'].get(key)} vs {new['meta'].get(key)}），比較僅供參考")
+
+    regressions = 0
+    print(f"{'case':<24} {'p50 ms (base→new)':>24} {'Δ':>8} {'ops/s Δ':>9} {'peak KB Δ':>10}")
+    for name in sorted(set(base["results"]) | set(new["results"])):
+        b, n = base["results"].get(name), new["results"].get(name)
+        if b is None or n is None:
+            print(f"{name:<24} {'（只在其中一份）':>24}")
+            continue
+        p50 = n["p50_ms"] / b["p50_ms"] - 1 if b["p50_ms"] else 0.0
+        ops = n["ops_per_sec"] / b["ops_per_sec"] - 1 if b["ops_per_sec"] else 0.0
+        mem = n["peak_mem_kb"] / b["peak_mem_kb"] - 1 if b["peak_mem_kb"] else 0.0
+        bad = p50 > threshold or ops < -threshold
+        regressions += bad
+        print(f"{name:<24} {b['p50_ms']:>11.2f} → {n['p50_ms']:>9.2f} {p50:>+8.0%} {ops:>+9.0%} {mem:>+10.0%}"
+              + ("  ❌ 退步" if bad else ""))
+    print(f"\n{'✅ 沒有退步' if not regressions else f'❌ {regressions} 項退步'}（門檻 {threshold:.0%}）")
+    return regressions
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="回填資料並量測，結果寫成 JSON")
+    r.add_argument("--machines", type=int, default=20)
+    r.add_argument("--days", type=float, default=1)
+    r.add_argument("--min-runs", type=int, default=20)
+    r.add_argument("--min-seconds", type=float, default=1.0)
+    r.add_argument("--only", nargs="*", help="只跑名稱包含這些字的項目，例如 metrics summary")
+    r.add_argument("--out", default="bench_results.json")
+    c = sub.add_parser("compare", help="比較兩份結果")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=0.15, help="容許的變慢比例")
+    args = ap.parse_args()
+
+    if args.cmd == "run":
+        print(f"{args.machines} 台設備 × {args.days:g} 天", file=sys.stderr)
+        out = run(args.machines, args.days, args.min_runs, args.min_seconds, args.only)
+        with open(args.out, "w") as f:
+            json.dump(out, f, indent=2, ensure_ascii=False)
+        print(f"結果寫入 {args.out}", file=sys.stderr)
+    else:
+        sys.exit(1 if compare(args.base, args.new, args.threshold) else 0)
@@ -0,0 +1,150 @@
+# benchmarks/check_backfill.py
+# 在已有即時資料的 DB 上回填歷史（simulator.backfill 補在最早一筆之前），檢查：
+#   - equipment 表（即時的最新狀態）與 LAST_STATUS 不被歷史的最後一個 tick 覆蓋
+#   - 歷史的維修區段全部在銜接點之前結束，不會出現「進行中」的歷史區段
+#   - 即時資料進行中的區段（刻意讓一台在即時 tick 進入 ERROR）仍然進行中、開始時間不變
+#   - 原始資料沒有重疊：即時的第一筆之後只有即時資料
+# 接著模擬原始資料過了保留期限（RAW_RETENTION_DAYS）被刪掉之後再回填兩次，檢查：
+#   - 第二次回填接在 rollup / 狀態事件最早一筆之前，不會重新產生已有的歷史
+#   - 銜接點之後的 rollup_1m 與狀態事件完全沒變（原始資料已刪的時段彙總也還在）
+# 用法：python benchmarks/check_backfill.py --machines 40 --live-ticks 3 --span 6h --history 2d --retention-days 1
+import argparse
+import contextlib
+import datetime as dt
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def live_ticks(simulator, database, ticks: int, broken: str):
+    """寫入 ticks 個即時 tick（間隔一個 TICK_SECONDS）；broken 這台從第二個 tick 起 ERROR"""
+    now = dt.datetime.utcnow().replace(microsecond=0)
+    for k in range(ticks):
+        t = now + dt.timedelta(seconds=simulator.TICK_SECONDS * k)
+        with database.SessionLocal() as db:
+            rows, _ = simulator.next_tick(db, t)
+            if k >= 1:
+                for r in rows:
+                    if r["equipment_id"] == broken:
+                        r["status"], r["efficiency"] = "ERROR", 0.0
+            simulator.persist_ticks(db, [rows])
+    return now
+
+
+def history_snapshot(database, models):
+    with database.ReadSessionLocal() as db:
+        rollups = {(r.equipment_id, r.bucket_ts): (r.production, r.samples, r.run_sec, r.error_sec)
+                   for r in db.query(models.MetricRollup1m)}
+        events = sorted((e.equipment_id, e.type, e.ts) for e in db.query(models.StatusEvent))
+    return rollups, events
+
+
+def snapshot(database, models):
+    with database.ReadSessionLocal() as db:
+        equipment = {e.equipment_id: (e.status, e.production, e.efficiency) for e in db.query(models.Equipment)}
+        windows = [(w.equipment_id, w.start_ts, w.end_ts) for w in db.query(models.ErrorWindow)]
+    return equipment, windows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--machines", type=int, default=40)
+    ap.add_argument("--live-ticks", type=int, default=3)
+    ap.add_argument("--span", default="6h")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--history", default="2d", help="保留期限測試：先回填這麼長，原始資料有一部分會過期被刪")
+    ap.add_argument("--retention-days", type=int, default=1)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp()
+    os.environ["RAW_RETENTION_DAYS"] = str(args.retention_days)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work, 'check.db')}"
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import database
+    import models
+    import simulator
+    import storage
+
+    simulator.DEFAULT_EQUIP_IDS = [f"M{i}" for i in range(1, args.machines + 1)]
+    simulator.ENGINE = simulator.VectorEngine(args.seed)
+    broken = simulator.DEFAULT_EQUIP_IDS[0]
+    with contextlib.redirect_stdout(io.StringIO()):
+        first_live = live_ticks(simulator, database, args.live_ticks, broken)
+    before_equipment, before_windows = snapshot(database, models)
+    before_status = dict(simulator.LAST_STATUS)
+
+    simulator.ENGINE = simulator.VectorEngine(args.seed)   # 同 python simulator.py --backfill：新行程、新引擎
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator.backfill(simulator.parse_span(args.span))
+    after_equipment, after_windows = snapshot(database, models)
+
+    errors = []
+    if after_equipment != before_equipment:
+        changed = [eid for eid in before_equipment if after_equipment.get(eid) != before_equipment[eid]]
+        errors.append(f"equipment 表被改了 {len(changed)} 台（例：{changed[0]} {before_equipment[changed[0]]} → "
+                      f"{after_equipment[changed[0]]}）")
+    if simulator.LAST_STATUS != before_status:
+        errors.append("LAST_STATUS 被回填的最後一個 tick 覆蓋")
+    history = [w for w in after_windows if w not in before_windows]
+    still_open = [w for w in history if w[2] is None]
+    if still_open:
+        errors.append(f"{len(still_open)} 個歷史維修區段沒有結束（例：{still_open[0]}）")
+    late = [w for w in history if w[2] is not None and (w[2] > first_live or w[1] >= w[2])]
+    if late:
+        errors.append(f"{len(late)} 個歷史維修區段超過銜接點或長度不對（例：{late[0]}）")
+    live_open = [w for w in before_windows if w[2] is None]
+    if not any(w[0] == broken for w in live_open):
+        errors.append(f"{broken} 的即時維修區段沒有建立（檢查腳本本身有問題）")
+    missing = [w for w in live_open if w not in after_windows]
+    if missing:
+        errors.append(f"即時資料進行中的維修區段被改掉：{missing}")
+    with database.ReadSessionLocal() as db:
+        rows = storage.production_since(db, first_live - simulator.parse_span(args.span) - dt.timedelta(hours=1))
+    historical = [ts for _, ts, _ in rows if ts < first_live]
+    if not historical:
+        errors.append("沒有回填到任何資料")
+    live = len(rows) - len(historical)
+    if live != args.live_ticks * args.machines:
+        errors.append(f"銜接點之後有 {live} 筆，預期只有即時的 {args.live_ticks * args.machines} 筆（回填和即時資料重疊）")
+
+    # 保留期限：回填 --history（舊的原始資料會被刪），記下此時的歷史，再回填一次 --span
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator.backfill(simulator.parse_span(args.history))
+    with database.ReadSessionLocal() as db:
+        joint = simulator.earliest_history(db)
+        raw_first = storage.earliest_ts(db)
+    before_rollups, before_events = history_snapshot(database, models)
+    simulator.ENGINE = simulator.VectorEngine(args.seed + 1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator.backfill(simulator.parse_span(args.span))
+    after_rollups, after_events = history_snapshot(database, models)
+    if raw_first is None or raw_first <= joint:
+        errors.append("原始資料沒有過期被刪（--history 要比 --retention-days 長，檢查腳本本身有問題）")
+    kept = {k: v for k, v in before_rollups.items() if k[1] > joint}
+    changed = [k for k, v in kept.items() if after_rollups.get(k) != v]
+    if changed:
+        errors.append(f"銜接點之後有 {len(changed)} 個 rollup_1m bucket 被改掉或刪掉（例：{changed[0]} "
+                      f"{kept[changed[0]]} → {after_rollups.get(changed[0])}）")
+    added = [e for e in after_events if e not in before_events]
+    overlap = [e for e in added if e[2] > joint]
+    if overlap:
+        errors.append(f"第二次回填在銜接點 {joint:%m-%d %H:%M} 之後新增了 {len(overlap)} 個狀態事件（例：{overlap[0]}）")
+    if len(after_events) - len(added) != len(before_events):
+        errors.append("既有的狀態事件被刪掉")
+    if not any(k[1] < joint for k in after_rollups.keys() - before_rollups.keys()):
+        errors.append("第二次回填沒有產生任何 rollup")
+
+    print(f"{args.machines} 台設備、{args.live_ticks} 個即時 tick、回填 {args.span}："
+          f"{len(historical):,} 筆歷史、{len(history)} 個歷史維修區段")
+    print(f"保留 {args.retention_days} 天原始資料、先回填 {args.history} 再回填 {args.span}："
+          f"銜接點 {joint:%Y-%m-%d %H:%M}，新增 {len(added)} 個狀態事件")
+    print("✅ 即時狀態與維修區段都沒被回填影響" if not errors else "\n".join("❌ " + e for e in errors))
+    database.engine.dispose()
+    database.read_engine.dispose()
+    shutil.rmtree(work, ignore_errors=True)
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,188 @@
+# benchmarks/check_multiworker.py
+# 多 worker 一致性檢查：啟動匯流排中繼（bus.py serve）、uvicorn --workers N、simulator.py（都用同一個 BUS_URL），
+# 模擬器跑幾個 tick 後停下，確認每個 worker 的 /api/summary 與 realtime 圖表都和直接查 DB 的結果相同，
+# 並印出各 worker 處理 /api/summary 時實際下了幾筆 SQL（匯流排正常時應接近 0）
+# 過程中還會：重啟中繼（worker 要能重連並從 DB 重新同步）、經由某一個 worker 新增設備（其他 worker 要跟著更新）
+# 用法：python benchmarks/check_multiworker.py --workers 4 --machines 20 --ticks 3
+import argparse
+import contextlib
+import datetime as dt
+import http.client
+import io
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get(conn, path):
+    conn.request("GET", path)
+    r = conn.getresponse()
+    body = r.read()
+    assert r.status == 200, (path, r.status, body[:200])
+    return body
+
+
+def snapshot(port: int, workers: int, attempts: int = 400):
+    """
+    每條新連線由哪個 worker 接是 kernel 決定的：同一條連線上先問 /api/health 拿 pid，
+    再問 summary / realtime / 指標 → 一定是同一個 worker。收集到每個 worker 各一份為止
+    """
+    seen = {}
+    for _ in range(attempts):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        try:
+            pid = json.loads(get(conn, "/api/health"))["worker"]
+            if pid in seen:
+                continue
+            summary = json.loads(get(conn, "/api/summary"))
+            realtime = json.loads(get(conn, "/api/metrics?range=realtime"))
+            metrics = get(conn, "/api/debug/metrics").decode()
+        finally:
+            conn.close()
+        seen[pid] = (summary, realtime, metrics)
+        if len(seen) == workers:
+            break
+    return seen
+
+
+def truth():
+    """直接從 DB 算：state_cache 重建一次的 summary、fetch_recent_rows 組的 realtime 序列"""
+    import app as app_module
+    import database
+    import state_cache
+
+    with database.ReadSessionLocal() as db:
+        state_cache.warm(db)
+        rows = app_module.fetch_recent_rows(db, ticks=app_module.REALTIME_TICKS)
+    return state_cache.summary(), app_module.series_payload(rows, None, dt.datetime.utcnow())
+
+
+def normalize(summary, realtime):
+    summary = {k: v for k, v in summary.items() if k != "updatedAt"}
+    per = sorted((s["equipment_id"], s["points"]) for s in realtime["items_by_equipment"])
+    return summary, realtime["items_total"], per
+
+
+def sql_count(metrics: str, route: str) -> int:
+    m = re.search(rf'http_request_sql_queries_total{{method="GET",route="{re.escape(route)}"}} (\d+)', metrics)
+    return int(m.group(1)) if m else 0
+
+
+def run_ticks(env, ticks: int):
+    """跑一段即時模擬器，等 ticks 個 tick 後停掉"""
+    sim = subprocess.Popen([sys.executable, "simulator.py"], cwd=ROOT, env=env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(5 * ticks - 2.5)   # simulator.TICK_SECONDS = 5，啟動即寫第一個 tick
+    sim.send_signal(signal.SIGINT)
+    sim.wait(timeout=30)
+    time.sleep(1.0)               # 讓最後一個 tick 送到各 worker
+
+
+def check(label: str, port: int, workers: int) -> int:
+    with contextlib.redirect_stdout(io.StringIO()):
+        want = normalize(*truth())
+    seen = snapshot(port, workers)
+    errors = []
+    if len(seen) < workers:
+        errors.append(f"只連到 {len(seen)} 個 worker")
+    for pid, (summary, realtime, metrics) in sorted(seen.items()):
+        got = normalize(summary, realtime)
+        diff = [name for name, a, b in zip(("summary", "realtime 總量", "realtime 各機"), got, want) if a != b]
+        if diff:
+            errors.append(f"worker {pid} 的 {'、'.join(diff)} 與 DB 不一致")
+    queries = {pid: sql_count(m, "/api/summary") for pid, (_, _, m) in seen.items()}
+    status = "✅" if not errors else "❌ " + "；".join(errors)
+    print(f"  {label:<16} daily={want[0]['dailyProduction']:>8} 設備={want[0]['totalEquipment']:>3}  "
+          f"/api/summary 累計 SQL（各 worker）{sorted(queries.values())} {status}")
+    return len(errors)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--machines", type=int, default=20)
+    ap.add_argument("--ticks", type=int, default=3, help="每一輪讓模擬器跑幾個 tick")
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp()
+    sock = os.path.join(work, "bus.sock")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(work, 'check.db')}",
+               BUS_URL=f"unix://{sock}", PYTHONUNBUFFERED="1")
+    os.environ.update(env)
+    subprocess.run([sys.executable, "simulator.py", "--backfill", "30m", "--machines", str(args.machines),
+                    "--seed", "1"], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    port = free_port()
+    procs = []
+
+    def start_hub():
+        hub = subprocess.Popen([sys.executable, "bus.py", "serve", "--path", sock], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL)
+        while not os.path.exists(sock):
+            time.sleep(0.05)
+        return hub
+
+    failed = 0
+    try:
+        hub = start_hub()
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+                                   "--workers", str(args.workers), "--log-level", "warning"],
+                                  cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+        procs = [hub, server]
+        deadline = time.time() + 120
+        while True:   # 等所有 worker 都起來
+            with contextlib.suppress(OSError):
+                if len(snapshot(port, args.workers, attempts=50)) == args.workers:
+                    break
+            if time.time() > deadline or server.poll() is not None:
+                raise SystemExit("worker 沒有全部啟動")
+            time.sleep(1)
+
+        print(f"{args.workers} 個 worker、{args.machines} 台設備，每輪 {args.ticks} 個 tick")
+        failed += check("啟動後", port, args.workers)
+        run_ticks(env, args.ticks)
+        failed += check("模擬器跑過", port, args.workers)
+
+        # 中繼重啟：流水號從頭算，worker 重連後必須從 DB 重新同步
+        hub.terminate()
+        hub.wait()
+        run_ticks(env, 1)   # 這段期間的 tick 沒人收到
+        procs[0] = hub = start_hub()
+        time.sleep(2)       # worker 每秒重試一次
+        run_ticks(env, args.ticks)
+        failed += check("中繼重啟後", port, args.workers)
+
+        # 經由其中一個 worker 新增設備 → 其他 worker 經匯流排得知，模擬器下個 tick 也會寫這台
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        conn.request("POST", "/api/equipment", body=json.dumps({"equipment_id": "MX"}),
+                     headers={"Content-Type": "application/json"})
+        assert conn.getresponse().status == 200
+        conn.close()
+        run_ticks(env, args.ticks)
+        failed += check("新增設備後", port, args.workers)
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            with contextlib.suppress(subprocess.TimeoutExpired):
+                p.wait(timeout=10)
+        shutil.rmtree(work, ignore_errors=True)
+
+    print("全部一致" if not failed else f"❌ {failed} 項不一致")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,95 @@
+# benchmarks/check_query_plans.py
+# 檢查熱門路徑的 SQL 都有走索引：實際呼叫 API / 寫入端，把執行過的 SELECT 逐一 EXPLAIN QUERY PLAN，
+# 若對 metrics(_YYYYMMDD) / rollup_* / status_events / error_windows / alerts 出現不帶索引的全表掃描就以非 0 結束
+# 用法：python benchmarks/check_query_plans.py --machines 20 --span 2h
+import argparse
+import contextlib
+import datetime as dt
+import io
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 這些資料表會隨時間長大，不允許全表掃描；equipment 只有設備數筆，掃描可接受
+BIG_TABLES = ("metrics", "rollup_1m", "rollup_15m", "rollup_1h", "rollup_1d", "status_events", "error_windows", "alerts")
+# SQLite 的計畫字串：「SCAN metrics」是全表掃描；「SCAN metrics USING (COVERING) INDEX ...」是依索引順序掃
+BARE_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+PARTITION = re.compile(r"^metrics_\d{8}$")   # 原始資料日分表
+
+
+def main(n_machines: int, span: str) -> int:
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)  # app 以相對路徑掛 static / templates
+
+    from sqlalchemy import event
+    import database
+    import simulator
+
+    simulator.DEFAULT_EQUIP_IDS = [f"M{i}" for i in range(1, n_machines + 1)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator.backfill(simulator.parse_span(span))
+
+    captured = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and not executemany:
+            captured.append((statement, parameters))
+
+    # 寫入端（simulator）、API 讀取端（同步 / async）各自一個 engine，都要收
+    for eng in (database.engine, database.read_engine, database.async_read_engine.sync_engine):
+        event.listen(eng, "before_cursor_execute", _capture)
+
+    from fastapi.testclient import TestClient
+    import app as app_module
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with TestClient(app_module.app) as client:
+            calls = ["/api/summary", "/api/alerts", "/api/maintenance", "/api/equipment"]
+            calls += [f"/api/metrics?range={r}" for r in ("realtime", "5m", "1h", "1d", "1mo")]
+            calls += ["/api/oee", "/api/oee?equipment=M1", "/api/oee?from=" + (dt.datetime.utcnow() - dt.timedelta(days=30, minutes=7)).isoformat()]
+            for url in calls:
+                client.get(url).raise_for_status()
+            cursor = client.get("/api/metrics?range=realtime").json()["items_total"][-1]["ts"]
+            simulator.generate_batch()
+            simulator.generate_batch()
+            client.get("/api/summary").raise_for_status()
+            client.get("/api/metrics/since", params={"cursor": cursor}).raise_for_status()
+
+    failures, seen = [], set()
+    with database.engine.connect() as conn:
+        for statement, params in captured:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            plan = [row[3] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params)]
+            for step in plan:
+                m = BARE_SCAN.match(step)
+                if m and (m.group(1) in BIG_TABLES or PARTITION.match(m.group(1))):
+                    failures.append((statement, plan))
+                    break
+    database.engine.dispose()
+    database.read_engine.dispose()
+    os.remove(path)
+
+    print(f"檢查 {len(seen)} 種查詢")
+    for statement, plan in failures:
+        print("\n❌ 全表掃描：\n" + " ".join(statement.split()))
+        for step in plan:
+            print("   ", step)
+    if not failures:
+        print("✅ 全部走索引")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--machines", type=int, default=20)
+    ap.add_argument("--span", default="2h", help="先用 simulator 回填多長的歷史資料")
+    args = ap.parse_args()
+    sys.exit(main(args.machines, args.span))
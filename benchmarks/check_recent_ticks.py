@@ -0,0 +1,81 @@
+# benchmarks/check_recent_ticks.py
+# 檢查「最近 N 個 tick」查詢（app.fetch_recent_rows）在不同設備數下都剛好回 N 個 tick、每個 tick 所有設備都在，
+# 且與暴力查詢（全部原始資料排序後取最後 N 個 ts）一致；同時印出查詢時間
+# 用法：python benchmarks/check_recent_ticks.py --machines 4 50 500 --ticks 60
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def check(n_machines: int, ticks: int, span: str) -> int:
+    """在獨立的暫存 DB 跑一次（每種設備數一個行程，engine 綁在 DATABASE_URL 上）"""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    import database
+    import partitions
+    import simulator
+
+    simulator.DEFAULT_EQUIP_IDS = [f"M{i}" for i in range(1, n_machines + 1)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator.backfill(simulator.parse_span(span))
+        from fastapi.testclient import TestClient
+        import app as app_module
+
+    errors = []
+    with database.ReadSessionLocal() as db:
+        t0 = time.perf_counter()
+        rows = app_module.fetch_recent_rows(db, ticks=ticks)
+        elapsed = (time.perf_counter() - t0) * 1000
+
+        everything = sorted((r.ts, r.equipment_id) for m in partitions.overlapping(db)
+                            for r in db.query(m.c.ts, m.c.equipment_id))
+        expect_ts = sorted({ts for ts, _ in everything})[-ticks:]
+
+    got_ts = sorted({ts for _, ts, _ in rows})
+    if got_ts != expect_ts:
+        errors.append(f"tick 不符：拿到 {len(got_ts)} 個，預期 {len(expect_ts)} 個")
+    expect_rows = sum(1 for ts, _ in everything if ts >= expect_ts[0])
+    if len(rows) != expect_rows or len(rows) != ticks * n_machines:
+        errors.append(f"筆數不符：拿到 {len(rows)}，預期 {expect_rows}（{ticks} × {n_machines}）")
+    if [ts for _, ts, _ in rows] != sorted(ts for _, ts, _ in rows):
+        errors.append("結果不是依時間升冪")
+
+    with contextlib.redirect_stdout(io.StringIO()), TestClient(app_module.app) as client:
+        points = client.get("/api/metrics?range=realtime").json()["items_total"]
+    if len(points) != app_module.REALTIME_TICKS:
+        errors.append(f"/api/metrics?range=realtime 有 {len(points)} 個點，預期 {app_module.REALTIME_TICKS}")
+
+    status = "✅" if not errors else "❌ " + "；".join(errors)
+    print(f"{n_machines:>5} 台：{len(got_ts)} ticks / {len(rows)} 筆，{elapsed:.1f} ms {status}")
+    database.engine.dispose()
+    database.read_engine.dispose()
+    os.remove(path)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--machines", type=int, nargs="+", default=[4, 50, 500])
+    ap.add_argument("--ticks", type=int, default=60)
+    ap.add_argument("--span", default="30m", help="先用 simulator 回填多長的歷史資料（需多於 ticks 個 tick）")
+    ap.add_argument("--one", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.one:
+        sys.exit(check(args.one, args.ticks, args.span))
+    failed = 0
+    for n in args.machines:
+        failed |= subprocess.run([sys.executable, __file__, "--one", str(n),
+                                  "--ticks", str(args.ticks), "--span", args.span]).returncode
+    sys.exit(failed)
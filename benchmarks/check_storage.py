@@ -0,0 +1,166 @@
+# benchmarks/check_storage.py
+# 儲存後端一致性檢查：同一份資料以同樣的呼叫順序寫進 storage.SQLiteStore 與 storage.ColumnarStore，
+# 逐項比對每個查詢方法的回傳值（內容與順序都要完全相同），刪除過期資料後再比一次。
+# 資料刻意包含：跨 UTC 日（累積產量歸零）、超過 71 分鐘的中斷（ts 差值放不下 → 新 chunk）、
+# 先寫較晚再回填較早的資料（時間倒退 → 新 chunk）、逐 tick 寫入、特殊字元的設備 ID、沒有資料的設備
+# 用法：python benchmarks/check_storage.py --machines 20 --hours 30
+import argparse
+import datetime as dt
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TICK = dt.timedelta(seconds=30)
+
+
+def make_ticks(eids, start: dt.datetime, end: dt.datetime, seed: int):
+    """[(ts, [(equipment_id, ts, status, production, efficiency)])]；ts 帶微秒（同即時模式的 utcnow）"""
+    import simulator
+
+    engine = simulator.VectorEngine(seed)
+    rng = random.Random(seed)
+    engine.sync(eids, simulator.epoch_seconds(start))
+    gap = (start + (end - start) / 3, start + (end - start) / 3 + dt.timedelta(hours=2))
+    daily = dict.fromkeys(eids, 0)
+    ticks, day, t = [], None, start
+    while t < end:
+        ts = t + dt.timedelta(microseconds=rng.randrange(1_000_000))
+        produced, modes, effs = engine.step(simulator.epoch_seconds(ts), simulator.shift_multiplier(ts))
+        if ts.date() != day:
+            day = ts.date()
+            daily = dict.fromkeys(eids, 0)
+        rows = []
+        for eid, p, m, e in zip(eids, produced.tolist(), modes.tolist(), effs.tolist()):
+            daily[eid] += p
+            if eid == eids[-1] and gap[0] <= ts < gap[1]:   # 這台中斷兩小時
+                continue
+            rows.append((eid, ts, simulator.MODE_NAMES[m], daily[eid], round(e, 2)))
+        ticks.append((ts, rows))
+        t += TICK
+    return ticks
+
+
+def write(stores, db, ticks, batch_rows: int):
+    """依 UTC 日分批寫入（同 simulator.backfill）；每批 commit"""
+    pending = []
+
+    def flush():
+        for store in stores:
+            store.append(db, pending)
+        db.commit()
+        pending.clear()
+
+    for ts, rows in ticks:
+        if pending and pending[0][1].date() != ts.date():
+            flush()
+        pending.extend(rows)
+        if len(pending) >= batch_rows:
+            flush()
+    if pending:
+        flush()
+
+
+def queries(db, ticks, eids):
+    """每個查詢方法 → 一組呼叫；回傳 [(名稱, 呼叫)]，呼叫參數是 store"""
+    stamps = [ts for ts, _ in ticks]
+    first, last = min(stamps), max(stamps)
+    mid = stamps[len(stamps) // 2]
+    midnight = dt.datetime.combine(last.date(), dt.time.min)
+    points = [first - dt.timedelta(hours=1), first, mid, midnight, last - dt.timedelta(minutes=5), last,
+              mid + dt.timedelta(microseconds=1), last + dt.timedelta(hours=1)]
+    rows = lambda result: [tuple(r) for r in result]
+    out = [("earliest_ts", lambda s: s.earliest_ts(db)), ("newest_ts", lambda s: s.newest_ts(db))]
+    out += [(f"recent_stamps({k})", lambda s, k=k: s.recent_stamps(db, k)) for k in (1, 10, 200, 10**6)]
+    out += [(f"production_since({p:%d %H:%M})", lambda s, p=p: rows(s.production_since(db, p))) for p in points]
+    out += [(f"production_since({a:%d %H:%M}, {b:%d %H:%M})", lambda s, a=a, b=b: rows(s.production_since(db, a, b)))
+            for a, b in [(first, mid), (mid, midnight), (midnight, last)]]
+    out += [(f"production_after({p:%d %H:%M}, {n})", lambda s, p=p, n=n: rows(s.production_after(db, p, n)))
+            for p in points for n in (1, 37, 10**6)]
+    out += [("rows_after(None)", lambda s: rows(s.rows_after(db, None)))]
+    out += [(f"rows_after({p:%d %H:%M})", lambda s, p=p: rows(s.rows_after(db, p))) for p in points]
+    out += [(f"rows_after({p and f'{p:%d %H:%M}'}, {n})", lambda s, p=p, n=n: rows(s.rows_after(db, p, n)))
+            for p in (None, first, mid, last - dt.timedelta(minutes=5)) for n in (1, 37)]
+    out += [("latest()", lambda s: s.latest(db))]
+    out += [(f"latest(before={p:%d %H:%M})", lambda s, p=p: s.latest(db, before=p)) for p in points]
+    out += [(f"latest({a:%d %H:%M} ~ {b:%d %H:%M})", lambda s, a=a, b=b: s.latest(db, before=b, since=a))
+            for a, b in [(first, mid), (midnight, last), (mid, mid + TICK)]]
+    for equipment in (None, "M1", eids[-1], "EMPTY"):
+        out.append((f"scan(equipment={equipment})",
+                    lambda s, e=equipment: [tuple(r) for b in s.scan(db, first, last, e, 1000) for r in b]))
+    # 怎麼分批由後端決定，只要求每批不超過 batch_rows
+    out.append(("scan(batch_rows)", lambda s: max(len(b) for b in s.scan(db, first, last + TICK, None, 1000)) <= 1000))
+    return out
+
+
+def compare(label, stores, db, ticks, eids) -> int:
+    failed = 0
+    for name, call in queries(db, ticks, eids):
+        results = [call(store) for store in stores]
+        if results[0] != results[1]:
+            failed += 1
+            size = [len(r) if hasattr(r, "__len__") else r for r in results]
+            print(f"  ❌ {label} {name}：SQLite {size[0]} / 欄式 {size[1]}")
+    print(f"{label}：{len(queries(db, ticks, eids))} 個查詢" + ("全部一致 ✅" if not failed else f"，{failed} 個不一致 ❌"))
+    return failed
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--machines", type=int, default=20)
+    ap.add_argument("--hours", type=float, default=30, help="資料跨幾小時（至少要跨一個 UTC 午夜）")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work, 'check.db')}"
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import database
+    import migrations
+    import simulator
+    import storage
+    from models import Equipment
+
+    migrations.migrate(simulator.TICK_SECONDS)
+    eids = [f"M{i}" for i in range(1, args.machines + 1)] + ["A/B 1%"]
+    db = database.SessionLocal()
+    db.add_all(Equipment(equipment_id=eid, status="RUN", production=0, efficiency=0.0) for eid in eids + ["EMPTY"])
+    db.commit()
+
+    # 小 chunk：多測幾次 chunk 寫滿換新
+    stores = [storage.SQLiteStore(), storage.ColumnarStore(os.path.join(work, "tsdata"), chunk_rows=64)]
+    end = dt.datetime.utcnow().replace(microsecond=0)
+    ticks = make_ticks(eids, end - dt.timedelta(hours=args.hours), end, args.seed)
+    split = len(ticks) * 2 // 3
+    write(stores, db, ticks[split:-20], batch_rows=500)     # 先寫較晚的一段
+    write(stores, db, ticks[:split], batch_rows=5000)       # 再回填較早的（時間倒退）
+    for tick in ticks[-20:]:                                # 最後逐 tick 寫入（同即時模式）
+        write(stores, db, [tick], batch_rows=10**9)
+    print(f"{len(eids)} 台設備、{len(ticks)} 個 tick、{sum(len(r) for _, r in ticks):,} 筆")
+
+    failed = compare("寫入後", stores, db, ticks, eids)
+
+    # 重新開啟欄式儲存（沒有快取、寫入端從檔案接續），再寫一個 tick
+    stores[1] = storage.ColumnarStore(stores[1].root, chunk_rows=64)
+    extra = make_ticks(eids, end, end + TICK, args.seed + 1)
+    write(stores, db, extra, batch_rows=10**9)
+    ticks += extra
+    failed += compare("重新開啟後", stores, db, ticks, eids)
+
+    dropped = [store.drop_expired(db, end, days=0) for store in stores]   # 只留今天
+    db.commit()
+    if len(dropped[0]) != len(dropped[1]) or not dropped[0]:
+        failed += 1
+        print(f"  ❌ drop_expired：SQLite 刪了 {dropped[0]}，欄式刪了 {dropped[1]}")
+    cutoff = dt.datetime.combine(end.date(), dt.time.min)
+    failed += compare(f"刪除 {len(dropped[0])} 天後", stores, db, [t for t in ticks if t[0] >= cutoff], eids)
+
+    db.close()
+    database.engine.dispose()
+    database.read_engine.dispose()
+    shutil.rmtree(work, ignore_errors=True)
+    print("兩個後端完全一致" if not failed else f"❌ {failed} 項不一致")
+    sys.exit(1 if failed else 0)
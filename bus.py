@@ -0,0 +1,320 @@
+# bus.py
+# 多 worker 部署用的 pub/sub + 快取層：
+#   寫入端（simulator.py 或行程內模擬器）commit 後把 tick 發佈出去，每個 uvicorn worker 都訂閱，
+#   直接更新自己的 state_cache → /api/summary、realtime 圖表、即時推播都不必各自輪詢 DB
+# 後端由 BUS_URL 決定（寫入端與所有 worker 要設成一樣）：
+#   memory://（預設）           行程內：單一 worker，或行程內模擬器（SIMULATOR_INPROCESS=1）
+#   unix:///tmp/sfm-bus.sock    同一台機器上的 Unix socket 中繼，先用 python bus.py serve 啟動
+# 中繼替每個 channel 編流水號並保留最近 RETAIN 則（快取）：worker 斷線重連時從上次的流水號補送，
+# 補不上（中繼重啟、落後太多）就通知 worker 回 DB 重新同步。DB 仍是唯一的真實來源，匯流排只負責通知；
+# 其他後端（例如 Redis pub/sub）實作同樣的 subscribe / publish / start / stop 即可
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+BUS_URL = os.environ.get("BUS_URL", "memory://")
+TICKS = "ticks"          # 資料：[[ [equipment_id, ts(ISO), status, production, efficiency], ... ] 每個 tick 一組]
+FLEET = "fleet"          # 設備清單有異動（資料為 None）
+ALERTS = "alerts"        # 規則告警：[events.query_events 格式的 dict]
+
+RETAIN = 1000            # 中繼每個 channel 保留幾則給重連的 worker 補送
+MAX_BUFFER = 8 << 20     # 中繼對單一 worker 積壓超過這麼多 bytes 就斷線，讓它重連補送或重新同步
+LIVE_SECONDS = 15.0      # 這麼久沒收到 tick 就當作匯流排沒在動（例如寫入端沒接上），API 回到頻繁查 DB
+RECONNECT_SECONDS = 1.0
+
+_last_tick = None        # 最近一次收到 tick 的時間（monotonic）
+
+
+def _dumps(obj) -> bytes:
+    return (json.dumps(obj, separators=(",", ":"), ensure_ascii=False) + "\n").encode()
+
+
+def _deliver(callbacks, channel, data):
+    global _last_tick
+    if channel == TICKS:
+        _last_tick = time.monotonic()
+    for callback in callbacks:
+        try:
+            callback(data)
+        except Exception as e:   # 單一訂閱者失敗不影響其他人
+            print(f"[bus] {channel} subscriber failed: {e!r}")
+
+
+# ====== 後端：行程內 ======
+class MemoryBus:
+    def __init__(self):
+        self._subs = {}      # channel → {callback: 訂閱時所在的 event loop}
+
+    def subscribe(self, channel, callback):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        self._subs.setdefault(channel, {})[callback] = loop
+
+    def publish(self, channel, data):
+        for callback, loop in list(self._subs.get(channel, {}).items()):
+            # callback 一律在訂閱者的 event loop 執行（asyncio.Event 等不是 thread-safe）
+            if loop is None or loop.is_closed() or _running_loop() is loop:
+                _deliver([callback], channel, data)
+            else:
+                loop.call_soon_threadsafe(_deliver, [callback], channel, data)
+
+    async def start(self, on_resync):
+        pass
+
+    async def stop(self):
+        pass
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+# ====== 後端：Unix socket 中繼的用戶端 ======
+class UnixBus:
+    """
+    發佈：同步的 socket（寫入端不一定有 event loop），送出即返回，不等中繼回應
+    訂閱：event loop 裡的背景 task，斷線自動重連；收到的流水號不連續就呼叫 on_resync
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._subs = {}          # channel → [callback]
+        self._sock = None
+        self._lock = threading.Lock()
+        self._warned = False
+        self._task = None
+        self._epoch = None       # 中繼這次啟動的識別碼（重啟後流水號從頭算）
+        self._seq = {}           # channel → 已收到的最後一個流水號
+        self._on_resync = None
+        self._hello = None
+
+    def subscribe(self, channel, callback):
+        callbacks = self._subs.setdefault(channel, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def publish(self, channel, data):
+        line = _dumps({"op": "pub", "ch": channel, "data": data})
+        with self._lock:
+            for _ in range(2):   # 中繼重啟過：舊連線寫入失敗 → 重連一次
+                try:
+                    if self._sock is None:
+                        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        self._sock.settimeout(1.0)
+                        self._sock.connect(self.path)
+                    self._sock.sendall(line)
+                    self._warned = False
+                    return
+                except OSError as e:
+                    error = e
+                    if self._sock is not None:
+                        self._sock.close()
+                        self._sock = None
+            if not self._warned:   # DB 已經寫入了；worker 收不到通知時會回到定期查 DB
+                print(f"[bus] 無法發佈到 {self.path}：{error!r}")
+                self._warned = True
+
+    async def start(self, on_resync):
+        """開始訂閱；等第一次連上（最多 2 秒），之後發佈的 tick 一定收得到"""
+        self._on_resync = on_resync
+        self._hello = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._listen())
+        try:
+            await asyncio.wait_for(self._hello.wait(), timeout=2)
+        except asyncio.TimeoutError:
+            print(f"[bus] 連不上 {self.path}，先以查 DB 運作並持續重試")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+    async def _listen(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_BUFFER)
+            except OSError:
+                await asyncio.sleep(RECONNECT_SECONDS)
+                continue
+            try:
+                writer.write(_dumps({"op": "sub", "ch": list(self._subs), "epoch": self._epoch, "after": self._seq}))
+                await writer.drain()
+                while line := await reader.readline():
+                    self._handle(json.loads(line))
+            except (OSError, ValueError) as e:
+                print(f"[bus] 與中繼的連線中斷：{e!r}")
+            finally:
+                writer.close()
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    def _handle(self, msg):
+        if "epoch" in msg:   # 連上後中繼先回 hello；接著是補送的訊息
+            self._epoch = msg["epoch"]
+            if msg.get("resync"):
+                self._resync()
+            self._hello.set()
+            return
+        channel, seq = msg["ch"], msg["seq"]
+        last = self._seq.get(channel)
+        self._seq[channel] = seq
+        if last is not None and seq != last + 1:
+            self._resync()
+        _deliver(self._subs.get(channel, ()), channel, msg.get("data"))
+
+    def _resync(self):
+        self._seq.clear()
+        if self._on_resync is not None:
+            self._on_resync()
+
+
+# ====== 中繼（python bus.py serve） ======
+class Hub:
+    def __init__(self, retain: int = RETAIN):
+        self.epoch = uuid.uuid4().hex
+        self.seq = {}            # channel → 最新流水號
+        self.retained = {}       # channel → deque[(seq, 已編碼的一行)]
+        self.retain = retain
+        self.subscribers = {}    # writer → 訂閱的 channel
+
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                msg = json.loads(line)
+                if msg["op"] == "pub":
+                    self.publish(msg["ch"], msg.get("data"))
+                elif msg["op"] == "sub":
+                    self.subscribe(writer, msg)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[hub] 連線錯誤：{e!r}")
+        finally:
+            self.subscribers.pop(writer, None)
+            writer.close()
+
+    def publish(self, channel, data):
+        seq = self.seq[channel] = self.seq.get(channel, 0) + 1
+        line = _dumps({"ch": channel, "seq": seq, "data": data})
+        self.retained.setdefault(channel, deque(maxlen=self.retain)).append((seq, line))
+        for writer, channels in list(self.subscribers.items()):
+            if channel not in channels:
+                continue
+            if writer.transport.get_write_buffer_size() > MAX_BUFFER:   # 卡住的 worker
+                print("[hub] 訂閱者積壓過多，斷線")
+                self.subscribers.pop(writer, None)
+                writer.close()
+                continue
+            writer.write(line)
+
+    def subscribe(self, writer, msg):
+        """先回 hello，再補送 after 之後保留著的訊息；補不齊就要對方重新同步"""
+        channels = set(msg["ch"])
+        after = msg.get("after") or {}
+        resync = msg.get("epoch") is not None and msg["epoch"] != self.epoch
+        replay = []
+        if not resync:
+            for channel in channels:
+                last = after.get(channel)
+                if last is None:
+                    continue
+                kept = self.retained.get(channel, ())
+                if last > self.seq.get(channel, 0) or (last < self.seq.get(channel, 0) and kept[0][0] > last + 1):
+                    resync = True
+                    break
+                replay.extend((seq, line) for seq, line in kept if seq > last)
+        writer.write(_dumps({"epoch": self.epoch, "resync": resync}))
+        if not resync:
+            for _, line in sorted(replay):
+                writer.write(line)
+        self.subscribers[writer] = channels
+
+
+async def serve(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+    hub = Hub()
+    server = await asyncio.start_unix_server(hub.handle, path=path, limit=MAX_BUFFER)
+    print(f"🔌 匯流排中繼：unix://{path}")
+    async with server:
+        await server.serve_forever()
+
+
+# ====== 對外介面 ======
+def _backend(url: str):
+    if url.startswith("unix://"):
+        return UnixBus(url[len("unix://"):])
+    if url in ("", "memory://"):
+        return MemoryBus()
+    raise ValueError(f"不支援的 BUS_URL：{url!r}")
+
+
+_bus = _backend(BUS_URL)
+
+
+def subscribe(channel: str, callback):
+    """callback(data) 在 event loop 執行緒呼叫，不能阻塞；同一個 callback 重複訂閱只算一次"""
+    _bus.subscribe(channel, callback)
+
+
+def publish(channel: str, data):
+    _bus.publish(channel, data)
+
+
+async def start(on_resync):
+    """在 FastAPI startup 呼叫；on_resync() 在可能漏掉訊息時呼叫（應從 DB 重建快取）"""
+    await _bus.start(on_resync)
+
+
+async def stop():
+    await _bus.stop()
+
+
+def live() -> bool:
+    """最近有沒有從匯流排收到 tick（有的話快取靠通知更新，不必頻繁查 DB）"""
+    return _last_tick is not None and time.monotonic() - _last_tick < LIVE_SECONDS
+
+
+def publish_ticks(ticks):
+    """ticks: [[simulator 的 row dict]]（寫入端 commit 後呼叫）"""
+    publish(TICKS, [[[r["equipment_id"], r["ts"].isoformat(), r["status"], r["production"], r["efficiency"]]
+                     for r in rows] for rows in ticks])
+
+
+def publish_alerts(fired):
+    """fired: alerts.AlertEngine.evaluate 的結果（寫入端 commit 後呼叫）"""
+    publish(ALERTS, [{"equipment_id": a["equipment_id"], "type": a["rule"], "ts": a["ts"].isoformat(),
+                      "value": a["value"], "threshold": a["threshold"]} for a in fired])
+
+
+def decode_ticks(data):
+    """publish_ticks 的反向：回傳 [[row dict]]（與 state_cache.apply_ticks 的輸入相同）"""
+    return [[{"equipment_id": eid, "ts": dt.datetime.fromisoformat(ts), "status": status,
+              "production": production, "efficiency": efficiency}
+             for eid, ts, status, production, efficiency in rows] for rows in data]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="多 worker 部署用的匯流排中繼")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve", help="啟動 Unix socket 中繼")
+    s.add_argument("--path", default=BUS_URL[len("unix://"):] if BUS_URL.startswith("unix://") else "/tmp/sfm-bus.sock")
+    args = ap.parse_args()
+    try:
+        asyncio.run(serve(args.path))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,89 @@
+# columnar.py
+# /api/metrics 的精簡格式（?format=columnar / ?format=binary）：
+#   時間軸共用一條（epoch 秒，基準值 + 相鄰差值），每台設備一條與時間軸對齊的產量陣列，
+#   不再每個點重複 {"ts": "...ISO...", "production": n}
+# 產量陣列以 -1 表示該時間點沒有資料（產量不會是負數）
+import json
+import struct
+
+import numpy as np
+
+MISSING = -1
+BINARY_MAGIC = b"SFC1"
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+
+def build_columns(rows):
+    """
+    rows: [(equipment_id, ts, production)]（任意順序）
+    回傳 (ts_epoch[int64], total[int64], equipment[list], production[int64, 設備 × 時間點])
+    """
+    if not rows:
+        return (np.zeros(0, np.int64), np.zeros(0, np.int64), [],
+                np.zeros((0, 0), np.int64))
+    eids, ts, prod = zip(*rows)
+    prod = np.array(prod, dtype=np.int64)
+
+    # 先在 Python 端用 dict 分組（hash datetime / str 很便宜），
+    # 只把不重複的時間點轉成 datetime64；整批轉換在 10 萬筆以上會慢一個數量級
+    ts_keys = sorted(set(ts))                                         # 依時間升冪
+    equipment = sorted(set(eids))
+    ts_pos = {t: i for i, t in enumerate(ts_keys)}
+    eq_pos = {e: i for i, e in enumerate(equipment)}
+    ts_idx = np.fromiter(map(ts_pos.__getitem__, ts), np.intp, len(ts))
+    eq_idx = np.fromiter(map(eq_pos.__getitem__, eids), np.intp, len(eids))
+    ts_us = np.array(ts_keys, dtype="datetime64[us]").astype(np.int64)
+
+    total = np.bincount(ts_idx, weights=prod, minlength=len(ts_keys)).astype(np.int64)
+    production = np.full((len(equipment), len(ts_keys)), MISSING, dtype=np.int64)
+    production[eq_idx, ts_idx] = prod
+    return ts_us // 1_000_000, total, equipment, production
+
+
+def _delta(ts_epoch):
+    if len(ts_epoch) == 0:
+        return 0, ts_epoch
+    return int(ts_epoch[0]), np.diff(ts_epoch, prepend=ts_epoch[0])
+
+
+def to_json(rows, resolution: str, now_epoch: int):
+    """?format=columnar 的 JSON 內容；沒資料時與舊格式一樣回一個 0 的點"""
+    ts_epoch, total, equipment, production = build_columns(rows)
+    if len(ts_epoch) == 0:
+        ts_epoch, total = np.array([now_epoch]), np.array([0])
+    base, delta = _delta(ts_epoch)
+    return {
+        "format": "columnar",
+        "resolution": resolution,
+        "ts_base": base,
+        "ts_delta": delta.tolist(),
+        "total": total.tolist(),
+        "equipment": equipment,
+        "production": production.tolist(),
+    }
+
+
+def to_binary(rows, resolution: str, now_epoch: int) -> bytes:
+    """
+    ?format=binary：前端可直接用 TypedArray 讀，不必 JSON.parse 大陣列。little-endian：
+      "SFC1" | u32 header 長度 | header JSON（補空白到 8 的倍數）
+      | i32[n] ts_delta（補到 8 的倍數）| f64[n] total | i32[設備數 × n] production（逐台）
+    header: {"resolution", "ts_base", "n", "equipment"}
+    """
+    ts_epoch, total, equipment, production = build_columns(rows)
+    if len(ts_epoch) == 0:
+        ts_epoch, total = np.array([now_epoch]), np.array([0])
+    base, delta = _delta(ts_epoch)
+    n = len(ts_epoch)
+
+    header = json.dumps({"resolution": resolution, "ts_base": base, "n": n, "equipment": equipment},
+                        ensure_ascii=False).encode()
+    header += b" " * (-len(header) % 8)
+    ts_bytes = delta.astype("<i4").tobytes()
+    ts_bytes += b"\0" * (-len(ts_bytes) % 8)
+    return b"".join([
+        BINARY_MAGIC, struct.pack("<I", len(header)), header,
+        ts_bytes,
+        total.astype("<f8").tobytes(),
+        production.astype("<i4").tobytes(),
+    ])
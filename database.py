@@ -1,15 +1,70 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-# SQLite 檔案在專案根目錄
-SQLALCHEMY_DATABASE_URL = "sqlite:///./database.db"
+import instrumentation
+
+# SQLite 檔案在專案根目錄（可用環境變數 DATABASE_URL 改路徑，例如 benchmark 用暫存檔）
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./database.db")
+
+# WAL：寫入（simulator）與讀取（API）互不阻塞；設 SQLITE_JOURNAL_MODE=DELETE 可退回預設模式做比較
+JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL").upper()
+
+# 每條連線建立時套用的 pragma
+PRAGMAS = {
+    "synchronous": "NORMAL",     # WAL 下只在 checkpoint 時 fsync，斷電最多掉最後幾筆 transaction
+    "busy_timeout": 5000,        # 遇到鎖先等 5 秒，不直接丟 "database is locked"
+    "cache_size": -64000,        # 每條連線 64 MB page cache（負值單位為 KiB）
+    "mmap_size": 268435456,      # 256 MB 記憶體映射讀取
+    "temp_store": "MEMORY",
+}
+
+
+def _configure(engine, read_only: bool):
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        if not read_only:
+            # journal_mode 會寫進 DB 檔，由寫入端設定一次即可
+            cur.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+        for key, value in PRAGMAS.items():
+            cur.execute(f"PRAGMA {key}={value}")
+        if read_only:
+            cur.execute("PRAGMA query_only=ON")
+        cur.close()
+
 
 # check_same_thread=False 讓多執行緒安全地共享連線（FastAPI + 背景執行）
+# 寫入用：simulator、設備 CRUD、migration（SQLite 同時只能有一個寫入者，連線不必多）
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+    pool_size=2, max_overflow=2,
 )
+_configure(engine, read_only=False)
+
+# 唯讀用：API 查詢；WAL 下讀取看的是快照，不會被寫入擋住
+read_engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False},
+    pool_size=8, max_overflow=8,
+)
+_configure(read_engine, read_only=True)
+
+# 非同步唯讀（aiosqlite）：async 端點用，等 DB 時不佔 FastAPI 的 threadpool
+ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+async_read_engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=8, max_overflow=8, pool_timeout=120)
+_configure(async_read_engine.sync_engine, read_only=True)
+
+# 每筆 SQL 計時 / 計數（/api/debug/metrics、Server-Timing）
+for _eng in (engine, read_engine, async_read_engine.sync_engine):
+    instrumentation.instrument_engine(_eng)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # FastAPI 依賴：每請求產生一個 DB session
@@ -19,3 +74,22 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# 只讀的 API 用這個，跟寫入端分開連線池
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# async 端點用
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+# 在獨立的 async session 裡執行同步查詢函式 fn(db, ...)；
+# 彼此無關的查詢各開一條連線，用 asyncio.gather 同時送出
+async def run_read(fn, *args, **kwargs):
+    async with AsyncReadSessionLocal() as db:
+        return await db.run_sync(fn, *args, **kwargs)
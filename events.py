@@ -0,0 +1,131 @@
+# events.py
+# ERROR 進出事件 / 維修區段：寫入端偵測到狀態變化時就記錄，
+# /api/alerts 與 /api/maintenance 只做索引範圍查詢
+import datetime as dt
+
+from sqlalchemy import delete, func, or_, update, bindparam, cast, Integer
+from sqlalchemy.orm import Session
+
+from models import StatusEvent, ErrorWindow
+import partitions
+
+
+def record_transitions(db: Session, transitions):
+    """
+    寫入端呼叫（不 commit，跟原始資料同一個 transaction）
+    transitions: [(equipment_id, ts, new_status)]，只放「進入或離開 ERROR」的那一筆，依時間先後
+      進入 ERROR → ERROR_START + 開一個維修區段
+      離開 ERROR → ERROR_END + 關掉該設備進行中的區段
+    """
+    if not transitions:
+        return
+    db.execute(StatusEvent.__table__.insert(), [
+        {"equipment_id": eid, "ts": ts, "type": "ERROR_START" if st == "ERROR" else "ERROR_END"}
+        for eid, ts, st in transitions
+    ])
+
+    win = ErrorWindow.__table__
+    close_stmt = (
+        update(win)
+        # 只關 ts 之前開始的區段：回填較早的歷史時，不會動到即時資料進行中的區段
+        .where(win.c.equipment_id == bindparam("b_eid"), win.c.end_ts.is_(None), win.c.start_ts < bindparam("b_ts"))
+        .values(end_ts=bindparam("b_ts"),
+                duration_sec=cast(func.round((func.julianday(bindparam("b_ts")) -
+                                              func.julianday(win.c.start_ts)) * 86400), Integer))
+    )
+    # 同一批裡同一台可能先進後出，依序執行
+    for eid, ts, st in transitions:
+        if st == "ERROR":
+            db.execute(win.insert(), {"equipment_id": eid, "start_ts": ts, "end_ts": None})
+        else:
+            db.execute(close_stmt, {"b_eid": eid, "b_ts": ts})
+
+
+def open_windows(db: Session):
+    """進行中的維修區段 {equipment_id: start_ts}（寫入端重啟時接續用）"""
+    return dict(db.query(ErrorWindow.equipment_id, ErrorWindow.start_ts).filter(ErrorWindow.end_ts.is_(None)).all())
+
+
+def query_events(db: Session, since: dt.datetime, limit: int = None):
+    """since 之後的 ERROR_START / ERROR_END（新到舊）"""
+    q = (
+        db.query(StatusEvent.equipment_id, StatusEvent.type, StatusEvent.ts)
+        .filter(StatusEvent.ts >= since)
+        .order_by(StatusEvent.ts.desc(), StatusEvent.id.desc())
+    )
+    if limit:
+        q = q.limit(limit)
+    return [{"equipment_id": eid, "type": typ, "ts": ts.isoformat()} for eid, typ, ts in q.all()]
+
+
+def query_windows(db: Session, since: dt.datetime, now: dt.datetime = None):
+    """
+    與 since 之後有交集的維修區段（新到舊）。
+    since 之前就已開始的區段，start 以 since 為近似（與舊版掃描的行為相同）。
+    """
+    now = now or dt.datetime.utcnow()
+    rows = (
+        db.query(ErrorWindow.equipment_id, ErrorWindow.start_ts, ErrorWindow.end_ts)
+        .filter(or_(ErrorWindow.end_ts >= since, ErrorWindow.end_ts.is_(None)))
+        .filter(ErrorWindow.start_ts <= now)
+        .all()
+    )
+    windows = []
+    for eid, start, end in rows:
+        start = max(start, since)
+        windows.append({
+            "equipment_id": eid,
+            "start_ts": start.isoformat(),
+            "end_ts": end.isoformat() if end else None,
+            "duration_sec": int(((end or now) - start).total_seconds()),
+            "ongoing": end is None,
+        })
+    windows.sort(key=lambda x: x["start_ts"], reverse=True)
+    return windows
+
+
+def build_error_events_and_windows(db: Session, since: dt.datetime):
+    """回傳 (events, windows)，格式同舊版 app.build_error_events_and_windows"""
+    return query_events(db, since), query_windows(db, since)
+
+
+def backfill_from_metrics(db: Session, batch: int = 50_000):
+    """
+    一次性：從保留中的原始資料重建 status_events / error_windows（會先清空兩張表）。
+    分表依時間先後、表內依 (equipment_id, ts) 串流讀取，記憶體用量與資料量無關。
+    """
+    db.execute(delete(StatusEvent.__table__))
+    db.execute(delete(ErrorWindow.__table__))
+
+    pending, last_status, n = [], {}, 0
+    for m in partitions.overlapping(db):
+        rows = (
+            db.query(m.c.equipment_id, m.c.ts, m.c.status)
+            .order_by(m.c.equipment_id.asc(), m.c.ts.asc())
+            .yield_per(batch)
+        )
+        for eid, ts, st in rows:
+            if (last_status.get(eid) == "ERROR") != (st == "ERROR"):
+                pending.append((eid, ts, st))
+            last_status[eid] = st
+            n += 1
+    # 讀完再寫，避免串流讀取中途寫入同一個連線（跨分表的事件順序依時間排好）
+    pending.sort(key=lambda x: x[1])
+    record_transitions(db, pending)
+    db.commit()
+    return n, len(pending)
+
+
+if __name__ == "__main__":
+    # 一次性回填：python events.py
+    from database import SessionLocal
+    from simulator import TICK_SECONDS
+    import migrations
+
+    migrations.migrate(TICK_SECONDS)
+    db = SessionLocal()
+    try:
+        n, k = backfill_from_metrics(db)
+        print(f"✅ 掃描 {n:,} 筆狀態資料，寫入 {k:,} 個 ERROR 事件")
+    finally:
+        db.close()
@@ -0,0 +1,119 @@
+# export.py
+# /api/export：原始資料（各日分表）匯出成 csv / ndjson / parquet，邊讀邊送
+#   - 讀取由 storage.scan 負責：SQLite 是一條唯讀連線、一個 transaction 依序讀完各分表
+#     （WAL 快照，匯出中途新寫入的資料不會混進來）；欄式後端以 HEAD 為準，逐個時間窗讀
+#   - 每次只取 BATCH_ROWS 筆、編碼完就交給 StreamingResponse，記憶體用量與區間長短無關
+#   - ts 直接以字串輸出，不經 datetime 轉換；每秒可輸出數十萬筆
+# parquet 需要 pyarrow（選用）：每批寫成一個 row group，寫完就送出
+import csv
+import io
+import json
+
+from database import ReadSessionLocal
+import storage
+
+try:
+    import pyarrow as pa       # 選用
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+BATCH_ROWS = 10000
+COLUMNS = ("ts", "equipment_id", "status", "production", "efficiency")
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def available(fmt: str) -> bool:
+    return fmt in FORMATS and (fmt != "parquet" or pq is not None)
+
+
+def iter_batches(since, until, equipment=None, batch_rows: int = BATCH_ROWS):
+    """[since, until) 的原始資料，依 (ts, equipment_id) 升冪，每次 yield 最多 batch_rows 筆 tuple（欄位同 COLUMNS）"""
+    with ReadSessionLocal() as db:
+        yield from storage.scan(db, since, until, equipment, batch_rows)
+
+
+def _cached(fn):
+    """設備 ID / 狀態只有少數幾種，逸出（quote）的結果重複使用"""
+    memo = {}
+    def get(s):
+        v = memo.get(s)
+        if v is None:
+            v = memo[s] = fn(s)
+        return v
+    return get
+
+
+def _csv_quote(s: str) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="").writerow([s])
+    return buf.getvalue()
+
+
+# 每列直接用 f-string 組（比 csv.writer.writerows 快約一倍）；字串欄位照 csv 規則逸出
+def encode_csv(batches):
+    q = _cached(_csv_quote)
+    yield (",".join(COLUMNS) + "\n").encode()
+    for batch in batches:
+        yield "".join([
+            f"{ts},{q(eid)},{q(st)},{prod},{eff!r}\n" for ts, eid, st, prod, eff in batch
+        ]).encode()
+
+
+def encode_ndjson(batches):
+    q = _cached(lambda s: json.dumps(s, ensure_ascii=False))
+    for batch in batches:
+        yield "".join([
+            f'{{"ts":"{ts}","equipment_id":{q(eid)},"status":{q(st)},"production":{prod},"efficiency":{eff!r}}}\n'
+            for ts, eid, st, prod, eff in batch
+        ]).encode()
+
+
+class _Sink(io.RawIOBase):
+    """給 ParquetWriter 寫的假檔案：收下的 bytes 暫存，由 drain() 取走；tell() 回累計位置（footer 的 offset 要用）"""
+
+    def __init__(self):
+        self.chunks = []
+        self.pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self.chunks)
+        self.chunks.clear()
+        return out
+
+
+def encode_parquet(batches):
+    schema = pa.schema([("ts", pa.timestamp("us")), ("equipment_id", pa.string()), ("status", pa.string()),
+                        ("production", pa.int64()), ("efficiency", pa.float64())])
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for batch in batches:
+            ts, eids, status, production, efficiency = zip(*batch)
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(ts).cast(pa.timestamp("us")), pa.array(eids), pa.array(status),
+                 pa.array(production, pa.int64()), pa.array(efficiency, pa.float64())], schema=schema))
+            yield sink.drain()
+    yield sink.drain()   # footer
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson, "parquet": encode_parquet}
+
+
+def stream(fmt: str, since, until, equipment=None):
+    """回傳 bytes 的 generator（同步；StreamingResponse 會在 threadpool 逐塊取用）"""
+    return ENCODERS[fmt](iter_batches(since, until, equipment))
@@ -0,0 +1,110 @@
+# ingest.py
+# 行程內模擬器（選用，SIMULATOR_INPROCESS=1）：模擬器以 asyncio 背景 task 跑在 FastAPI 裡，不必另開 simulator.py
+#   模擬 task：對齊牆上時鐘的 TICK_SECONDS 邊界產生一個 tick（不是「做完再 sleep」，不會越跑越慢），丟進佇列
+#   寫入 task：把佇列裡累積的 tick 合成一個 transaction 寫進 DB，commit 後發佈到匯流排（bus.py，由 persist_ticks 發佈）
+# 同一個 DB 同時只能有一個寫入者：開這個模式時不要再另外跑 simulator.py；多 worker 時只能有一個 worker 開
+import asyncio
+import datetime as dt
+import os
+import time
+
+from database import SessionLocal
+import instrumentation
+import simulator
+
+ENABLED = os.environ.get("SIMULATOR_INPROCESS", "").lower() in ("1", "true", "yes")
+QUEUE_MAXSIZE = 100     # 寫入端卡住時最多積壓幾個 tick，滿了模擬端就等（背壓）
+MAX_BATCH_TICKS = 20    # 一個 transaction 最多寫幾個 tick
+RETRY_SECONDS = 0.5     # 寫入失敗後第一次重試的等待秒數，之後加倍
+MAX_RETRY_SECONDS = simulator.TICK_SECONDS
+
+_queue = None
+_tasks = []
+
+
+def next_boundary(now: float, period: float = simulator.TICK_SECONDS) -> float:
+    """now 之後（不含）的第一個 period 整數倍（epoch 秒）"""
+    return (now // period + 1) * period
+
+
+def _produce(now: dt.datetime):
+    with SessionLocal() as db:
+        rows, _ = simulator.next_tick(db, now)
+        return rows
+
+
+def _persist(ticks):
+    with SessionLocal() as db:
+        simulator.persist_ticks(db, ticks)
+
+
+async def _simulate():
+    boundary = next_boundary(time.time())
+    while True:
+        await asyncio.sleep(max(0.0, boundary - time.time()))
+        late = time.time() - boundary
+        if late >= simulator.TICK_SECONDS:   # 卡太久（例如 event loop 被擋住）：跳過錯過的 tick，不一次補一堆
+            skipped = int(late // simulator.TICK_SECONDS)
+            boundary += skipped * simulator.TICK_SECONDS
+            print(f"[simulator] 落後 {late:.1f}s，跳過 {skipped} 個 tick")
+
+        # tick 的時間就是邊界本身，資料時間間隔固定為 TICK_SECONDS
+        now = dt.datetime.fromtimestamp(boundary, dt.timezone.utc).replace(tzinfo=None)
+        t0 = time.perf_counter()
+        try:
+            rows = await asyncio.to_thread(_produce, now)
+        except Exception as e:  # 單一 tick 失敗不影響下一個
+            print(f"[simulator] tick failed: {e!r}")
+        else:
+            await _queue.put((rows, time.perf_counter() - t0))
+        boundary += simulator.TICK_SECONDS
+
+
+async def _write():
+    while True:
+        batch = [await _queue.get()]
+        while len(batch) < MAX_BATCH_TICKS and not _queue.empty():
+            batch.append(_queue.get_nowait())
+        ticks = [rows for rows, _ in batch]
+        t0 = time.perf_counter()
+        delay = RETRY_SECONDS
+        try:
+            # 失敗就重送同一批（persist_ticks 只在 commit 前失敗時丟例外，且已把記憶體狀態還原）：丟掉的話 ERROR 進出會永遠漏記；
+            # 重試期間佇列滿了模擬端就等（背壓）
+            while True:
+                try:
+                    await asyncio.to_thread(_persist, ticks)
+                    break
+                except Exception as e:
+                    print(f"[simulator] write failed ({len(ticks)} ticks), retry in {delay:.1f}s: {e!r}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, MAX_RETRY_SECONDS)
+            write_share = (time.perf_counter() - t0) / len(batch)
+            for _, produce_seconds in batch:
+                instrumentation.observe_tick(produce_seconds + write_share)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+async def start():
+    """在 FastAPI startup 呼叫：啟動模擬與寫入兩個背景 task"""
+    global _queue
+    _queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+    loop = asyncio.get_running_loop()
+    _tasks[:] = [loop.create_task(_simulate()), loop.create_task(_write())]
+
+
+async def stop():
+    """在 FastAPI shutdown 呼叫：停止產生新 tick，等佇列寫完再結束寫入 task"""
+    if not _tasks:
+        return
+    simulate_task, write_task = _tasks
+    simulate_task.cancel()
+    try:
+        await asyncio.wait_for(_queue.join(), timeout=10)
+    except asyncio.TimeoutError:
+        print(f"[simulator] 關閉時仍有 {_queue.qsize()} 個 tick 未寫入")
+    write_task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
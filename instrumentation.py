@@ -0,0 +1,147 @@
+# instrumentation.py
+# 行程內效能指標：每個路由的延遲分布、每請求的 SQL 筆數與 DB 時間、模擬器每個 tick 的耗時
+# 由 /api/debug/metrics 以 Prometheus 文字格式輸出；每個回應另帶 Server-Timing（瀏覽器 devtools 可看 DB / 其餘的拆分）
+import contextvars
+import threading
+import time
+
+from sqlalchemy import event
+
+# 秒；與 Prometheus client 預設的 bucket 相同
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """累積型 bucket（le 含等於），外加總和與次數"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value: float):
+        for i, le in enumerate(BUCKETS):
+            if value <= le:
+                self.counts[i] += 1
+        self.total += value
+        self.n += 1
+
+
+# ====== 內部狀態 ======
+# (method, route) → {"latency": Histogram, "queries": 累計 SQL 筆數, "db": 累計 DB 秒數}
+_routes = {}
+_tick = Histogram()          # simulator.generate_batch（模擬器跑在同一行程時才有值）
+_queries_total = 0           # 所有 SQL（含不屬於任何請求的背景工作）
+_db_seconds_total = 0.0
+_lock = threading.Lock()
+
+# 目前請求的統計 {"queries", "db"}；可變 dict，to_thread / threadpool / async session 複製 context 後仍指向同一份
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+# ====== SQLAlchemy hook ======
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    global _queries_total, _db_seconds_total
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    with _lock:
+        _queries_total += 1
+        _db_seconds_total += elapsed
+        if stats is not None:
+            stats["queries"] += 1
+            stats["db"] += elapsed
+
+
+def _error(context):
+    # 執行失敗時 after_cursor_execute 不會觸發，把起始時間丟掉
+    if context.connection is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+def instrument_engine(engine):
+    """掛上計時 hook（async engine 請傳 .sync_engine）；同一個 engine 只會掛一次"""
+    if not event.contains(engine, "before_cursor_execute", _before):
+        event.listen(engine, "before_cursor_execute", _before)
+        event.listen(engine, "after_cursor_execute", _after)
+        event.listen(engine, "handle_error", _error)
+
+
+# ====== 請求 ======
+async def track(request, call_next):
+    """HTTP middleware 本體：量整個請求，寫進路由的統計並加上 Server-Timing"""
+    stats = {"queries": 0, "db": 0.0}
+    token = _current.set(stats)
+    t0 = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _current.reset(token)
+    elapsed = time.perf_counter() - t0
+
+    route = request.scope.get("route")
+    key = (request.method, getattr(route, "path", None) or "unmatched")   # 用路由樣板，避免 path 參數炸開
+    with _lock:
+        entry = _routes.get(key)
+        if entry is None:
+            entry = _routes[key] = {"latency": Histogram(), "queries": 0, "db": 0.0}
+        entry["latency"].observe(elapsed)
+        entry["queries"] += stats["queries"]
+        entry["db"] += stats["db"]
+
+    # app = 扣掉 DB 之後的時間（組資料、序列化、壓縮…）；串流回應只量到開始送出為止
+    response.headers["Server-Timing"] = (
+        f'db;dur={stats["db"] * 1000:.1f};desc="{stats["queries"]} queries", '
+        f'app;dur={max(elapsed - stats["db"], 0) * 1000:.1f}, total;dur={elapsed * 1000:.1f}'
+    )
+    return response
+
+
+def observe_tick(seconds: float):
+    with _lock:
+        _tick.observe(seconds)
+
+
+# ====== 輸出 ======
+def _histogram_lines(name: str, labels: str, h: Histogram):
+    sep = "," if labels else ""
+    for le, count in zip(BUCKETS, h.counts):
+        yield f'{name}_bucket{{{labels}{sep}le="{le}"}} {count}'
+    yield f'{name}_bucket{{{labels}{sep}le="+Inf"}} {h.n}'
+    yield f"{name}_sum{{{labels}}} {h.total:.6f}" if labels else f"{name}_sum {h.total:.6f}"
+    yield f"{name}_count{{{labels}}} {h.n}" if labels else f"{name}_count {h.n}"
+
+
+def render() -> str:
+    """Prometheus text exposition format（0.0.4）"""
+    with _lock:
+        routes = sorted(_routes.items())
+        lines = [
+            "# HELP http_request_duration_seconds 每個路由的請求延遲",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, path), entry in routes:
+            lines.extend(_histogram_lines("http_request_duration_seconds",
+                                          f'method="{method}",route="{path}"', entry["latency"]))
+        lines += ["# HELP http_request_sql_queries_total 每個路由執行的 SQL 筆數",
+                  "# TYPE http_request_sql_queries_total counter"]
+        lines += [f'http_request_sql_queries_total{{method="{m}",route="{p}"}} {e["queries"]}'
+                  for (m, p), e in routes]
+        lines += ["# HELP http_request_db_seconds_total 每個路由花在 SQL 的時間",
+                  "# TYPE http_request_db_seconds_total counter"]
+        lines += [f'http_request_db_seconds_total{{method="{m}",route="{p}"}} {e["db"]:.6f}'
+                  for (m, p), e in routes]
+        lines += ["# HELP db_queries_total 全部 SQL 筆數（含背景工作）",
+                  "# TYPE db_queries_total counter",
+                  f"db_queries_total {_queries_total}",
+                  "# HELP db_query_seconds_total 全部 SQL 耗時（含背景工作）",
+                  "# TYPE db_query_seconds_total counter",
+                  f"db_query_seconds_total {_db_seconds_total:.6f}",
+                  "# HELP simulator_tick_duration_seconds 模擬器每個 tick（generate_batch）的耗時",
+                  "# TYPE simulator_tick_duration_seconds histogram"]
+        lines.extend(_histogram_lines("simulator_tick_duration_seconds", "", _tick))
+    return "\n".join(lines) + "\n"
+
@@ -0,0 +1,70 @@
+# live_stream.py
+# 即時推播（SSE）：單一背景 task 每秒檢查一次有沒有新 tick，
+# 有的話算一次增量、序列化一次，再丟給所有訂閱者 → DB 負載與開著的儀表板數量無關
+import asyncio
+import json
+
+POLL_SECONDS = 1.0      # 檢查新資料的頻率（模擬器 TICK 為 5 秒）
+QUEUE_MAXSIZE = 50      # 每個訂閱者最多積壓幾則，超過就改送 resync
+
+SUBSCRIBERS = set()
+_pump_task = None
+_wake = None            # notify() 設定後背景 task 不必等到下一輪輪詢
+
+
+def format_sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def subscribe() -> asyncio.Queue:
+    q = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+    SUBSCRIBERS.add(q)
+    return q
+
+
+def unsubscribe(q: asyncio.Queue):
+    SUBSCRIBERS.discard(q)
+
+
+def publish(payload: dict):
+    """序列化一次，發給所有訂閱者；塞不下的（太慢的瀏覽器）清空後改送 resync"""
+    msg = format_sse(payload)
+    for q in list(SUBSCRIBERS):
+        try:
+            q.put_nowait(msg)
+        except asyncio.QueueFull:
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(format_sse({"resync": True}))
+
+
+async def _pump(compute_tick):
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        if not SUBSCRIBERS:
+            continue
+        try:
+            payload = await asyncio.to_thread(compute_tick)
+        except Exception as e:  # 推播失敗不影響下一輪
+            print(f"[stream] compute failed: {e!r}")
+            continue
+        if payload:
+            publish(payload)
+
+
+def ensure_pump(compute_tick):
+    """第一個訂閱者連上時啟動背景 task（compute_tick: 同步函式，回傳 payload 或 None）"""
+    global _pump_task, _wake
+    if _pump_task is None or _pump_task.done():
+        _wake = asyncio.Event()
+        _pump_task = asyncio.get_running_loop().create_task(_pump(compute_tick))
+
+
+def notify():
+    """有新資料了（例如行程內模擬器剛寫完一批）：立刻算一次增量，不等輪詢"""
+    if _wake is not None:
+        _wake.set()
@@ -0,0 +1,105 @@
+# migrations.py
+# 簡易 schema 版本管理：版本號存在 SQLite 的 PRAGMA user_version，
+# 每個步驟只會執行一次（新 DB 與舊 DB 都從 0 開始往上跑；每步都可重複執行）
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import Session
+
+from database import Base, SessionLocal
+import models  # noqa: F401  註冊所有資料表
+import rollup
+import events
+
+
+def _create_tables(db: Session, tick_seconds: int):
+    # 新 DB：一次建好所有資料表與索引；舊 DB：只補缺的資料表
+    Base.metadata.create_all(bind=db.get_bind())
+
+
+def _metrics_indexes(db: Session, tick_seconds: int):
+    # 熱門查詢都是「某台設備 + 時間」→ (equipment_id, ts) 複合索引；
+    # 時間範圍查詢（趨勢圖、最近 N 個 tick）用涵蓋索引，不必回表
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_metrics_eqp_ts ON metrics (equipment_id, ts)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_metrics_ts_cover ON metrics (ts, equipment_id, production, status)"))
+    # 被上面兩個取代的舊單欄索引（主鍵本身就有索引）
+    for name in ("ix_metrics_equipment_id", "ix_metrics_ts", "ix_metrics_id"):
+        db.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    db.commit()
+
+    # 設備 ID 每個 tick 都會查 → 唯一索引；舊資料若已有重複 ID，退而建一般索引
+    try:
+        db.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_equipment_equipment_id ON equipment (equipment_id)"))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        print("⚠️ equipment 表有重複的設備 ID，改建一般索引（請手動清理重複設備）")
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_equipment_equipment_id ON equipment (equipment_id)"))
+
+
+def _has_metrics(db: Session) -> bool:
+    return db.execute(text("SELECT 1 FROM metrics LIMIT 1")).first() is not None
+
+
+def _backfill_rollups(db: Session, tick_seconds: int):
+    if _has_metrics(db) and db.execute(text("SELECT 1 FROM rollup_1m LIMIT 1")).first() is None:
+        print("⏳ 重建 rollup ...")
+        rollup.rebuild_rollups(db, tick_seconds)
+
+
+def _backfill_events(db: Session, tick_seconds: int):
+    if _has_metrics(db) and db.execute(text("SELECT 1 FROM status_events LIMIT 1")).first() is None:
+        print("⏳ 回填告警事件 / 維修區段 ...")
+        events.backfill_from_metrics(db)
+
+
+def _daily_rollup(db: Session, tick_seconds: int):
+    # 新增 1 天粒度（OEE 等長區間加總用），由既有的 1 小時彙總補滿
+    Base.metadata.create_all(bind=db.get_bind())
+    rollup.fill_tier_from_previous(db, "1d")
+
+
+# (版本, 說明, 函式)；只能往後加，不要改已發佈的步驟
+MIGRATIONS = [
+    (1, "建立資料表", _create_tables),
+    (2, "metrics 複合/涵蓋索引、equipment_id 唯一索引", _metrics_indexes),
+    (3, "由既有資料回填 rollup", _backfill_rollups),
+    (4, "由既有資料回填 status_events / error_windows", _backfill_events),
+    (5, "新增 rollup_1d，由 rollup_1h 回填", _daily_rollup),
+    (6, "新增 alerts（規則告警）", _create_tables),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(db: Session) -> int:
+    return db.execute(text("PRAGMA user_version")).scalar() or 0
+
+
+def migrate(tick_seconds: int, attempts: int = 5):
+    """
+    把 DB 升到最新版本（app 與 simulator 啟動時呼叫）。
+    多個 worker 同時啟動時會一起跑：別的行程正在做同一步（表已存在、DB 被鎖）就稍等、重讀版本再繼續
+    """
+    for attempt in range(attempts):
+        db = SessionLocal()
+        try:
+            version = current_version(db)
+            if version >= LATEST_VERSION:   # 已是最新（一般重啟都走這裡）
+                return
+            for ver, desc, fn in MIGRATIONS:
+                if ver <= version:
+                    continue
+                fn(db, tick_seconds)
+                db.execute(text(f"PRAGMA user_version = {ver}"))
+                db.commit()
+                print(f"[migrate] v{ver}: {desc}")
+            return
+        except DBAPIError as e:
+            db.rollback()
+            if attempt == attempts - 1:
+                raise
+            print(f"[migrate] 與其他行程衝突，重試：{e.orig!r}")
+            time.sleep(0.5 * (attempt + 1))
+        finally:
+            db.close()
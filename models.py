@@ -1,16 +1,23 @@
 import datetime as dt
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, UniqueConstraint
+from sqlalchemy.orm import declared_attr
 from database import Base
 
 # 生產數據 (歷史資料)
 class EquipmentMetric(Base):
     __tablename__ = "metrics"
-    id = Column(Integer, primary_key=True, index=True)
-    equipment_id = Column(String, index=True, nullable=False)
+    id = Column(Integer, primary_key=True)
+    equipment_id = Column(String, nullable=False)
     status = Column(String, nullable=False)
     production = Column(Integer, nullable=False)
     efficiency = Column(Float, nullable=False)
-    ts = Column(DateTime, default=dt.datetime.utcnow, index=True)
+    ts = Column(DateTime, default=dt.datetime.utcnow)
+
+    # 熱門查詢都是「某台設備 + 時間」或「時間範圍」（舊 DB 由 migrations.py 補建）
+    __table_args__ = (
+        Index("ix_metrics_eqp_ts", "equipment_id", "ts"),
+        Index("ix_metrics_ts_cover", "ts", "equipment_id", "production", "status"),
+    )
 
 # 設備清單 (持久化 CRUD)
 class Equipment(Base):
@@ -20,3 +27,75 @@ class Equipment(Base):
     status = Column(String, default="RUN")
     production = Column(Integer, default=0)
     efficiency = Column(Float, default=0.9)
+
+    __table_args__ = (
+        Index("ux_equipment_equipment_id", "equipment_id", unique=True),
+    )
+
+# ====== 彙總資料 (rollup) ======
+# 1 分 / 15 分 / 1 小時 / 1 天四種粒度；每個 bucket 一台設備一筆
+# production: bucket 內最後的累積產量（同一 UTC 日內單調遞增，故等於 MAX）
+# eff_sum / samples: 用來算平均效率；*_sec: 各狀態累計秒數
+class _RollupColumns:
+    id = Column(Integer, primary_key=True)
+    equipment_id = Column(String, nullable=False)
+    bucket_ts = Column(DateTime, nullable=False)
+    production = Column(Integer, nullable=False, default=0)
+    eff_min = Column(Float, nullable=False)
+    eff_max = Column(Float, nullable=False)
+    eff_sum = Column(Float, nullable=False, default=0.0)
+    samples = Column(Integer, nullable=False, default=0)
+    run_sec = Column(Integer, nullable=False, default=0)
+    idle_sec = Column(Integer, nullable=False, default=0)
+    error_sec = Column(Integer, nullable=False, default=0)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (
+            UniqueConstraint("equipment_id", "bucket_ts", name=f"uq_{cls.__tablename__}_eqp_bucket"),
+            Index(f"ix_{cls.__tablename__}_bucket", "bucket_ts"),
+        )
+
+class MetricRollup1m(_RollupColumns, Base):
+    __tablename__ = "rollup_1m"
+
+class MetricRollup15m(_RollupColumns, Base):
+    __tablename__ = "rollup_15m"
+
+class MetricRollup1h(_RollupColumns, Base):
+    __tablename__ = "rollup_1h"
+
+class MetricRollup1d(_RollupColumns, Base):
+    __tablename__ = "rollup_1d"     # UTC 日
+
+# ====== 狀態事件 / 維修區段（寫入端偵測 ERROR 進出時產生）======
+# 告警 / 維修紀錄直接做時間範圍查詢，不再每次掃描整段狀態歷史
+class StatusEvent(Base):
+    __tablename__ = "status_events"
+    id = Column(Integer, primary_key=True)
+    equipment_id = Column(String, nullable=False)
+    type = Column(String, nullable=False)          # ERROR_START / ERROR_END
+    ts = Column(DateTime, nullable=False, index=True)
+
+class ErrorWindow(Base):
+    __tablename__ = "error_windows"
+    id = Column(Integer, primary_key=True)
+    equipment_id = Column(String, nullable=False, index=True)
+    start_ts = Column(DateTime, nullable=False)
+    end_ts = Column(DateTime, nullable=True, index=True)   # NULL = 維修中
+    duration_sec = Column(Integer, nullable=True)
+
+# ====== 規則告警（alerts.py 的規則引擎在寫入端觸發）======
+class Alert(Base):
+    __tablename__ = "alerts"
+    id = Column(Integer, primary_key=True)
+    equipment_id = Column(String, nullable=False)
+    rule = Column(String, nullable=False)          # LOW_EFFICIENCY / ZERO_OUTPUT / MTTR_EXCEEDED / RATE_DRIFT
+    ts = Column(DateTime, nullable=False)
+    value = Column(Float, nullable=False)          # 觸發時的量測值（效率、產量、維修秒數、偏離比例）
+    threshold = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_alerts_ts", "ts"),
+        Index("ix_alerts_eqp_ts", "equipment_id", "ts"),
+    )
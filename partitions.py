@@ -0,0 +1,130 @@
+# partitions.py
+# 原始資料依 UTC 日分表（metrics_YYYYMMDD）＋保留期限：
+#   - 寫入端依 ts 寫進當天的分表（第一次用到時建立）
+#   - 超過保留天數的分表整張 DROP，不必對大表做 DELETE
+#   - 查詢端用 overlapping() 只挑與查詢區間有交集的分表
+# 舊版的單一 metrics 表視為一個「舊分表」，查詢照樣會讀到，整段過期後一併 DROP
+import os
+import re
+import datetime as dt
+
+from sqlalchemy import MetaData, Table, Index, func, text
+from sqlalchemy.orm import Session
+
+from models import EquipmentMetric
+
+# 原始資料保留天數（長區間趨勢讀 rollup，不受影響）
+RAW_RETENTION_DAYS = int(os.environ.get("RAW_RETENTION_DAYS", "7"))
+
+PREFIX = "metrics_"
+LEGACY = EquipmentMetric.__tablename__   # 舊版單表
+_NAME_RE = re.compile(r"^metrics_(\d{8})$")
+
+_metadata = MetaData()
+_tables = {}       # 分表名 → Table
+_created = set()   # 本行程已確認存在的分表
+
+
+def partition_name(day: dt.date) -> str:
+    return f"{PREFIX}{day:%Y%m%d}"
+
+
+def table(name: str) -> Table:
+    """分表的 Table 物件（欄位同 EquipmentMetric；索引名稱帶分表名，避免 SQLite 索引重名）"""
+    if name == LEGACY:
+        return EquipmentMetric.__table__
+    t = _tables.get(name)
+    if t is None:
+        cols = [c._copy() for c in EquipmentMetric.__table__.columns]
+        t = _tables[name] = Table(
+            name, _metadata, *cols,
+            Index(f"ix_{name}_eqp_ts", "equipment_id", "ts"),
+            Index(f"ix_{name}_ts_cover", "ts", "equipment_id", "production", "status"),
+        )
+    return t
+
+
+def for_day(db: Session, day: dt.date) -> Table:
+    """寫入端用：回傳該 UTC 日的分表，不存在就建立（跟寫入同一個 transaction）"""
+    name = partition_name(day)
+    t = table(name)
+    if name not in _created:
+        t.create(bind=db.connection(), checkfirst=True)
+        _created.add(name)
+    return t
+
+
+def list_partitions(db: Session):
+    """
+    回傳 [(start, end, Table)]（依時間升冪，end 不含）。
+    日分表的區間由名稱推得；舊版 metrics 表有資料時以 MIN/MAX(ts) 為區間（走 ts 索引）
+    """
+    names = db.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND (name = :legacy OR name LIKE 'metrics\\_%' ESCAPE '\\')"
+    ), {"legacy": LEGACY}).scalars().all()
+    out = []
+    for name in names:
+        if name == LEGACY:
+            m = EquipmentMetric.__table__
+            lo, hi = db.query(func.min(m.c.ts), func.max(m.c.ts)).one()
+            if lo is not None:
+                out.append((lo, hi + dt.timedelta(microseconds=1), m))
+            continue
+        match = _NAME_RE.match(name)
+        if match:
+            start = dt.datetime.strptime(match.group(1), "%Y%m%d")
+            out.append((start, start + dt.timedelta(days=1), table(name)))
+    out.sort(key=lambda p: p[0])
+    return out
+
+
+def overlapping(db: Session, since: dt.datetime = None, until: dt.datetime = None, newest_first=False):
+    """與 [since, until) 有交集的分表（None 表示不限）"""
+    tables = [t for start, end, t in list_partitions(db)
+              if (since is None or end > since) and (until is None or start < until)]
+    return tables[::-1] if newest_first else tables
+
+
+def earliest_ts(db: Session):
+    """目前保留中最早一筆原始資料的時間（沒資料回 None）"""
+    for _, _, t in list_partitions(db):
+        ts = db.query(func.min(t.c.ts)).scalar()
+        if ts is not None:
+            return ts
+    return None
+
+
+def drop_expired(db: Session, now: dt.datetime = None, days: int = RAW_RETENTION_DAYS):
+    """整張 DROP 早於 (今天 - days) 的分表；回傳被刪掉的分表名"""
+    now = now or dt.datetime.utcnow()
+    cutoff = dt.datetime.combine(now.date() - dt.timedelta(days=days), dt.time.min)
+    dropped = []
+    for _, end, t in list_partitions(db):
+        if end <= cutoff:
+            t.drop(bind=db.connection())
+            _created.discard(t.name)
+            dropped.append(t.name)
+    db.commit()
+    return dropped
+
+
+if __name__ == "__main__":
+    # 手動清理：python partitions.py [--days N]
+    import argparse
+    from database import SessionLocal
+    from simulator import TICK_SECONDS
+    import migrations
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=RAW_RETENTION_DAYS, help="原始資料保留天數")
+    args = ap.parse_args()
+
+    migrations.migrate(TICK_SECONDS)
+    db = SessionLocal()
+    try:
+        for start, end, t in list_partitions(db):
+            print(f"  {t.name:<18} {start:%Y-%m-%d %H:%M} ~ {end:%Y-%m-%d %H:%M}")
+        dropped = drop_expired(db, days=args.days)
+        print(f"✅ 刪除 {len(dropped)} 個過期分表" + (f"：{', '.join(dropped)}" if dropped else ""))
+    finally:
+        db.close()
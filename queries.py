@@ -0,0 +1,44 @@
+# queries.py
+# 共用的「每台設備最新一筆」查詢：逐台走 metrics (equipment_id, ts) 複合索引，
+# 不再對整張 metrics 做 GROUP BY + self-join
+import datetime as dt
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Equipment
+import partitions
+
+
+def _last_rows_in(db: Session, m, before, since):
+    fleet = select(Equipment.equipment_id.label("eid")).distinct().subquery()
+    last_id = select(m.c.id).where(m.c.equipment_id == fleet.c.eid)
+    if before is not None:
+        last_id = last_id.where(m.c.ts < before)
+    if since is not None:
+        last_id = last_id.where(m.c.ts >= since)
+    last_id = last_id.order_by(m.c.ts.desc()).limit(1).correlate(fleet).scalar_subquery()
+
+    return db.execute(
+        select(m.c.equipment_id, m.c.ts, m.c.production, m.c.status, m.c.efficiency)
+        .select_from(fleet)
+        .join(m, m.c.id == last_id)
+    ).all()
+
+
+def last_rows_per_equipment(db: Session, before: dt.datetime = None, since: dt.datetime = None):
+    """
+    回傳 {eid: (ts, production, status, efficiency)}：
+    每台設備（Equipment 表）在 [since, before) 之間最後一筆；沒資料的設備不會出現。
+    每台只做一次索引定位（ORDER BY ts DESC LIMIT 1），成本 ~ O(設備數 × log N)；
+    分表由新到舊查，所有設備都找到就停
+    """
+    out = {}
+    fleet_size = db.query(Equipment.equipment_id).distinct().count()
+    for m in partitions.overlapping(db, since, before, newest_first=True):
+        for eid, ts, prod, st, eff in _last_rows_in(db, m, before, since):
+            if eid not in out:
+                out[eid] = (ts, int(prod), st, eff)
+        if len(out) >= fleet_size:
+            break
+    return out
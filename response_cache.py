@@ -0,0 +1,110 @@
+# response_cache.py
+# API 回應快取：同一個網址（路徑 + 參數）在資料版本沒變時直接回上次算好的內容，
+# 並帶 ETag；瀏覽器帶 If-None-Match 且內容沒變就回 304（不帶 body）
+# 資料版本由 state_cache 提供：每讀入一批新資料（模擬器一個 tick）或設備增刪改就 +1
+# 壓縮後的內容也一起快取（gzip；有裝 brotli 時優先用 br），同一份資料不必每個請求重壓
+import asyncio
+import gzip
+import hashlib
+import time
+from collections import OrderedDict
+
+try:
+    import brotli   # 選用
+except ImportError:
+    brotli = None
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+MAX_ENTRIES = 256
+# 就算資料沒更新（例如模擬器停了），「最近 N 小時」這類視窗也會隨時間移動 → 最多沿用這麼久
+MAX_AGE_SECONDS = 5.0
+COMPRESS_MIN_BYTES = 1024
+
+# key → {"version", "created", "etag", "media_type", "bodies": {編碼: bytes}}
+_entries: "OrderedDict[str, dict]" = OrderedDict()
+# key → 正在計算中的 Future（同一個 key 同時只算一次，其餘請求等結果）
+_inflight = {}
+
+
+def cache_key(request: Request) -> str:
+    return request.url.path + "?" + "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+
+
+def _lookup(key: str, version: int):
+    entry = _entries.get(key)
+    if entry is None or entry["version"] != version or time.monotonic() - entry["created"] > MAX_AGE_SECONDS:
+        return None
+    _entries.move_to_end(key)
+    return entry
+
+
+def _store(key: str, version: int, payload, media_type: str):
+    body = payload if isinstance(payload, bytes) else JSONResponse(payload).body
+    # 弱 ETag：不同壓縮編碼的內容視為同一份
+    etag = 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+    entry = {"version": version, "created": time.monotonic(), "etag": etag,
+             "media_type": media_type, "bodies": {"identity": body}}
+    _entries[key] = entry
+    _entries.move_to_end(key)
+    while len(_entries) > MAX_ENTRIES:
+        _entries.popitem(last=False)
+    return entry
+
+
+def _encoded(entry, accept: str):
+    """依 Accept-Encoding 挑編碼，回傳 (編碼, body)；壓縮結果存回 entry"""
+    bodies = entry["bodies"]
+    if len(bodies["identity"]) < COMPRESS_MIN_BYTES:
+        return "identity", bodies["identity"]
+    if brotli is not None and "br" in accept:
+        enc = "br"
+    elif "gzip" in accept:
+        enc = "gzip"
+    else:
+        return "identity", bodies["identity"]
+    if enc not in bodies:
+        raw = bodies["identity"]
+        bodies[enc] = brotli.compress(raw, quality=5) if enc == "br" else gzip.compress(raw, compresslevel=6)
+    return enc, bodies[enc]
+
+
+def _respond(request: Request, entry):
+    etag = entry["etag"]
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}   # 可以存，但每次都要回來驗證
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    enc, body = _encoded(entry, request.headers.get("accept-encoding", ""))
+    if enc != "identity":
+        headers["Content-Encoding"] = enc
+    return Response(content=body, media_type=entry["media_type"], headers=headers)
+
+
+async def cached(request: Request, version: int, compute, media_type: str = "application/json"):
+    """
+    version: 目前的資料版本；compute: 無參數的 async 函式，
+    回傳可 JSON 化的內容，或已編碼好的 bytes（搭配 media_type）。
+    """
+    key = cache_key(request)
+    entry = _lookup(key, version)
+    if entry is None:
+        fut = _inflight.get(key)
+        if fut is not None:
+            entry = await asyncio.shield(fut)
+        else:
+            fut = _inflight[key] = asyncio.get_running_loop().create_future()
+            try:
+                entry = _store(key, version, await compute(), media_type)
+                fut.set_result(entry)
+            except BaseException as e:
+                fut.set_exception(e)
+                fut.exception()   # 沒有其他人在等時避免 "exception never retrieved"
+                raise
+            finally:
+                del _inflight[key]
+    return _respond(request, entry)
+
+
+def clear():
+    _entries.clear()
@@ -0,0 +1,288 @@
+# rollup.py
+# 多層彙總（1 分 / 15 分 / 1 小時 / 1 天）：長區間查詢改讀彙總表，不再掃整段原始資料
+import datetime as dt
+
+from sqlalchemy import func, cast, case, delete, literal, select, true, union_all, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import MetricRollup1m, MetricRollup15m, MetricRollup1h, MetricRollup1d
+import partitions
+
+# (名稱, bucket 秒數, 資料表)，由細到粗
+TIERS = [
+    ("1m", 60, MetricRollup1m),
+    ("15m", 900, MetricRollup15m),
+    ("1h", 3600, MetricRollup1h),
+    ("1d", 86400, MetricRollup1d),
+]
+
+MAX_POINTS_PER_SERIES = 720   # 每條序列最多幾個點，超過就改用更粗的粒度
+
+EPOCH = dt.datetime(1970, 1, 1)
+
+
+def bucket_start(ts: dt.datetime, seconds: int) -> dt.datetime:
+    """把 naive UTC 時間對齊到 bucket 起點（各粒度都整除一天，不會跨 UTC 日）"""
+    secs = int((ts - EPOCH).total_seconds())
+    return EPOCH + dt.timedelta(seconds=secs - secs % seconds)
+
+
+def pick_tier(span_seconds: float, raw_step_seconds: int):
+    """
+    依查詢區間挑粒度：原始資料點數夠少就回 None（直接讀原始表），
+    否則回第一個點數 <= MAX_POINTS_PER_SERIES 的粒度；都太多就用最粗的。
+    """
+    if span_seconds / raw_step_seconds <= MAX_POINTS_PER_SERIES:
+        return None
+    for tier in TIERS:
+        if span_seconds / tier[1] <= MAX_POINTS_PER_SERIES:
+            return tier
+    return TIERS[-1]
+
+
+def _aggregate(rows, seconds: int, tick_seconds: int):
+    """rows: [(equipment_id, ts, status, production, efficiency)] → {(eid, bucket): 欄位}"""
+    out = {}
+    for eid, ts, status, prod, eff in rows:
+        key = (eid, bucket_start(ts, seconds))
+        b = out.get(key)
+        if b is None:
+            b = out[key] = {
+                "equipment_id": eid, "bucket_ts": key[1], "production": 0,
+                "eff_min": eff, "eff_max": eff, "eff_sum": 0.0, "samples": 0,
+                "run_sec": 0, "idle_sec": 0, "error_sec": 0,
+            }
+        b["production"] = max(b["production"], int(prod))
+        b["eff_min"] = min(b["eff_min"], eff)
+        b["eff_max"] = max(b["eff_max"], eff)
+        b["eff_sum"] += eff
+        b["samples"] += 1
+        if status == "RUN":
+            b["run_sec"] += tick_seconds
+        elif status == "IDLE":
+            b["idle_sec"] += tick_seconds
+        elif status == "ERROR":
+            b["error_sec"] += tick_seconds
+    return list(out.values())
+
+
+def _merge_on_conflict(tbl, stmt):
+    """同一 bucket 已存在就合併（累積產量取大、效率取極值、秒數相加）"""
+    ex = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[tbl.c.equipment_id, tbl.c.bucket_ts],
+        set_={
+            "production": func.max(tbl.c.production, ex.production),
+            "eff_min": func.min(tbl.c.eff_min, ex.eff_min),
+            "eff_max": func.max(tbl.c.eff_max, ex.eff_max),
+            "eff_sum": tbl.c.eff_sum + ex.eff_sum,
+            "samples": tbl.c.samples + ex.samples,
+            "run_sec": tbl.c.run_sec + ex.run_sec,
+            "idle_sec": tbl.c.idle_sec + ex.idle_sec,
+            "error_sec": tbl.c.error_sec + ex.error_sec,
+        },
+    )
+
+
+def _upsert(db: Session, model, values):
+    if not values:
+        return
+    tbl = model.__table__
+    db.execute(_merge_on_conflict(tbl, sqlite_insert(tbl)), values)
+
+
+def apply_rows(db: Session, rows, tick_seconds: int):
+    """
+    寫入端呼叫：把剛寫入的原始資料併進各層彙總（不 commit，跟原始資料同一個 transaction）
+    rows: [(equipment_id, ts, status, production, efficiency)]
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    for _, seconds, model in TIERS:
+        _upsert(db, model, _aggregate(rows, seconds, tick_seconds))
+
+
+def _bucket_expr(ts_col, seconds: int):
+    """SQL 端的 bucket 起點，輸出格式與 SQLAlchemy DateTime 存進 SQLite 的字串相同"""
+    epoch = cast(func.strftime("%s", ts_col), Integer) // seconds * seconds
+    return func.strftime("%Y-%m-%d %H:%M:%S", epoch, "unixepoch").concat(".000000")
+
+
+def _insert_from(db: Session, tbl, sel):
+    # 舊版 metrics 表與升級當天的日分表可能落在同一個 bucket → 一樣用合併（sel 需帶 WHERE）
+    db.execute(_merge_on_conflict(tbl, sqlite_insert(tbl).from_select(
+        ["equipment_id", "bucket_ts", "production", "eff_min", "eff_max", "eff_sum", "samples",
+         "run_sec", "idle_sec", "error_sec"],
+        sel,
+    )))
+
+
+def rebuild_rollups(db: Session, tick_seconds: int, since: dt.datetime = None):
+    """
+    從原始 metrics 重建彙總（since=None 表示全部重建）；一次性補資料或回填後使用。
+    全在 SQL 裡做：最細的一層由原始資料 GROUP BY，較粗的層再由上一層彙總，不必重掃原始資料。
+    原始資料過了保留期限已被刪除的時段不會重建（保留既有彙總）。
+    """
+    earliest = partitions.earliest_ts(db)
+    if earliest is None:
+        return
+    since = max(since, earliest) if since else earliest
+
+    src = None
+    for _, seconds, model in TIERS:
+        tbl = model.__table__
+        start = bucket_start(since, seconds)
+        db.execute(delete(tbl).where(tbl.c.bucket_ts >= start))
+
+        if src is None:
+            # 每個分表各 GROUP BY 一次（bucket 不跨 UTC 日，也就不會跨分表）
+            for m in partitions.overlapping(db, start):
+                bucket = _bucket_expr(m.c.ts, seconds)
+                sel = select(
+                    m.c.equipment_id, bucket,
+                    func.max(m.c.production), func.min(m.c.efficiency), func.max(m.c.efficiency),
+                    func.sum(m.c.efficiency), func.count(),
+                    func.sum(case((m.c.status == "RUN", tick_seconds), else_=0)),
+                    func.sum(case((m.c.status == "IDLE", tick_seconds), else_=0)),
+                    func.sum(case((m.c.status == "ERROR", tick_seconds), else_=0)),
+                ).where(m.c.ts >= start)
+                _insert_from(db, tbl, sel.group_by(m.c.equipment_id, bucket))
+        else:
+            _insert_from(db, tbl, _coarser(src, seconds, start))
+        src = tbl
+    db.commit()
+
+
+def _coarser(src, seconds: int, start: dt.datetime = None):
+    """粗的 bucket 一定由整數個細 bucket 組成（60 | 900 | 3600 | 86400），直接由上一層再彙總一次"""
+    bucket = _bucket_expr(src.c.bucket_ts, seconds)
+    sel = select(
+        src.c.equipment_id, bucket,
+        func.max(src.c.production), func.min(src.c.eff_min), func.max(src.c.eff_max),
+        func.sum(src.c.eff_sum), func.sum(src.c.samples),
+        func.sum(src.c.run_sec), func.sum(src.c.idle_sec), func.sum(src.c.error_sec),
+    )
+    # sel 需帶 WHERE（見 _insert_from）
+    sel = sel.where(src.c.bucket_ts >= start) if start is not None else sel.where(true())
+    return sel.group_by(src.c.equipment_id, bucket)
+
+
+def fill_tier_from_previous(db: Session, name: str):
+    """由上一層（較細）彙總補滿某一層；新增粒度時一次性使用（不受原始資料保留期限影響）"""
+    i = [t[0] for t in TIERS].index(name)
+    _insert_from(db, TIERS[i][2].__table__, _coarser(TIERS[i - 1][2].__table__, TIERS[i][1]))
+    db.commit()
+
+
+def query_series(db: Session, tier, since: dt.datetime):
+    """回傳 [(equipment_id, bucket_ts, production)]（升冪），格式與原始資料查詢相同"""
+    model = tier[2]
+    return (
+        db.query(model.equipment_id, model.bucket_ts, model.production)
+        .filter(model.bucket_ts >= bucket_start(since, tier[1]))
+        .order_by(model.bucket_ts.asc())
+        .all()
+    )
+
+
+def split_window(start: dt.datetime, end: dt.datetime):
+    """
+    把 [start, end)（需對齊 1 分鐘）拆成盡量粗的 bucket 區段：[(資料表, a, b)]
+    例如 3/1 09:17 ~ 3/4 14:02 → 1m ×13、15m ×2、1h ×14、1d ×2、1h ×14、1m ×2 個 bucket（左右邊緣逐層變細）
+    """
+    def split(a, b, level):
+        if a >= b:
+            return []
+        _, seconds, model = TIERS[level]
+        if level == 0:
+            return [(model.__table__, a, b)]
+        lo = bucket_start(a, seconds)
+        if lo < a:
+            lo += dt.timedelta(seconds=seconds)
+        hi = bucket_start(b, seconds)
+        if lo >= hi:
+            return split(a, b, level - 1)
+        return split(a, lo, level - 1) + [(model.__table__, lo, hi)] + split(hi, b, level - 1)
+
+    return split(start, end, len(TIERS) - 1)
+
+
+def query_oee(db: Session, start: dt.datetime, end: dt.datetime, equipment: str = None):
+    """
+    [start, end)（需對齊 1 分鐘）內每台設備的狀態秒數、效率與產量增量，全在 SQL 裡加總。
+    區間先拆成各粒度的區段（split_window），30 天的區間每台只讀幾十個 bucket。
+    回傳 [(equipment_id, run_sec, idle_sec, error_sec, eff_sum, samples, production)]
+    產量增量：累積產量每個 UTC 日重置、日內單調遞增，所以區間內的增量 =
+      Σ 各 UTC 日在區間內的最大累積值 − start 前同一 UTC 日最後一個 1m bucket 的累積值（沒有則 0）
+    """
+    def where(m, a, b):
+        cond = [m.c.bucket_ts >= a, m.c.bucket_ts < b]
+        return cond + [m.c.equipment_id == equipment] if equipment is not None else cond
+
+    def sums(c):
+        return [func.sum(c.run_sec).label("run_sec"), func.sum(c.idle_sec).label("idle_sec"),
+                func.sum(c.error_sec).label("error_sec"), func.sum(c.eff_sum).label("eff_sum"),
+                func.sum(c.samples).label("samples")]
+
+    daily, fine = [], []
+    for m, a, b in split_window(start, end):
+        if m is TIERS[-1][2].__table__:
+            # 整天的 bucket：一天一筆，當天最大累積值就是它本身 → 直接逐台加總
+            daily.append(select(m.c.equipment_id, literal(None).label("day"),
+                                func.sum(m.c.production).label("production"), *sums(m.c))
+                         .where(*where(m, a, b)).group_by(m.c.equipment_id))
+        else:
+            fine.append(select(m.c.equipment_id, m.c.bucket_ts, m.c.production, m.c.run_sec, m.c.idle_sec,
+                               m.c.error_sec, m.c.eff_sum, m.c.samples).where(*where(m, a, b)))
+    per_day = list(daily)
+    if fine:
+        # 左右邊緣（不滿一天）最多落在兩個 UTC 日：先合併各粒度，再逐台逐日取最大累積值
+        edges = union_all(*fine).subquery()
+        day = func.substr(edges.c.bucket_ts, 1, 10)
+        per_day.append(select(edges.c.equipment_id, day.label("day"),
+                              func.max(edges.c.production).label("production"), *sums(edges.c))
+                       .group_by(edges.c.equipment_id, day))
+    if not per_day:
+        return []
+    per_day = union_all(*per_day).subquery()
+
+    # start 前、同一 UTC 日最後一個 1m bucket（走 (equipment_id, bucket_ts) 唯一索引，每台一次定位）
+    prev = TIERS[0][2].__table__.alias("prev")
+    baseline = (
+        select(prev.c.production)
+        .where(prev.c.equipment_id == per_day.c.equipment_id,
+               prev.c.bucket_ts < start,
+               prev.c.bucket_ts >= dt.datetime.combine(start.date(), dt.time.min))
+        .order_by(prev.c.bucket_ts.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    starts_on_first_day = func.max(per_day.c.day == start.date().isoformat()) == 1
+    return db.execute(
+        select(
+            per_day.c.equipment_id,
+            func.sum(per_day.c.run_sec), func.sum(per_day.c.idle_sec), func.sum(per_day.c.error_sec),
+            func.sum(per_day.c.eff_sum), func.sum(per_day.c.samples),
+            func.sum(per_day.c.production)
+            - case((starts_on_first_day, func.coalesce(baseline, 0)), else_=0),
+        )
+        .group_by(per_day.c.equipment_id)
+        .order_by(per_day.c.equipment_id)
+    ).all()
+
+
+if __name__ == "__main__":
+    # 一次性重建：python rollup.py
+    from database import SessionLocal
+    from simulator import TICK_SECONDS
+    import migrations
+
+    migrations.migrate(TICK_SECONDS)
+    db = SessionLocal()
+    try:
+        rebuild_rollups(db, TICK_SECONDS)
+        print("✅ rollup 重建完成")
+    finally:
+        db.close()
@@ -1,13 +1,23 @@
 # simulator.py
 # 事件驅動、產線模擬：Poisson 故障/待機、MTBF/MTTR、班別倍率、報廢率、個體差異
 import time
-import random
+import argparse
 import datetime as dt
 
+from collections import ChainMap
 from typing import Dict
+import numpy as np
+from sqlalchemy import update, bindparam, func
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
-from models import EquipmentMetric, Equipment
+from database import SessionLocal
+from models import Equipment, MetricRollup1m, StatusEvent, ErrorWindow, Alert
+import migrations
+import storage
+import rollup
+import events
+import alerts
+import instrumentation
+import bus
 
 # ====== 可調參數 ======
 TICK_SECONDS = 5                       # 每幾秒產生一批資料
@@ -24,30 +34,30 @@ IDLE_MEAN_INTERVAL_MIN_RANGE= (20, 60)       # 平均待機間隔（分鐘）
 IDLE_DURATION_SEC_RANGE     = (20, 120)      # 待機持續秒數
 SCRAP_RATE_RANGE            = (0.02, 0.10)   # 報廢率
 
-RANDOM_SEED = None  # 若要可重現，改成數字例如 42
+RANDOM_SEED = None  # 若要可重現，改成數字例如 42（或用 --seed）
 
 # ====== 內部狀態 ======
-# 每台設備都有獨立狀態與排程的下一次事件時間
-# mode: RUN/IDLE/ERROR
-# until: 當前狀態結束的時間 (IDLE/ERROR 才會有)
-# next_fail_at: 下一次故障開始的時間（只在 RUN 下會觸發）
-# next_idle_at: 下一次待機開始的時間（只在 RUN 下會觸發）
-# factor: 機器個體產能差異 0.85~1.15
-# params: 該機器的 MTBF/MTTR/IDLE 間隔（秒）
+# 每台設備的狀態放在 VectorEngine 的 NumPy 陣列裡（第 i 台 = 第 i 個元素），見下方
 
-STATE: Dict[str, Dict] = {} # 用來記錄每台設備的當前狀態
+# 每台設備的今日（UTC）累積產量：eid -> (日期, 累積值)
+# 啟動時從 DB 讀一次，之後全在記憶體累加，不再每 tick 查詢
+DAILY_TOTAL: Dict[str, tuple] = {}
+_seeded = False
 
-if RANDOM_SEED is not None:
-    random.seed(RANDOM_SEED)
+# equipment_id -> equipment.id（批次 UPDATE 用主鍵定位；同名設備只更新第一台，與舊行為相同）
+FLEET_PK: Dict[str, int] = {}
 
-Base.metadata.create_all(bind=engine)
+# 每台設備上一筆寫入的狀態（判斷 ERROR 進出）；從 equipment.status 接續，重啟後也不會漏掉 ERROR_END
+LAST_STATUS: Dict[str, str] = {}
 
-# 用「指數分布」抽樣，模擬「隨機事件間隔」（像故障）。
-def exp_sample(mean_seconds: float) -> float:
-    """指數分佈抽樣（平均 mean_seconds）"""
-    if mean_seconds <= 0:
-        mean_seconds = 1
-    return random.expovariate(1.0 / mean_seconds)
+# 上次清過期分表的 UTC 日
+_retention_day = None
+
+EPOCH = dt.datetime(1970, 1, 1)
+
+def epoch_seconds(ts: dt.datetime) -> float:
+    """naive UTC → epoch 秒（引擎內部的時間單位）"""
+    return (ts - EPOCH).total_seconds()
 
 def shift_multiplier(now_utc: dt.datetime) -> float:
     """簡易班別倍率（UTC 時間近似）：凌晨/深夜低、午餐低、白天高"""
@@ -60,135 +70,415 @@ def shift_multiplier(now_utc: dt.datetime) -> float:
     return 0.6                  # 深夜再降低
 
 #模擬班別不同的產能差異
-def ensure_equipments(db: Session):     
-    # 確保 DB 裡有設備 M1~M4，沒有的話自動建立
-    existing = {e.equipment_id for e in db.query(Equipment).all()}
-    for eid in DEFAULT_EQUIP_IDS:
-        if eid not in existing:
-            db.add(Equipment(equipment_id=eid, status="RUN", production=0, efficiency=0.9))
+def ensure_equipments(db: Session):
+    # 確保 DB 裡有 DEFAULT_EQUIP_IDS（預設 M1~M4，--machines 可改），沒有的話自動建立
+    existing = {eid for (eid,) in db.query(Equipment.equipment_id).all()}
+    db.add_all([Equipment(equipment_id=eid, status="RUN", production=0, efficiency=0.9)
+                for eid in DEFAULT_EQUIP_IDS if eid not in existing])
     db.commit()
 
-def last_prod_today(db: Session, eid: str, now_utc: dt.datetime) -> int:    
-    # 查詢今天該機器的最後一筆生產數量，避免累積數據歸零  
+def load_fleet(db: Session):
+    # 模擬對象 = Equipment 表裡的全部設備（API 新增/刪除的設備下一個 tick 就生效）
+    # 行程內模擬器的寫入端可能同時在讀 FLEET_PK：建好新的 dict 再整個換掉，不就地清空
+    global FLEET_PK
+    fleet = {}
+    for pk, eid, status in db.query(Equipment.id, Equipment.equipment_id, Equipment.status).order_by(Equipment.id):
+        fleet.setdefault(eid, pk)
+        LAST_STATUS.setdefault(eid, status)
+    FLEET_PK = fleet
+    return list(fleet)
+
+def seed_daily_totals(db: Session, eids, now_utc: dt.datetime):
+    # 啟動時一次查回各機今天（now_utc 之前）的最後累積值（重啟後接續累積、不歸零）
     start_of_day = dt.datetime.combine(now_utc.date(), dt.time.min)
-    last = (
-        db.query(EquipmentMetric)
-          .filter(EquipmentMetric.equipment_id == eid,
-                  EquipmentMetric.ts >= start_of_day)
-          .order_by(EquipmentMetric.ts.desc())
-          .first()
-    )
-    return last.production if last else 0
-
-def init_state_for(eid: str, now: dt.datetime):
-    if eid in STATE:
-        return
-    mtbf_s   = random.uniform(*MTBF_HOURS_RANGE) * 3600.0
-    mttr_s   = random.uniform(*MTTR_MINUTES_RANGE) * 60.0
-    idle_int = random.uniform(*IDLE_MEAN_INTERVAL_MIN_RANGE) * 60.0
-
-    STATE[eid] = {
-        "mode": "RUN",
-        "until": None,
-        "recovery_boost": False,
-        "factor": random.uniform(0.85, 1.15),
-        "params": {
+    last = storage.latest(db, before=now_utc, since=start_of_day)
+    for eid in eids:
+        DAILY_TOTAL[eid] = (now_utc.date(), last[eid][1] if eid in last else 0)
+
+def add_daily_total(eid: str, now_utc: dt.datetime, produced: int) -> int:
+    # 累加今日產量；跨 UTC 午夜自動歸零
+    day, total = DAILY_TOTAL.get(eid, (now_utc.date(), 0))
+    if day != now_utc.date():
+        total = 0
+    total += produced
+    DAILY_TOTAL[eid] = (now_utc.date(), total)
+    return total
+
+# ====== 陣列化狀態引擎 ======
+RUN, IDLE, ERROR = 0, 1, 2
+MODE_NAMES = ("RUN", "IDLE", "ERROR")
+# 各狀態的效率抽樣範圍（依 mode 索引）
+EFF_LOW  = np.array([0.86, 0.45, 0.05])
+EFF_HIGH = np.array([0.98, 0.70, 0.20])
+
+class VectorEngine:
+    """
+    每個欄位一個陣列，故障/待機/恢復加成/班別/報廢一次對全部機台計算：
+      mode:         RUN/IDLE/ERROR（0/1/2）
+      until:        當前 IDLE/ERROR 結束時間（RUN 時為 inf）
+      next_fail_at: 下一次故障時間（只在 RUN 下觸發）
+      next_idle_at: 下一次待機時間（只在 RUN 下觸發）
+      recovery:     剛恢復，下一次 RUN 產量加成
+      factor:       機器個體產能差異 0.85~1.15
+      mtbf_s / mttr_s / idle_int_s: 該機器的 MTBF/MTTR/待機間隔（秒）
+    時間一律是 epoch 秒。
+    """
+    FIELDS = ("mode", "until", "recovery", "factor", "mtbf_s", "mttr_s",
+              "idle_int_s", "next_fail_at", "next_idle_at")
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.ids = []
+        for f, arr in self._fresh(0, 0.0).items():
+            setattr(self, f, arr)
+
+    def _exp(self, mean_seconds):
+        """指數分佈抽樣（平均 mean_seconds，<=0 視為 1 秒）"""
+        return self.rng.exponential(np.where(mean_seconds <= 0, 1.0, mean_seconds))
+
+    def _fresh(self, n: int, now_s: float):
+        """n 台新機台的初始狀態（各自抽樣參數，增加異質性）"""
+        rng = self.rng
+        mtbf_s = rng.uniform(*MTBF_HOURS_RANGE, n) * 3600.0
+        idle_int_s = rng.uniform(*IDLE_MEAN_INTERVAL_MIN_RANGE, n) * 60.0
+        fresh = {
+            "mode": np.full(n, RUN, dtype=np.int8),
+            "until": np.full(n, np.inf),
+            "recovery": np.zeros(n, dtype=bool),
+            "factor": rng.uniform(0.85, 1.15, n),
             "mtbf_s": mtbf_s,
-            "mttr_s": mttr_s,
-            "idle_mean_interval_s": idle_int
-        },
-        "next_fail_at": now + dt.timedelta(seconds=exp_sample(mtbf_s)),
-        "next_idle_at": now + dt.timedelta(seconds=exp_sample(idle_int)),
-    }
-
-# ====== 核心一步 ======
-def step_one_equipment(db: Session, eid: str, now: dt.datetime):
-    init_state_for(eid, now)
-    st = STATE[eid]
-
-    # 狀態期滿 → 回 RUN 並給一次性恢復加成
-    if st["mode"] in ("ERROR", "IDLE") and st["until"] and now >= st["until"]:
-        st["mode"] = "RUN"
-        st["until"] = None
-        st["recovery_boost"] = True
-
-    # RUN 下才會觸發下一個事件（故障或待機）
-    if st["mode"] == "RUN":
-        # 故障觸發
-        if now >= st["next_fail_at"]:
-            st["mode"] = "ERROR"
-            dur = max(5, exp_sample(st["params"]["mttr_s"]))  # MTTR 指數分佈
-            st["until"] = now + dt.timedelta(seconds=dur)
-            # 下一次故障重新排程（修好之後再算）
-            st["next_fail_at"] = st["until"] + dt.timedelta(seconds=exp_sample(st["params"]["mtbf_s"]))
-        # 待機觸發（若同一個瞬間同時到，優先 ERROR；未 ERROR 才可能 IDLE）
-        elif now >= st["next_idle_at"]:
-            st["mode"] = "IDLE"
-            dur = random.randint(*IDLE_DURATION_SEC_RANGE)
-            st["until"] = now + dt.timedelta(seconds=dur)
-            # 下一次待機重新排程（待機結束之後再算）
-            st["next_idle_at"] = st["until"] + dt.timedelta(seconds=exp_sample(st["params"]["idle_mean_interval_s"]))
-
-    # 計算產量 & 效率
-    base = max(0, int(random.gauss(BASE_MEAN_UNITS, BASE_STD_UNITS)))
-    base = base * shift_multiplier(now) * st["factor"]
-
-    if st["mode"] == "ERROR":
-        produced = 0
-        eff = random.uniform(0.05, 0.2)
-    elif st["mode"] == "IDLE":
-        produced = int(base * 0.12)   # 待機近乎不產出
-        eff = random.uniform(0.45, 0.7)
-    else:
-        produced = int(base)
-        if st["recovery_boost"]:
-            produced = int(produced * RECOVERY_BOOST)
-            st["recovery_boost"] = False
-        eff = random.uniform(0.86, 0.98)
-
-    # 報廢
-    scrap = random.uniform(*SCRAP_RATE_RANGE)
-    produced = int(round(produced * (1 - scrap)))
-
-    # 今日累積
-    new_total = last_prod_today(db, eid, now) + produced
-
-    # 寫入 metrics
-    m = EquipmentMetric(
-        equipment_id=eid,
-        production=new_total,
-        efficiency=round(eff, 2),
-        status=st["mode"],
-        ts=now
-    )
-    db.add(m)
-
-    # 更新 equipment 表
-    e = db.query(Equipment).filter(Equipment.equipment_id == eid).first()
-    if e:
-        e.production = new_total
-        e.efficiency = round(eff, 2)
-        e.status = st["mode"]
-
-    return produced, st["mode"], eff, new_total
+            "mttr_s": rng.uniform(*MTTR_MINUTES_RANGE, n) * 60.0,
+            "idle_int_s": idle_int_s,
+            "next_fail_at": now_s + self._exp(mtbf_s),
+            "next_idle_at": now_s + self._exp(idle_int_s),
+        }
+        return fresh
+
+    def sync(self, eids, now_s: float):
+        """讓機台清單跟 DB 一致：既有機台保留狀態、新機台初始化、已刪除的移除"""
+        if eids == self.ids:
+            return
+        index = {eid: i for i, eid in enumerate(self.ids)}
+        kept = [eid for eid in eids if eid in index]
+        new = [eid for eid in eids if eid not in index]
+        keep_idx = np.array([index[eid] for eid in kept], dtype=np.int64)
+        fresh = self._fresh(len(new), now_s)
+        for f in self.FIELDS:
+            setattr(self, f, np.concatenate([getattr(self, f)[keep_idx], fresh[f]]))
+        self.ids = kept + new
+
+    def step(self, now_s: float, shift: float):
+        """推進一個 tick，回傳 (produced, mode, eff) 三個陣列（順序同 self.ids）"""
+        rng, n, mode = self.rng, len(self.ids), self.mode
+
+        # 狀態期滿 → 回 RUN 並給一次性恢復加成
+        expired = (mode != RUN) & (now_s >= self.until)
+        mode[expired] = RUN
+        self.until[expired] = np.inf
+        self.recovery[expired] = True
+
+        # RUN 下才會觸發下一個事件；同一瞬間都到期時優先 ERROR
+        run = mode == RUN
+        fail = run & (now_s >= self.next_fail_at)
+        idle = run & ~fail & (now_s >= self.next_idle_at)
+        if fail.any():
+            mode[fail] = ERROR
+            self.until[fail] = now_s + np.maximum(5.0, self._exp(self.mttr_s[fail]))  # MTTR 指數分佈
+            self.next_fail_at[fail] = self.until[fail] + self._exp(self.mtbf_s[fail])
+        if idle.any():
+            mode[idle] = IDLE
+            lo, hi = IDLE_DURATION_SEC_RANGE
+            self.until[idle] = now_s + rng.integers(lo, hi + 1, int(idle.sum()))
+            self.next_idle_at[idle] = self.until[idle] + self._exp(self.idle_int_s[idle])
+
+        # 產量 & 效率
+        base = np.maximum(0.0, np.trunc(rng.normal(BASE_MEAN_UNITS, BASE_STD_UNITS, n)))
+        base = base * shift * self.factor
+        is_run = mode == RUN
+        produced = np.where(is_run, np.trunc(base), np.where(mode == IDLE, np.trunc(base * 0.12), 0.0))
+        boost = is_run & self.recovery
+        produced[boost] = np.trunc(produced[boost] * RECOVERY_BOOST)
+        self.recovery[boost] = False
+        eff = rng.uniform(EFF_LOW[mode], EFF_HIGH[mode])
+
+        # 報廢
+        scrap = rng.uniform(*SCRAP_RATE_RANGE, n)
+        produced = np.rint(produced * (1 - scrap)).astype(np.int64)
+        return produced, mode.copy(), eff
+
+
+ENGINE = VectorEngine(RANDOM_SEED)
+
+
+def update_equipment(db: Session, rows):
+    """equipment 表一次批次 UPDATE（以主鍵定位）；rows 同 write_tick"""
+    eq = Equipment.__table__
+    fleet = FLEET_PK   # 同一批用同一份（load_fleet 會整個換掉）
+    params = [{"b_id": fleet[r["equipment_id"]], "b_prod": r["production"],
+               "b_eff": r["efficiency"], "b_status": r["status"]}
+              for r in rows if r["equipment_id"] in fleet]
+    if params:
+        db.execute(
+            update(eq)
+            .where(eq.c.id == bindparam("b_id"))
+            .values(production=bindparam("b_prod"), efficiency=bindparam("b_eff"), status=bindparam("b_status")),
+            params,
+        )
+
+
+def write_tick(db: Session, rows, last_status=LAST_STATUS):
+    """
+    一個 tick 的批次寫入（不 commit）：
+      metrics 一次 executemany、equipment 一次批次 UPDATE、rollup 合併、ERROR 進出事件、規則告警
+    rows: [{"equipment_id", "ts", "status", "production", "efficiency"}]
+    last_status: 判斷 ERROR 進出用的前一個狀態，這個 tick 的狀態也寫回這裡（persist_ticks 傳 commit 前的暫存）
+    回傳這個 tick 觸發的規則告警（alerts.AlertEngine.evaluate）
+    原始資料不在 SQLite 時不在這裡寫（不跟 transaction 連動），由 persist_ticks 在 commit 後寫入
+    """
+    if not rows:
+        return []
+    raw = [(r["equipment_id"], r["ts"], r["status"], r["production"], r["efficiency"]) for r in rows]
+    if storage.in_sqlite():
+        storage.append(db, raw)   # 同一 tick 同一個 ts
+    update_equipment(db, rows)
+
+    transitions = []
+    for r in rows:
+        eid, st = r["equipment_id"], r["status"]
+        if (last_status.get(eid) == "ERROR") != (st == "ERROR"):
+            transitions.append((eid, r["ts"], st))
+        last_status[eid] = st
+    events.record_transitions(db, transitions)
+    rollup.apply_rows(db, raw, TICK_SECONDS)
+    fired = alerts.ENGINE.evaluate(rows)
+    alerts.record(db, fired)
+    return fired
+
+
+def next_tick(db: Session, now: dt.datetime):
+    """
+    模擬一個 tick（只算、不寫入）：回傳 (rows, lines)
+    rows 給 write_tick；lines 是印在終端機的摘要
+    """
+    global _seeded
+    if not _seeded:
+        migrations.migrate(TICK_SECONDS)
+        ensure_equipments(db)
+        alerts.ENGINE.seed(events.open_windows(db), now)
+        _seeded = True
+    eids = load_fleet(db)
+    missing = [eid for eid in eids if eid not in DAILY_TOTAL]
+    if missing:
+        seed_daily_totals(db, missing, now)
+
+    ENGINE.sync(eids, epoch_seconds(now))
+    produced, modes, effs = ENGINE.step(epoch_seconds(now), shift_multiplier(now))
+
+    rows, lines = [], []
+    for eid, prod, m, eff in zip(ENGINE.ids, produced.tolist(), modes.tolist(), effs.tolist()):
+        mode = MODE_NAMES[m]
+        total = add_daily_total(eid, now, prod)
+        rows.append({"equipment_id": eid, "ts": now, "status": mode,
+                     "production": total, "efficiency": round(eff, 2)})
+        if len(lines) < 8:  # 機台很多時只印前幾台
+            lines.append(f"{eid}:{mode} +{prod} (eff={eff:.2f}, total={total})")
+    if len(rows) > 8:
+        lines.append(f"...(+{len(rows) - 8})")
+    return rows, lines
+
+
+def persist_ticks(db: Session, ticks):
+    """
+    把一或多個 tick 寫入同一個 transaction，commit 後發佈到匯流排（tick 與觸發的規則告警）；
+    每個 UTC 日第一次寫入時整張刪掉過期分表。
+    寫入失敗時 rollback、記憶體裡的狀態（LAST_STATUS、告警引擎）還原成寫入前，再丟出例外：
+    呼叫端可以原封不動重送同一批 tick，ERROR 進出與告警計數不會漏掉或重複。
+    只有 commit 之前的失敗會丟出例外；commit 之後的步驟（欄式原始資料、匯流排、清過期資料）失敗只記 log
+    """
+    global _retention_day
+    fired = []
+    status = ChainMap({}, LAST_STATUS)   # commit 成功才併回 LAST_STATUS
+    saved = alerts.ENGINE.snapshot()
+    try:
+        for rows in ticks:
+            fired.extend(write_tick(db, rows, status))
+        db.commit()
+    except Exception:
+        db.rollback()
+        alerts.ENGINE.restore(saved)
+        raise
+    LAST_STATUS.update(status.maps[0])
+    if not storage.in_sqlite():
+        try:
+            for rows in ticks:
+                storage.append(db, [(r["equipment_id"], r["ts"], r["status"], r["production"], r["efficiency"])
+                                    for r in rows])
+        except Exception as e:   # SQLite 端已 commit，不能整批重送；這批原始資料缺漏，彙總與事件仍完整
+            print(f"⚠️ 原始資料寫入失敗（{len(ticks)} 個 tick）：{e!r}")
+    # 以下都在 commit 之後：失敗只記 log、不丟例外，呼叫端才不會重送已經寫進 DB 的 tick
+    try:
+        bus.publish_ticks(ticks)   # 通知 API worker（BUS_URL 未設定時只通知同一行程）
+        if fired:
+            bus.publish_alerts(fired)
+    except Exception as e:   # worker 收不到通知時會回到定期查 DB
+        print(f"⚠️ 發佈到匯流排失敗：{e!r}")
+
+    now = max((rows[0]["ts"] for rows in ticks if rows), default=None)
+    if now is not None and now.date() != _retention_day:   # 啟動時與每個 UTC 日第一個 tick
+        try:
+            for name in storage.drop_expired(db, now):
+                print(f"🗑️ 刪除過期原始資料 {name}")
+            _retention_day = now.date()
+        except Exception as e:   # 下一個 tick 再試
+            db.rollback()
+            print(f"⚠️ 刪除過期原始資料失敗：{e!r}")
 
 
 def generate_batch():
     now = dt.datetime.utcnow()
+    t0 = time.perf_counter()
     db: Session = SessionLocal()
     try:
-        ensure_equipments(db)
-        lines = []
-        for eid in DEFAULT_EQUIP_IDS:
-            prod, mode, eff, total = step_one_equipment(db, eid, now)
-            lines.append(f"{eid}:{mode} +{prod} (eff={eff:.2f}, total={total})")
-        db.commit()
+        rows, lines = next_tick(db, now)
+        persist_ticks(db, [rows])
         print(f"[{now.strftime('%H:%M:%S')}] " + " | ".join(lines))
     finally:
         db.close()
+        instrumentation.observe_tick(time.perf_counter() - t0)
+
+
+# ====== 快轉 / 回填模式 ======
+def parse_span(text: str) -> dt.timedelta:
+    """'30d' / '12h' / '90m' / '600s' → timedelta"""
+    units = {"d": "days", "h": "hours", "m": "minutes", "s": "seconds"}
+    text = text.strip().lower()
+    if not text or text[-1] not in units:
+        raise ValueError(f"無法解析時間長度：{text!r}（例：30d、12h、90m）")
+    return dt.timedelta(**{units[text[-1]]: float(text[:-1])})
+
+
+def earliest_history(db: Session):
+    """
+    DB 裡最早的一筆歷史：原始資料過了保留期限會被刪，但 rollup / 狀態事件 / 維修區段 / 告警不會，
+    所以要一起看，才不會把已經有的歷史再產生一次
+    """
+    found = [storage.earliest_ts(db)] + [db.query(func.min(col)).scalar() for col in
+                                         (MetricRollup1m.bucket_ts, StatusEvent.ts, ErrorWindow.start_ts, Alert.ts)]
+    found = [ts for ts in found if ts is not None]
+    return min(found) if found else None
+
+
+def backfill(span: dt.timedelta, batch_rows: int = 200_000):
+    """
+    用「模擬時間」產生 [now - span, now) 的歷史資料，不 sleep、盡快跑完：
+      - 每 batch_rows 筆原始資料一個 transaction（DBAPI executemany）
+      - 每日累積產量在 UTC 午夜歸零，與即時模式相同
+      - ERROR 進出事件 / 維修區段跟原始資料一起寫入
+      - rollup：空 DB 且原始資料在 SQLite 時結束後用 SQL 重建該區間；否則每批寫入時一起合併
+      - equipment 表停在最後一個 tick
+    DB 已有資料時只補到最早一筆歷史（earliest_history）之前，不會和既有資料重疊；此時 equipment 表與即時狀態不動，
+    最後仍在 ERROR 的歷史維修區段在銜接點結束，rollup 每批合併（不重建，以免刪掉原始資料已過期時段的彙總）。
+    """
+    migrations.migrate(TICK_SECONDS)
+    db: Session = SessionLocal()
+    try:
+        ensure_equipments(db)
+        eids = load_fleet(db)
+
+        end = dt.datetime.utcnow().replace(microsecond=0)
+        first_ts = earliest_history(db)
+        if first_ts is not None:
+            end = min(end, first_ts)
+        start = end - span
+        start -= dt.timedelta(seconds=epoch_seconds(start) % TICK_SECONDS)  # 對齊 tick
+
+        ENGINE.sync(eids, epoch_seconds(start))
+        ids = ENGINE.ids
+        n = len(ids)
+        mode_names = np.array(MODE_NAMES, dtype=object)
+        daily = np.zeros(n, dtype=np.int64)
+        day = None
+        prev_err = np.zeros(n, dtype=bool)   # 引擎從 RUN 開始
+        transitions = []
+
+        step = dt.timedelta(seconds=TICK_SECONDS)
+        pending, written = [], 0
+        modes = effs = None
+        merge_rollups = first_ts is not None or not storage.in_sqlite()
+        t0 = time.perf_counter()
+        print(f"⏩ 回填 {start:%Y-%m-%d %H:%M} ~ {end:%Y-%m-%d %H:%M} UTC，{n} 台設備")
+
+        def flush():
+            nonlocal pending, transitions, written
+            # pending 一定只有同一個 UTC 日的資料（跨日前會先 flush）
+            storage.append(db, pending)
+            if merge_rollups:
+                rollup.apply_rows(db, pending, TICK_SECONDS)
+            events.record_transitions(db, transitions)
+            db.commit()
+            transitions = []
+            written += len(pending)
+            pending = []
+            rate = written / max(1e-9, time.perf_counter() - t0)
+            print(f"  {t:%Y-%m-%d %H:%M}  {written:,} 筆（{rate:,.0f} 筆/秒）")
+
+        t = start
+        while t < end:
+            produced, modes, effs = ENGINE.step(epoch_seconds(t), shift_multiplier(t))
+            if t.date() != day:   # 跨 UTC 午夜 → 今日累積歸零、換下一個分表
+                if pending:
+                    flush()
+                day = t.date()
+                daily[:] = 0
+            daily += produced
+            is_err = modes == ERROR
+            for i in np.flatnonzero(is_err != prev_err).tolist():   # ERROR 進出很少，逐筆記錄即可
+                transitions.append((ids[i], t, MODE_NAMES[modes[i]]))
+            prev_err = is_err
+            pending.extend(zip(ids, [t] * n, mode_names[modes].tolist(),
+                               daily.tolist(), np.round(effs, 2).tolist()))
+            t += step
+
+            if len(pending) >= batch_rows or t >= end:
+                flush()
+
+        if modes is not None and first_ts is not None:
+            # 補在既有資料之前：equipment 表與 LAST_STATUS 維持既有的最新狀態；
+            # 到 end 仍在 ERROR 的歷史區段在 end 結束，不留下「進行中」的維修區段
+            events.record_transitions(db, [(ids[i], end, "RUN") for i in np.flatnonzero(modes == ERROR).tolist()])
+            db.commit()
+        elif modes is not None:
+            update_equipment(db, [{"equipment_id": eid, "status": MODE_NAMES[m],
+                                   "production": int(p), "efficiency": round(e, 2)}
+                                  for eid, m, p, e in zip(ids, modes.tolist(), daily.tolist(), effs.tolist())])
+            db.commit()
+            LAST_STATUS.update(zip(ids, [MODE_NAMES[m] for m in modes.tolist()]))
+        if not merge_rollups:
+            print("  重建 rollup ...")
+            rollup.rebuild_rollups(db, TICK_SECONDS, since=start)
+        for name in storage.drop_expired(db):   # 超過保留期限的原始資料只用來產生 rollup
+            print(f"  刪除過期原始資料 {name}")
+        print(f"✅ 回填完成：{written:,} 筆，{time.perf_counter() - t0:.1f} 秒")
+    finally:
+        db.close()
 
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="產線模擬器")
+    ap.add_argument("--machines", type=int, default=None, help="確保 DB 至少有 M1~MN 這 N 台設備")
+    ap.add_argument("--seed", type=int, default=None, help="亂數種子（可重現）")
+    ap.add_argument("--backfill", metavar="SPAN", default=None,
+                    help="快轉模式：產生過去一段時間的歷史資料後結束，例如 30d、12h")
+    args = ap.parse_args()
+    if args.machines:
+        DEFAULT_EQUIP_IDS = [f"M{i}" for i in range(1, args.machines + 1)]
+    if args.seed is not None:
+        ENGINE = VectorEngine(args.seed)
+
+    if args.backfill:
+        backfill(parse_span(args.backfill))
+        raise SystemExit(0)
+
     print("🚀 模擬器啟動（Poisson 故障、隨機待機、班別倍率、報廢、個體差異）...")
     while True:
         generate_batch()
@@ -15,6 +15,8 @@ fi
 
 HOST=127.0.0.1
 PORT=8000
+WORKERS=${WORKERS:-1}                          # 例：WORKERS=4 ./start_all.sh
+BUS_URL=${BUS_URL:-unix:///tmp/sfm-bus.sock}   # WORKERS > 1 時使用
 
 echo "==============================================="
 echo " Smart Factory Monitoring System - Starter (Mac)"
@@ -23,10 +25,18 @@ echo "==============================================="
 echo "Starting in 3 seconds..."
 sleep 3
 
-# 啟動 API Server
-osascript -e "tell application \"Terminal\" to do script \"cd $(pwd); $PYTHON -m uvicorn app:app --host $HOST --port $PORT --reload\""
-
-# 啟動 Simulator
-osascript -e "tell application \"Terminal\" to do script \"cd $(pwd); $PYTHON simulator.py\""
+if [ "$WORKERS" -gt 1 ]; then
+  # 多 worker：先啟動匯流排中繼，API 與 Simulator 接到同一個 BUS_URL（--reload 不能搭配多 worker）
+  osascript -e "tell application \"Terminal\" to do script \"cd $(pwd); $PYTHON bus.py serve --path ${BUS_URL#unix://}\""
+  sleep 1
+  osascript -e "tell application \"Terminal\" to do script \"cd $(pwd); BUS_URL=$BUS_URL $PYTHON -m uvicorn app:app --host $HOST --port $PORT --workers $WORKERS\""
+  osascript -e "tell application \"Terminal\" to do script \"cd $(pwd); BUS_URL=$BUS_URL $PYTHON simulator.py\""
+else
+  # 啟動 API Server
+  osascript -e "tell application \"Terminal\" to do script \"cd $(pwd); $PYTHON -m uvicorn app:app --host $HOST --port $PORT --reload\""
+
+  # 啟動 Simulator
+  osascript -e "tell application \"Terminal\" to do script \"cd $(pwd); $PYTHON simulator.py\""
+fi
 
 echo "API Server running at: http://$HOST:$PORT"
\ No newline at end of file
@@ -0,0 +1,390 @@
+# state_cache.py
+# 行程內「最新狀態」快取：/api/summary 不再每次查整張 metrics
+# 啟動時從 DB 重建一次，之後只讀時間晚於游標的新資料，逐筆增量更新
+import asyncio
+import itertools
+import threading
+import time
+import datetime as dt
+from collections import deque
+from typing import Dict
+
+from sqlalchemy.orm import Session
+
+from models import Equipment
+import storage
+
+TAIPEI_OFFSET = dt.timedelta(hours=8)
+
+# ====== 內部狀態 ======
+# 每台設備：
+# last_ts / last_prod / status / efficiency: 最新一筆
+# day:   daily 所屬的台灣日期
+# daily: 該台灣日（0:00 起算）的累積產量增量
+EQP: Dict[str, Dict] = {}
+FLEET = []              # Equipment 表的設備 ID（順序同 DB，沒資料的設備也算）
+_fleet_dirty = True
+_cursor_ts = None       # 已套用到快取的最新 ts（寫入端每個 tick 一個 transaction，依時間先後 commit）
+_seq = 0                # RECENT 的流水號（原始資料分表後 id 不再全域唯一）
+_version = 0            # 資料版本：讀入新資料 / 重建 / 設備異動就 +1（API 回應快取用）
+_last_refresh = 0.0     # 上次 refresh_async 完成的時間（monotonic）
+_refreshing = None      # 進行中的 refresh_async（同時只跑一個，其餘等它）
+_latest = None          # (ts, eid)：全體最新一筆，給效率/狀態 KPI（同 ts 取 eid 最大，各 worker 結果一致）
+_warm = False
+_pending = None         # resync_async 進行中：匯流排送來的資料先放這裡
+_lock = threading.Lock()
+
+# 最近套用過的資料（給即時推播算增量、realtime 圖表用）：(seq, eid, ts, status, production, efficiency, prev_status)
+# 依套用順序（即時間先後）連續存放；重新同步時清空，_recent_floor 記下清空時的流水號
+RECENT_MAXLEN = 20000
+RECENT = deque(maxlen=RECENT_MAXLEN)
+_recent_floor = 0
+
+# 游標之後一次最多補讀幾筆；落後更多（例如空 DB 暖好之後才回填大量歷史）就改成整個重建，
+# 不把整段歷史逐筆讀進記憶體
+CATCHUP_ROWS = RECENT_MAXLEN
+
+
+def taipei_day(ts_utc: dt.datetime) -> dt.date:
+    """UTC naive 時間 → 台灣當地日期"""
+    return (ts_utc + TAIPEI_OFFSET).date()
+
+
+def taipei_day_start_utc(ts_utc: dt.datetime) -> dt.datetime:
+    """ts 所在台灣日的 00:00，換算成 UTC naive"""
+    return dt.datetime.combine(taipei_day(ts_utc), dt.time.min) - TAIPEI_OFFSET
+
+
+def _increment(prev_ts, prev_prod, ts, prod) -> int:
+    """兩筆之間的產量增量；累積值每個 UTC 日重置為 0"""
+    if prev_ts is None or prev_ts.date() != ts.date():
+        return max(0, prod)
+    return max(0, prod - prev_prod)
+
+
+def apply_row(eid: str, ts: dt.datetime, status: str, production: int, efficiency: float):
+    """
+    套用一筆新資料（呼叫端需持有 _lock）；比快取舊的資料直接略過，所以重複套用是安全的
+    回傳 (是否套用, 套用前的狀態)
+    """
+    global _latest, _fleet_dirty
+    st = EQP.get(eid)
+    if st is None:
+        st = EQP[eid] = {"last_ts": None, "last_prod": 0, "status": None, "efficiency": 0.0,
+                         "day": None, "daily": 0}
+        if eid not in FLEET:
+            _fleet_dirty = True
+    elif ts <= st["last_ts"]:
+        return False, st["status"]
+    prev_status = st["status"]
+
+    inc = _increment(st["last_ts"], st["last_prod"], ts, production)
+    day = taipei_day(ts)
+    if st["day"] != day:
+        st["day"] = day
+        st["daily"] = 0
+    st["daily"] += inc
+
+    st["last_ts"] = ts
+    st["last_prod"] = int(production)
+    st["status"] = status
+    st["efficiency"] = efficiency
+    if _latest is None or (ts, eid) > _latest:   # 同一個 tick 取設備 ID 最大的，與套用順序無關
+        _latest = (ts, eid)
+    return True, prev_status
+
+
+def _fleet_ids(db: Session):
+    return [eid for (eid,) in db.query(Equipment.equipment_id).all()]
+
+
+def _set_fleet(fleet):
+    global FLEET, _fleet_dirty
+    FLEET = fleet
+    _fleet_dirty = False
+
+
+def _boundaries(now: dt.datetime):
+    """S = 台灣今天 0:00、U = S 之後第一個 UTC 午夜（皆為 UTC naive）"""
+    S = taipei_day_start_utc(now)
+    U = dt.datetime.combine(S.date() + dt.timedelta(days=1), dt.time.min)
+    return S, U
+
+
+def _rebuild(now, S, U, before_S, before_U, latest, fleet):
+    """
+    用邊界查詢的結果重建快取（呼叫端需持有 _lock）。當日產量 = 台灣 0:00（S）到現在的增量，
+    中間若跨過 UTC 午夜（U）累積值會重置，所以分兩段：
+      daily = (last_<U - 基準) + latest_>=U
+    基準 = S 之前最後一筆（須與該段同一 UTC 日，否則為 0）
+    """
+    global _cursor_ts, _latest, _warm, _version
+
+    def base(eid, ts):
+        b = before_S.get(eid)
+        return b[1] if b and b[0].date() == ts.date() else 0
+
+    EQP.clear()
+    _latest = None
+    for eid, (ts, prod, status, eff) in latest.items():
+        daily = 0
+        if ts >= S:
+            if ts >= U:
+                a = before_U.get(eid)
+                seg1 = max(0, a[1] - base(eid, a[0])) if a and a[0] >= S else 0
+                daily = seg1 + prod
+            else:
+                daily = max(0, prod - base(eid, ts))
+        EQP[eid] = {"last_ts": ts, "last_prod": prod, "status": status, "efficiency": eff,
+                    "day": taipei_day(ts), "daily": daily}
+        if _latest is None or (ts, eid) > _latest:
+            _latest = (ts, eid)
+    _cursor_ts = _latest[0] if _latest else None
+    _set_fleet(fleet)
+    _warm = True
+    _version += 1
+
+
+def warm(db: Session):
+    """從 DB 重建快取（同步版，見 _rebuild）"""
+    now = dt.datetime.utcnow()
+    S, U = _boundaries(now)
+    before_S = storage.latest(db, before=S)
+    before_U = storage.latest(db, before=U) if now >= U else {}
+    latest = storage.latest(db)
+    fleet = _fleet_ids(db)
+    with _lock:
+        _rebuild(now, S, U, before_S, before_U, latest, fleet)
+
+
+async def resync_async(run):
+    """
+    從 DB 整個重建，並接上匯流排送來的資料（啟動時、或匯流排可能漏掉了 tick 時）。
+    漏掉的資料在游標之前，增量 refresh 讀不到；RECENT 中間有洞，也一併清空。
+    重建期間 apply_ticks 收到的資料先暫存，重建完再套用（比快取舊的會被略過）
+    """
+    global _pending
+    _pending = []
+    try:
+        await warm_async(run)
+        _reset_recent()
+        await _refresh_once(run)   # 重建期間 commit 的資料
+    finally:
+        pending, _pending = _pending, None
+    if pending:
+        _apply_new(pending, None)
+
+
+async def _nothing():
+    return {}
+
+
+async def warm_async(run):
+    """
+    同 warm，但四個互不相依的查詢（S 前、U 前、最新一筆、設備清單）各用一條連線同時送出。
+    run: database.run_read
+    """
+    now = dt.datetime.utcnow()
+    S, U = _boundaries(now)
+    before_S, before_U, latest, fleet = await asyncio.gather(
+        run(storage.latest, before=S),
+        run(storage.latest, before=U) if now >= U else _nothing(),
+        run(storage.latest),
+        run(_fleet_ids),
+    )
+    with _lock:
+        _rebuild(now, S, U, before_S, before_U, latest, fleet)
+
+
+def _reset_recent():
+    """RECENT 接不上了（重建過）：清空並記下流水號，即時推播的訂閱者會收到 resync"""
+    global _recent_floor
+    with _lock:
+        RECENT.clear()
+        _recent_floor = _seq
+
+
+def _fetch_new(db: Session, after_ts):
+    """
+    游標之後的新資料（SQLite 走 ts 索引，只碰游標之後的分表與列），最多 CATCHUP_ROWS + 1 筆；
+    快取是空的（游標為 None）時只要知道 DB 有沒有資料，讀一筆就好
+    """
+    return storage.rows_after(db, after_ts, limit=1 if after_ts is None else CATCHUP_ROWS + 1)
+
+
+def _too_far(rows) -> bool:
+    """補讀不完：游標之後超過 CATCHUP_ROWS 筆，或快取是空的但 DB 已有資料 → 改成整個重建"""
+    return len(rows) > CATCHUP_ROWS or (_cursor_ts is None and bool(rows))
+
+
+def _needs_fleet(rows) -> bool:
+    if _fleet_dirty:
+        return True
+    known = set(FLEET)
+    return any(r[0] not in known for r in rows)
+
+
+def _apply_new(rows, fleet):
+    """把 _fetch_new 的結果套進快取；查詢在鎖外做，這裡只有記憶體操作"""
+    global _cursor_ts, _seq, _version
+    with _lock:
+        if rows or fleet is not None:
+            _version += 1
+        for eid, ts, status, prod, eff in rows:
+            applied, prev_status = apply_row(eid, ts, status, prod, eff)
+            if applied:
+                _seq += 1
+                RECENT.append((_seq, eid, ts, status, prod, eff, prev_status))
+            if _cursor_ts is None or ts > _cursor_ts:
+                _cursor_ts = ts
+        if fleet is not None:
+            _set_fleet(fleet)
+
+
+def apply_ticks(ticks):
+    """
+    寫入端 commit 後經匯流排送來的資料直接套用（ticks: [[simulator 的 row dict]]），不必等下一次查 DB。
+    快取還沒暖好就略過（之後 refresh 會從 DB 讀到）；同一時間只能有一個寫入者，
+    否則別的寫入者較早的資料可能落在游標之前而被跳過
+    """
+    rows = [(r["equipment_id"], r["ts"], r["status"], r["production"], r["efficiency"])
+            for rows in ticks for r in rows]
+    if _pending is not None:
+        _pending.extend(rows)
+    elif _warm:
+        _apply_new(rows, None)
+
+
+def refresh(db: Session):
+    """讀入游標之後的新資料"""
+    if not _warm:
+        warm(db)
+    rows = _fetch_new(db, _cursor_ts)
+    if _too_far(rows):
+        warm(db)
+        _reset_recent()
+        return
+    _apply_new(rows, _fleet_ids(db) if _needs_fleet(rows) else None)
+
+
+async def _refresh_once(run):
+    global _last_refresh
+    if not _warm:
+        await warm_async(run)
+    rows = await run(_fetch_new, _cursor_ts)
+    if _too_far(rows):
+        await warm_async(run)
+        _reset_recent()
+    else:
+        _apply_new(rows, await run(_fleet_ids) if _needs_fleet(rows) else None)
+    _last_refresh = time.monotonic()
+
+
+async def refresh_async(run, min_interval: float = 0.0):
+    """
+    同 refresh，給 async 端點用（run: database.run_read）。
+    距上次不到 min_interval 秒就不查；同時有多個請求時共用同一次查詢。
+    """
+    global _refreshing
+    if _warm and not _fleet_dirty and time.monotonic() - _last_refresh < min_interval:
+        return
+    if _refreshing is None:
+        _refreshing = asyncio.ensure_future(_refresh_once(run))
+        _refreshing.add_done_callback(_clear_refreshing)
+    await asyncio.shield(_refreshing)
+
+
+def _clear_refreshing(_task):
+    global _refreshing
+    _refreshing = None
+
+
+def cursor() -> int:
+    return _seq
+
+
+def version() -> int:
+    return _version
+
+
+def is_warm() -> bool:
+    """快取已從 DB 重建過（/api/ready 用）"""
+    return _warm
+
+
+def cursor_ts():
+    """已套用到快取的最新 ts（沒有資料為 None）"""
+    return _cursor_ts
+
+
+def rows_since(after_seq: int):
+    """
+    回傳 (rows, complete, new_cursor)：RECENT 裡 seq > after_seq 的資料。
+    complete=False 表示中間有資料已被擠出 RECENT（或重新同步過），呼叫端應整段重新同步。
+    """
+    with _lock:
+        rows = [r for r in RECENT if r[0] > after_seq]
+        complete = after_seq >= _recent_floor and (
+            len(RECENT) < RECENT_MAXLEN or (RECENT and RECENT[0][0] <= after_seq + 1))
+        return rows, bool(complete), max(after_seq, _seq)
+
+
+def recent_ticks(ticks: int):
+    """
+    RECENT 裡最近 ticks 個完整的 tick，回傳升冪的 [(equipment_id, ts, production)]（同 app.fetch_recent_rows）。
+    RECENT 還不夠（剛啟動）或容不下這麼多 tick 時回 None，由呼叫端改查 DB
+    """
+    with _lock:
+        stamps = set()
+        start = len(RECENT)
+        for r in reversed(RECENT):
+            if r[2] not in stamps:
+                if len(stamps) == ticks:
+                    break
+                stamps.add(r[2])
+            start -= 1
+        # 最舊那個 tick 可能有一部分已被擠出去：沒擠過（或再往前還有別的 tick）才算完整
+        if len(stamps) < ticks or (start == 0 and len(RECENT) == RECENT_MAXLEN):
+            return None
+        return [(r[1], r[2], r[4]) for r in itertools.islice(RECENT, start, None)]
+
+
+def recent_after(after: dt.datetime):
+    """RECENT 裡 ts > after 的 [(equipment_id, ts, production)]（升冪）；RECENT 沒涵蓋到 after 時回 None"""
+    with _lock:
+        if not RECENT or RECENT[0][2] > after:
+            return None
+        return [(r[1], r[2], r[4]) for r in RECENT if r[2] > after]
+
+
+def stale_fleet() -> bool:
+    """設備清單要重新讀（CRUD 過、或出現不在清單裡的設備）"""
+    return _fleet_dirty
+
+
+def invalidate_fleet():
+    """設備 CRUD 後呼叫，下次 refresh 重新讀設備清單"""
+    global _fleet_dirty, _version
+    _fleet_dirty = True
+    _version += 1
+
+
+def summary(now: dt.datetime = None) -> dict:
+    """O(設備數) 組出 /api/summary 的內容"""
+    now = now or dt.datetime.utcnow()
+    today = taipei_day(now)
+    with _lock:
+        daily_total = 0
+        for eid in FLEET:
+            st = EQP.get(eid)
+            if st and st["day"] == today:
+                daily_total += st["daily"]
+        latest = EQP.get(_latest[1]) if _latest else None
+        return {
+            "dailyProduction": int(daily_total),
+            "efficiency": round(latest["efficiency"], 2) if latest else 0,
+            "status": latest["status"] if latest else "N/A",
+            "activeEquipment": 1 if latest and latest["status"] == "RUN" else 0,
+            "totalEquipment": len(FLEET),
+            "updatedAt": now.isoformat(),
+        }
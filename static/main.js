@@ -33,6 +33,32 @@ function toDelta(series) {
   return out;
 }
 function fmt(ts) { return new Date(ts).toLocaleString(); }
+// epoch 秒 → 與 JSON API 相同格式的 ts 字串（UTC、不帶時區），圖表標籤跟即時模式一致
+function epochToTs(sec) { return new Date(sec * 1000).toISOString().slice(0, -1); }
+
+// 解 /api/metrics?format=binary（格式見 columnar.py）：
+// "SFC1" | u32 header 長度 | header JSON | i32 ts_delta（補到 8 的倍數）| f64 total | i32 production（逐台）
+function decodeColumnar(buf) {
+  const view = new DataView(buf);
+  const magic = String.fromCharCode(...new Uint8Array(buf, 0, 4));
+  if (magic !== 'SFC1') throw new Error('unexpected metrics payload');
+  const hlen = view.getUint32(4, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 8, hlen)));
+  const n = header.n, eqps = header.equipment;
+  let off = 8 + hlen;
+  const delta = new Int32Array(buf, off, n); off += n * 4 + ((8 - (n * 4) % 8) % 8);
+  const total = new Float64Array(buf, off, n); off += n * 8;
+  const production = new Int32Array(buf, off, eqps.length * n);
+
+  const ts = new Array(n);
+  let t = header.ts_base;
+  for (let i = 0; i < n; i++) { t += delta[i]; ts[i] = epochToTs(t); }
+  const byEqp = eqps.map((eid, k) => ({
+    equipment_id: eid,
+    values: Array.from(production.subarray(k * n, (k + 1) * n), v => (v < 0 ? null : v))
+  }));
+  return { resolution: header.resolution, ts, total: Array.from(total), byEqp };
+}
 function fmtDur(sec) {
   if (sec == null) return '-';
   const s = Math.max(0, parseInt(sec, 10));
@@ -58,13 +84,16 @@ function updateStatus(status) {
   else { dot.textContent = "⚪"; card.style.borderColor = "#9ca3af"; }
 }
 
+function renderSummary(data) {
+  animateValue(document.getElementById('dailyProduction'), data.dailyProduction ?? 0);
+  animateValue(document.getElementById('efficiency'), (data.efficiency ?? 0).toFixed(2));
+  updateStatus(data.status ?? "N/A");
+}
+
 async function fetchSummary() {
   try {
-    const res = await fetch('/api/summary', { cache: 'no-store' });
-    const data = await res.json();
-    animateValue(document.getElementById('dailyProduction'), data.dailyProduction ?? 0);
-    animateValue(document.getElementById('efficiency'), (data.efficiency ?? 0).toFixed(2));
-    updateStatus(data.status ?? "N/A");
+    const res = await fetch('/api/summary', { cache: 'no-cache' });
+    renderSummary(await res.json());
   } catch (e) {
     console.error('fetch /api/summary failed', e);
   }
@@ -74,6 +103,11 @@ async function fetchSummary() {
 async function fetchEquipment() {
   const res = await fetch('/api/equipment');
   equipmentData = await res.json();
+  renderEquipmentTable();
+  // 同步更新維修「第一頁」的設備清單（若已載入維修資料）
+  renderMaintList();
+}
+function renderEquipmentTable() {
   const body = document.getElementById("equipmentTableBody");
   if (body) {
     body.innerHTML = "";
@@ -91,27 +125,27 @@ async function fetchEquipment() {
       body.appendChild(tr);
     });
   }
-  // 同步更新維修「第一頁」的設備清單（若已載入維修資料）
-  renderMaintList();
 }
 async function addEquipment() {
   const input = document.getElementById("newEquipmentId");
   const id = input.value.trim();
   if (!id) return alert("請輸入設備 ID！");
-  await fetch('/api/equipment', {
+  const res = await fetch('/api/equipment', {
     method: "POST", headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ equipment_id: id })
   });
+  if (!res.ok) return alert((await res.json()).detail || "新增失敗");
   input.value = ""; fetchEquipment();
 }
 async function editEquipment(id) {
   const current = equipmentData.find(e => e.id === id);
   const newId = prompt("修改設備 ID：", current?.equipment_id || "");
   if (newId && newId.trim() !== "") {
-    await fetch(`/api/equipment/${id}`, {
+    const res = await fetch(`/api/equipment/${id}`, {
       method: "PUT", headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ equipment_id: newId })
     });
+    if (!res.ok) return alert((await res.json()).detail || "修改失敗");
     fetchEquipment();
   }
 }
@@ -233,36 +267,38 @@ async function fetchMetrics(forceReload = false) {
 
     if (timeRange === "realtime") {
       showRealtimeOpts(true); ensureChart();
-      const res = await fetch(`/api/metrics?range=realtime`, { cache: 'no-store' });
+      // 已有資料 → 只抓 lastTs 之後的新 tick；落後太多時後端回 resync，改抓整段
+      if (!forceReload && rtState.lastTs) {
+        const res = await fetch(`/api/metrics/since?cursor=${encodeURIComponent(rtState.lastTs)}`, { cache: 'no-cache' });
+        const data = await res.json();
+        if (!data.resync) { appendRealtime(data); renderRealtime(); return; }
+      }
+      const res = await fetch(`/api/metrics?range=realtime`, { cache: 'no-cache' });
       const data = await res.json();
 
-      if (forceReload || !rtState.lastTs) {
-        const sel = document.getElementById("realtimePoints");
-        rtState.maxPoints = parseInt((sel && sel.value) || "40", 10);
-        rtState.labels = []; rtState.total = []; rtState.perEqp = new Map();
-
-        const items = data.items_total || [];
-        const take = Math.min(items.length, rtState.maxPoints);
-        const startIdx = items.length - take;
-
-        const eqMap = new Map();
-        (data.items_by_equipment || []).forEach(series => {
-          eqMap.set(series.equipment_id, new Map(series.points.map(pt => [pt.ts, pt.production])));
-        });
-
-        for (let i = startIdx; i < items.length; i++) {
-          const p = items[i];
-          rtState.labels.push(toLocaleTime(p.ts));
-          rtState.total.push(p.production);
-          for (const [eid] of eqMap.entries()) if (!rtState.perEqp.has(eid)) rtState.perEqp.set(eid, []);
-          for (const [eid, arr] of rtState.perEqp.entries()) {
-            const m = eqMap.get(eid);
-            arr.push(m && m.has(p.ts) ? m.get(p.ts) : null);
-          }
-          rtState.lastTs = p.ts;
+      const sel = document.getElementById("realtimePoints");
+      rtState.maxPoints = parseInt((sel && sel.value) || "40", 10);
+      rtState.labels = []; rtState.total = []; rtState.perEqp = new Map();
+
+      const items = data.items_total || [];
+      const take = Math.min(items.length, rtState.maxPoints);
+      const startIdx = items.length - take;
+
+      const eqMap = new Map();
+      (data.items_by_equipment || []).forEach(series => {
+        eqMap.set(series.equipment_id, new Map(series.points.map(pt => [pt.ts, pt.production])));
+      });
+
+      for (let i = startIdx; i < items.length; i++) {
+        const p = items[i];
+        rtState.labels.push(toLocaleTime(p.ts));
+        rtState.total.push(p.production);
+        for (const [eid] of eqMap.entries()) if (!rtState.perEqp.has(eid)) rtState.perEqp.set(eid, []);
+        for (const [eid, arr] of rtState.perEqp.entries()) {
+          const m = eqMap.get(eid);
+          arr.push(m && m.has(p.ts) ? m.get(p.ts) : null);
         }
-      } else {
-        appendRealtime(data);
+        rtState.lastTs = p.ts;
       }
 
       renderRealtime();
@@ -272,21 +308,21 @@ async function fetchMetrics(forceReload = false) {
     showRealtimeOpts(false);
     rtState.lastTs = null; rtState.labels = []; rtState.total = []; rtState.perEqp = new Map();
 
-    const res = await fetch(`/api/metrics?range=${timeRange}`, { cache: 'no-store' });
-    const data = await res.json();
+    // 非即時範圍點數多 → 用二進位欄式格式（共用時間軸 + TypedArray），省傳輸量與 JSON.parse
+    const res = await fetch(`/api/metrics?range=${timeRange}&format=binary`, { cache: 'no-cache' });
+    const data = decodeColumnar(await res.arrayBuffer());
     ensureChart();
 
-    if ((data.items_total || []).length === 0) {
+    if (data.byEqp.length === 0) {
       chart.data.labels = [toLocaleTime(new Date().toISOString())];
       chart.data.datasets = [{ label: '無資料', data: [0] }];
       chart.update(); return;
     }
 
-    const labels = buildLabels(data.items_total);
-    const tsKeys = data.items_total.map(p => p.ts);
+    const labels = data.ts.map(toLocaleTime);
 
     if (seriesMode === "total") {
-      let series = data.items_total.map(p => p.production);
+      let series = data.total;
       if (valueMode === "delta") series = toDelta(series);
       chart.data.labels = labels;
       chart.data.datasets = [{
@@ -297,9 +333,8 @@ async function fetchMetrics(forceReload = false) {
       }];
     } else {
       const palette = ['#2563eb', '#10b981', '#f59e0b', '#ef4444', '#8b5cf6', '#06b6d4', '#84cc16', '#dc2626'];
-      const datasets = (data.items_by_equipment || []).map((series, idx) => {
-        const map = new Map(series.points.map(p => [p.ts, p.production]));
-        let aligned = tsKeys.map(ts => map.get(ts) ?? null);
+      const datasets = data.byEqp.map((series, idx) => {
+        let aligned = series.values;
         if (valueMode === "delta") {
           const diff = [];
           for (let i = 0; i < aligned.length; i++) {
@@ -322,35 +357,52 @@ async function fetchMetrics(forceReload = false) {
 }
 
 /* ===================== 告警 ===================== */
+let alertEvents = [];        // 最新在前，最多 20 筆（與後端一致）
+
 async function fetchAlerts() {
   try {
-    const res = await fetch('/api/alerts?hours=12', { cache: 'no-store' });
+    const res = await fetch('/api/alerts?hours=12', { cache: 'no-cache' });
     const data = await res.json();
-    const list = document.getElementById("alertsList");
-    list.innerHTML = "";
+    alertEvents = data.events || [];
+    renderAlerts();
+  } catch (e) { console.error('fetch /api/alerts failed', e); }
+}
 
-    if (!data.events || data.events.length === 0) {
-      list.innerHTML = '<p class="muted">目前沒有告警。</p>';
-      return;
-    }
+// 規則告警（alerts.py）：標籤與數值的顯示方式
+const RULE_LABELS = {
+  LOW_EFFICIENCY: ev => `效率偏低（${(ev.value * 100).toFixed(0)}% < ${(ev.threshold * 100).toFixed(0)}%）`,
+  ZERO_OUTPUT:    ()  => "運轉中無產出",
+  MTTR_EXCEEDED:  ev => `維修超時（已 ${Math.round(ev.value / 60)} 分鐘）`,
+  RATE_DRIFT:     ev => `產能偏移（${ev.value > 0 ? "+" : ""}${(ev.value * 100).toFixed(0)}%）`,
+};
 
-    data.events.forEach(ev => {
-      const div = document.createElement("div");
-      if (ev.type === "ERROR_START")      div.className = "alert error";
-      else if (ev.type === "ERROR_END")   div.className = "alert ok";
-      else                                div.className = "alert info";
-      const when = fmt(ev.ts);
-      const label = (ev.type === "ERROR_START") ? "發生故障" : (ev.type === "ERROR_END") ? "恢復正常" : ev.type;
-      div.textContent = `[${when}] ${ev.equipment_id}：${label}`;
-      list.appendChild(div);
-    });
-  } catch (e) { console.error('fetch /api/alerts failed', e); }
+function renderAlerts() {
+  const list = document.getElementById("alertsList");
+  list.innerHTML = "";
+
+  if (alertEvents.length === 0) {
+    list.innerHTML = '<p class="muted">目前沒有告警。</p>';
+    return;
+  }
+
+  alertEvents.forEach(ev => {
+    const div = document.createElement("div");
+    if (ev.type === "ERROR_START")      div.className = "alert error";
+    else if (ev.type === "ERROR_END")   div.className = "alert ok";
+    else if (RULE_LABELS[ev.type])      div.className = "alert warn";
+    else                                div.className = "alert info";
+    const when = fmt(ev.ts);
+    const label = (ev.type === "ERROR_START") ? "發生故障" : (ev.type === "ERROR_END") ? "恢復正常"
+                : RULE_LABELS[ev.type] ? RULE_LABELS[ev.type](ev) : ev.type;
+    div.textContent = `[${when}] ${ev.equipment_id}：${label}`;
+    list.appendChild(div);
+  });
 }
 
 /* ===================== 維修紀錄（兩階段） ===================== */
 async function fetchMaintenanceRecords() {
   try {
-    const res = await fetch(`/api/maintenance?hours=${maint.hours}`, { cache: 'no-store' });
+    const res = await fetch(`/api/maintenance?hours=${maint.hours}`, { cache: 'no-cache' });
     const data = await res.json();
     maint.records = Array.isArray(data.records) ? data.records : [];
     // 根據目前視圖重新渲染
@@ -451,6 +503,58 @@ document.addEventListener('keydown', (e) => {
   }
 });
 
+/* ===================== 即時推播（SSE） ===================== */
+let lastHistFetch = 0;       // 非即時範圍的圖表：推播觸發重抓，最多每 60 秒一次
+let lastMaintFetch = 0;      // 有進行中的維修時，每 10 秒重抓一次更新時長
+
+function applyStreamTick(d) {
+  if (d.resync) {            // 漏掉太多 tick → 重抓（realtime 圖表只補缺的那段）
+    fetchMetrics(); fetchAlerts(); fetchMaintenanceRecords(); fetchEquipment();
+    return;
+  }
+  if (d.summary) renderSummary(d.summary);
+
+  if (d.items_total && d.items_total.length) {
+    const timeRange = document.getElementById("timeRange")?.value || "realtime";
+    if (timeRange === "realtime") {
+      if (rtState.lastTs) { appendRealtime(d); renderRealtime(); }
+    } else if (Date.now() - lastHistFetch > 60000) {
+      lastHistFetch = Date.now(); fetchMetrics();
+    }
+  }
+
+  if (d.equipment && d.equipment.length) {
+    const byId = new Map(d.equipment.map(e => [e.equipment_id, e]));
+    equipmentData.forEach(m => { const u = byId.get(m.equipment_id); if (u) Object.assign(m, u); });
+    renderEquipmentTable();
+  }
+
+  const hasEvents = d.events && d.events.length > 0;
+  if (hasEvents) {
+    alertEvents = d.events.concat(alertEvents).slice(0, 20);
+    renderAlerts();
+  }
+  const hasErrorEvents = hasEvents && d.events.some(e => e.type === "ERROR_START" || e.type === "ERROR_END");
+  if (hasErrorEvents || (maint.records.some(r => r.ongoing) && Date.now() - lastMaintFetch > 10000)) {
+    lastMaintFetch = Date.now(); fetchMaintenanceRecords();
+  }
+}
+
+function startStream() {
+  const es = new EventSource('/api/stream');
+  let opened = false;
+  es.onopen = () => {
+    // 斷線重連：中間的 tick 可能漏掉，補抓一次（realtime 圖表走 /api/metrics/since）
+    if (opened) { fetchMetrics(); fetchAlerts(); fetchMaintenanceRecords(); }
+    opened = true;
+  };
+  es.onmessage = (e) => {
+    try { applyStreamTick(JSON.parse(e.data)); }
+    catch (err) { console.error('stream message failed', err); }
+  };
+  // onerror：EventSource 會自動重連，不需處理
+}
+
 /* ===================== 初始化與排程 ===================== */
 (function init() {
   fetchSummary();
@@ -459,11 +563,15 @@ document.addEventListener('keydown', (e) => {
   fetchAlerts();
   fetchMaintenanceRecords();  // 會渲染維修第一頁
 
-  setInterval(fetchSummary, 5000);
-  setInterval(fetchMetrics, 5000);
-  setInterval(fetchEquipment, 10000);
-  setInterval(fetchAlerts, 5000);
-  setInterval(fetchMaintenanceRecords, 10000);
+  if (window.EventSource) {
+    startStream();            // 之後的更新全由 /api/stream 推送
+  } else {
+    setInterval(fetchSummary, 5000);
+    setInterval(fetchMetrics, 5000);
+    setInterval(fetchEquipment, 10000);
+    setInterval(fetchAlerts, 5000);
+    setInterval(fetchMaintenanceRecords, 10000);
+  }
 })();
 
 /* ===================== 對外（給 HTML 使用的按鈕） ===================== */
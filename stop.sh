@@ -6,6 +6,9 @@ pkill -f "uvicorn app:app"
 # 關閉 simulator.py
 pkill -f "simulator.py"
 
+# 關閉匯流排中繼（多 worker 模式）
+pkill -f "bus.py serve"
+
 # 關閉 cloudflared（如果有開）
 pkill -f "cloudflared"
 
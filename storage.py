@@ -0,0 +1,647 @@
+# storage.py
+# 原始資料（每台設備每個 tick 一筆）的儲存後端：app.py 的查詢、state_cache、匯出與 simulator 的寫入都經過這裡
+# 後端由 STORAGE_URL 決定（寫入端與所有 API worker 要設成一樣）：
+#   sqlite://（預設）        SQLite 各日分表（partitions.py），跟 rollup / 事件同一個 transaction 寫入
+#   columnar://./tsdata      本機欄式檔案：每台設備每天一串固定容量的 chunk，只附加、memory-map 讀取
+# 彙總表、事件、告警、設備清單一律在 SQLite；這裡只管原始資料。
+# 每個後端提供同樣的方法（參數 db 是 SQLAlchemy Session；欄式後端只在需要設備清單時用到），
+# 回傳的資料與排序完全相同（依 (ts, equipment_id) 升冪），由 benchmarks/check_storage.py 逐項比對
+import datetime as dt
+import mmap
+import os
+import shutil
+import struct
+import threading
+import urllib.parse
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import String, func, select, type_coerce
+from sqlalchemy.orm import Session
+
+from models import Equipment
+from queries import last_rows_per_equipment
+import partitions
+
+STORAGE_URL = os.environ.get("STORAGE_URL", "sqlite://")
+EPOCH = dt.datetime(1970, 1, 1)
+TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"   # 與 SQLAlchemy DateTime 存進 SQLite 的字串相同
+
+
+# ====== 後端：SQLite 各日分表 ======
+class SQLiteStore:
+    in_sqlite = True   # 原始資料在 SQLite 裡：rollup / 事件可以直接用 SQL 從原始資料重建
+
+    def append(self, db: Session, rows):
+        """
+        寫入端：rows = [(equipment_id, ts, status, production, efficiency)]，須同一個 UTC 日
+        不 commit，跟 rollup / 事件 / 告警同一個 transaction
+        """
+        if not rows:
+            return
+        text = {}
+        for r in rows:   # 同一個 tick 共用 ts，只格式化一次
+            if r[1] not in text:
+                text[r[1]] = r[1].strftime(TS_FORMAT)
+        table = partitions.for_day(db, rows[0][1].date())
+        db.connection().exec_driver_sql(
+            f"INSERT INTO {table.name} (equipment_id, ts, status, production, efficiency) VALUES (?, ?, ?, ?, ?)",
+            [(eid, text[ts], status, prod, eff) for eid, ts, status, prod, eff in rows],
+        )
+
+    def production_since(self, db: Session, since: dt.datetime, until: dt.datetime = None):
+        """[since, until) 的 [(equipment_id, ts, production)]；走各分表 ts 覆蓋索引的範圍掃描"""
+        out = []
+        for m in partitions.overlapping(db, since, until):
+            q = db.query(m.c.equipment_id, m.c.ts, m.c.production).filter(m.c.ts >= since)
+            if until is not None:
+                q = q.filter(m.c.ts < until)
+            out.extend(q.order_by(m.c.ts, m.c.equipment_id).all())
+        return out
+
+    def production_after(self, db: Session, after: dt.datetime, limit: int):
+        """after 之後（不含）的 [(equipment_id, ts, production)]，最多 limit 筆"""
+        out = []
+        for m in partitions.overlapping(db, after):
+            out.extend(
+                db.query(m.c.equipment_id, m.c.ts, m.c.production)
+                .filter(m.c.ts > after)
+                .order_by(m.c.ts, m.c.equipment_id)
+                .limit(limit - len(out))
+                .all()
+            )
+            if len(out) >= limit:
+                break
+        return out
+
+    def recent_stamps(self, db: Session, ticks: int):
+        """最近 ticks 個不重複的 ts（新到舊）；分表由新到舊讀，湊滿就停（通常只碰今天這張）"""
+        stamps = []
+        for m in partitions.overlapping(db, newest_first=True):
+            stamps.extend(
+                ts for (ts,) in db.query(m.c.ts).distinct().order_by(m.c.ts.desc()).limit(ticks - len(stamps))
+            )
+            if len(stamps) >= ticks:
+                break
+        return stamps
+
+    def rows_after(self, db: Session, after: dt.datetime = None, limit: int = None):
+        """after 之後（不含；None 表示全部）的 [(equipment_id, ts, status, production, efficiency)]，最多 limit 筆"""
+        out = []
+        for m in partitions.overlapping(db, since=after):
+            q = db.query(m.c.equipment_id, m.c.ts, m.c.status, m.c.production, m.c.efficiency)
+            if after is not None:
+                q = q.filter(m.c.ts > after)
+            q = q.order_by(m.c.ts, m.c.equipment_id)
+            if limit is not None:
+                q = q.limit(limit - len(out))
+            out.extend(q.all())
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    def latest(self, db: Session, before: dt.datetime = None, since: dt.datetime = None):
+        """{equipment_id: (ts, production, status, efficiency)}：每台設備在 [since, before) 的最後一筆"""
+        return last_rows_per_equipment(db, before=before, since=since)
+
+    def scan(self, db: Session, since: dt.datetime, until: dt.datetime, equipment: str = None, batch_rows: int = 10000):
+        """
+        匯出用：[since, until) 依 (ts, equipment_id) 升冪，每次 yield 最多 batch_rows 筆
+        (ts ISO 字串, equipment_id, status, production, efficiency)；ts 在 SQL 端把空白換成 T，不經 datetime
+        """
+        for m in partitions.overlapping(db, since, until):
+            # 有指定設備走 (equipment_id, ts) 索引，否則走 ts 覆蓋索引的範圍掃描
+            stmt = (
+                select(func.replace(type_coerce(m.c.ts, String), " ", "T"),
+                       m.c.equipment_id, m.c.status, m.c.production, m.c.efficiency)
+                .where(m.c.ts >= since, m.c.ts < until)
+                .order_by(m.c.ts, m.c.equipment_id)
+            )
+            if equipment:
+                stmt = stmt.where(m.c.equipment_id == equipment)
+            result = db.execute(stmt, execution_options={"yield_per": batch_rows})
+            for batch in result.partitions():
+                yield batch
+
+    def newest_ts(self, db: Session):
+        """最新一筆的 ts（沒有資料回 None）"""
+        stamps = self.recent_stamps(db, 1)
+        return stamps[0] if stamps else None
+
+    def earliest_ts(self, db: Session):
+        return partitions.earliest_ts(db)
+
+    def drop_expired(self, db: Session, now: dt.datetime = None, days: int = partitions.RAW_RETENTION_DAYS):
+        return partitions.drop_expired(db, now, days)
+
+
+# ====== 後端：欄式、只附加的本機檔案 ======
+# <root>/HEAD                              已寫完的最新 ts（int64 µs）；讀取端只看得到 <= HEAD 的資料
+# <root>/<YYYYMMDD>/<設備 ID>/<序號>.chk   一個 chunk：64 bytes header + 四個固定容量的欄位區
+#   header: magic, 版本, 容量, 筆數, 起點 ts, 起點產量, 最後 ts, 最後產量
+#   ts      uint32  與前一筆的差（µs；第一筆為 0）
+#   prod    int32   與前一筆的差（累積產量，每個 UTC 日歸零）
+#   eff     int16   效率 × 100（寫入端本來就四捨五入到兩位）
+#   status  uint8   STATUS 的索引
+# 寫入：先寫欄位資料、最後寫 header 的筆數，讀取端依筆數讀，不會讀到寫一半的列；
+# 差值放不下（間隔超過約 71 分鐘）、時間倒退（回填更早的資料）、chunk 寫滿就開新 chunk。
+# 讀取：mmap 對應整個 chunk，ts / 產量做 cumsum 還原（解碼結果依筆數快取，新寫入的部分只解碼增量）；
+# 同一時間只能有一個寫入者（同 SQLite），讀取端可以有很多個（各 API worker）
+CHUNK_ROWS = 4096                   # 每個 chunk 的容量（5 秒一個 tick 約 5.7 小時）
+CACHE_ROWS = 2_000_000              # 解碼快取最多保留幾筆（ts + 產量各 8 bytes）
+SCAN_WINDOW_US = 3600 * 1_000_000   # 匯出 / 長區間讀取第一個時間窗的長度（之後依筆數調整）
+SCAN_ROWS = 200_000                 # 每個時間窗大約讀幾筆一起排序：記憶體用量與區間長短無關
+SEALED_MAX = 200_000                # 寫滿的 chunk 記住時間範圍（不必開檔就能略過），最多記幾個
+STATUS = ("RUN", "IDLE", "ERROR")
+
+HEADER = struct.Struct("<4sIIIqqqq")
+HEADER_SIZE = 64
+MAGIC = b"SFMC"
+VERSION = 1
+DAY_US = 86_400 * 1_000_000
+U32_MAX = 2**32 - 1
+I32_MAX = 2**31 - 1
+LO, HI = -(2**62), 2**62            # 不限時間的上下界（µs）
+_STATUS_CODE = {s: i for i, s in enumerate(STATUS)}
+_STATUS_NAMES = np.array(STATUS, dtype=object)
+
+
+def _us(ts: dt.datetime) -> int:
+    return (ts - EPOCH) // dt.timedelta(microseconds=1)
+
+
+def _datetimes(us):
+    """int64 µs 陣列 → [datetime]"""
+    return us.astype("datetime64[us]").tolist()
+
+
+def _regions(cap: int):
+    """各欄位區在 chunk 檔裡的 offset：(ts, prod, eff, status, 檔案大小)"""
+    ts = HEADER_SIZE
+    prod = ts + 4 * cap
+    eff = prod + 4 * cap
+    st = eff + 2 * cap
+    return ts, prod, eff, st, st + cap
+
+
+class _Tail:
+    """寫入端：某台設備某一天正在寫的 chunk"""
+    __slots__ = ("path", "seq", "cap", "n", "last_ts", "last_prod")
+
+    def __init__(self, path, seq, cap, n, last_ts, last_prod):
+        self.path, self.seq, self.cap, self.n = path, seq, cap, n
+        self.last_ts, self.last_prod = last_ts, last_prod
+
+
+class ColumnarStore:
+    in_sqlite = False
+
+    def __init__(self, root: str, chunk_rows: int = CHUNK_ROWS):
+        self.root = root
+        self.chunk_rows = chunk_rows
+        self._head_path = os.path.join(root, "HEAD")
+        self._lock = threading.Lock()      # 寫入端
+        self._tail_day = None
+        self._tail = {}                    # 設備 → _Tail（只留目前寫入中的那一天）
+        self._head = None
+        self._cache_lock = threading.Lock()
+        self._cache = OrderedDict()        # chunk 路徑 → (筆數, ts, prod)（LRU）
+        self._cached_rows = 0
+        self._sealed = {}                  # 寫滿的 chunk 路徑 → (第一筆 ts, 最後一筆 ts)，不必開檔就能略過
+
+    # ---------- 目錄 ----------
+    def _days(self):
+        """[(當天 00:00 的 µs, 目錄)]，依日期升冪"""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        out = []
+        for name in names:
+            if len(name) == 8 and name.isdigit():
+                out.append((_us(dt.datetime.strptime(name, "%Y%m%d")), os.path.join(self.root, name)))
+        out.sort()
+        return out
+
+    def _equipment_dirs(self, day_dir: str):
+        try:
+            return {urllib.parse.unquote(name): os.path.join(day_dir, name) for name in os.listdir(day_dir)}
+        except FileNotFoundError:
+            return {}
+
+    def _chunks(self, eqp_dir: str):
+        try:
+            return [os.path.join(eqp_dir, f) for f in sorted(os.listdir(eqp_dir)) if f.endswith(".chk")]
+        except FileNotFoundError:
+            return []
+
+    def _read_head(self):
+        try:
+            with open(self._head_path, "rb") as f:
+                data = f.read(8)
+        except FileNotFoundError:
+            return None
+        return int.from_bytes(data, "little", signed=True) if len(data) == 8 else None
+
+    # ---------- 寫入 ----------
+    def append(self, db: Session, rows):
+        """
+        寫入端：rows = [(equipment_id, ts, status, production, efficiency)]，須同一個 UTC 日。
+        檔案立即寫入（不跟 SQLite 的 transaction 連動）；全部寫完才推進 HEAD，讀取端看到的是完整的 tick
+        """
+        if not rows:
+            return
+        micros = {}
+        for r in rows:
+            if r[1] not in micros:
+                micros[r[1]] = _us(r[1])
+        eids = [r[0] for r in rows]
+        ts = np.fromiter((micros[r[1]] for r in rows), np.int64, len(rows))
+        prod = np.fromiter((r[3] for r in rows), np.int64, len(rows))
+        eff = np.rint(np.fromiter((r[4] for r in rows), float, len(rows)) * 100).astype("<i2")
+        st = np.fromiter((_STATUS_CODE[r[2]] for r in rows), np.uint8, len(rows))
+        day = int(ts[0] // DAY_US)
+
+        with self._lock:
+            if day != self._tail_day:
+                self._tail_day, self._tail = day, {}
+            # 依設備分組（穩定排序，同一台的順序不變）；即時模式每台一筆，回填時每台一段連續的 tick
+            order = sorted(range(len(eids)), key=eids.__getitem__)
+            start = 0
+            for k in range(1, len(order) + 1):
+                if k == len(order) or eids[order[k]] != eids[order[start]]:
+                    idx = np.array(order[start:k])
+                    self._append_one(day, eids[order[start]], ts[idx], prod[idx], eff[idx], st[idx])
+                    start = k
+            top = int(ts.max())
+            if self._head is None:
+                self._head = self._read_head()
+            if self._head is None or top > self._head:
+                os.makedirs(self.root, exist_ok=True)
+                with open(self._head_path, "wb") as f:
+                    f.write(top.to_bytes(8, "little", signed=True))
+                self._head = top
+
+    def _append_one(self, day, eid, ts, prod, eff, st):
+        i, k = 0, len(ts)
+        while i < k:
+            tail = self._tail.get(eid) or self._open_tail(day, eid)
+            if tail is None or tail.n == tail.cap:
+                tail = self._new_chunk(day, eid, tail, int(ts[i]), int(prod[i]))
+            d_ts = np.diff(ts[i:], prepend=tail.last_ts)
+            d_prod = np.diff(prod[i:], prepend=tail.last_prod)
+            bad = (d_ts < 0) | (d_ts > U32_MAX) | (np.abs(d_prod) > I32_MAX)
+            m = int(np.argmax(bad)) if bad.any() else k - i
+            m = min(m, tail.cap - tail.n)
+            if m == 0:   # 放不進目前的 chunk → 下一圈從這筆開新 chunk
+                self._tail[eid] = tail = self._new_chunk(day, eid, tail, int(ts[i]), int(prod[i]))
+                continue
+            self._write(tail, d_ts[:m], d_prod[:m], eff[i:i + m], st[i:i + m], int(ts[i + m - 1]), int(prod[i + m - 1]))
+            i += m
+
+    def _write(self, tail, d_ts, d_prod, eff, st, last_ts, last_prod):
+        o_ts, o_prod, o_eff, o_st, _ = _regions(tail.cap)
+        n, m = tail.n, len(d_ts)
+        fd = os.open(tail.path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, d_ts.astype("<u4").tobytes(), o_ts + 4 * n)
+            os.pwrite(fd, d_prod.astype("<i4").tobytes(), o_prod + 4 * n)
+            os.pwrite(fd, eff.tobytes(), o_eff + 2 * n)
+            os.pwrite(fd, st.tobytes(), o_st + n)
+            # 最後才更新 header：先寫最後一筆的值，再寫筆數
+            os.pwrite(fd, struct.pack("<qq", last_ts, last_prod), 32)
+            os.pwrite(fd, struct.pack("<I", n + m), 12)
+        finally:
+            os.close(fd)
+        tail.n, tail.last_ts, tail.last_prod = n + m, last_ts, last_prod
+
+    def _open_tail(self, day, eid):
+        """這台設備這一天最後一個 chunk（寫入端重啟後接著寫）"""
+        eqp_dir = self._eqp_dir(day, eid)
+        chunks = self._chunks(eqp_dir)
+        if not chunks:
+            return None
+        path = chunks[-1]
+        with open(path, "rb") as f:
+            magic, _, cap, n, _, _, last_ts, last_prod = HEADER.unpack(f.read(HEADER.size))
+        tail = _Tail(path, int(os.path.basename(path)[:-4]), cap, n, last_ts, last_prod)
+        self._tail[eid] = tail
+        return tail
+
+    def _new_chunk(self, day, eid, prev, base_ts, base_prod):
+        """開新 chunk（先寫到暫存檔再 rename，讀取端不會看到不完整的檔案）"""
+        eqp_dir = self._eqp_dir(day, eid)
+        os.makedirs(eqp_dir, exist_ok=True)
+        seq = prev.seq + 1 if prev is not None else len(self._chunks(eqp_dir))
+        path = os.path.join(eqp_dir, f"{seq:06d}.chk")
+        cap = self.chunk_rows
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, cap, 0, base_ts, base_prod, base_ts, base_prod))
+            f.truncate(_regions(cap)[-1])
+        os.replace(tmp, path)
+        tail = self._tail[eid] = _Tail(path, seq, cap, 0, base_ts, base_prod)
+        return tail
+
+    def _eqp_dir(self, day, eid):
+        name = (EPOCH + dt.timedelta(days=day)).strftime("%Y%m%d")
+        return os.path.join(self.root, name, urllib.parse.quote(eid, safe=""))
+
+    # ---------- 讀取 ----------
+    def _read(self, path, lo: int, hi: int):
+        """chunk 裡 [lo, hi) 的 (ts, prod, eff, status) 陣列；沒有資料回 None"""
+        sealed = self._sealed.get(path)
+        if sealed is not None and (sealed[1] < lo or sealed[0] >= hi):
+            return None
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:   # 剛被保留期限刪掉
+            return None
+        try:
+            # 先看 header 就能略過大部分 chunk（最後 ts 比筆數先寫，只可能偏新、不會漏）
+            magic, _, cap, n, base_ts, base_prod, last_ts, _ = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+            if magic != MAGIC or n == 0 or base_ts >= hi or last_ts < lo:
+                return None
+            mm = np.frombuffer(mmap.mmap(fd, 0, access=mmap.ACCESS_READ), np.uint8)
+        finally:
+            os.close(fd)
+        if n == cap and sealed is None:
+            if len(self._sealed) > SEALED_MAX:   # 讀取端不會收到刪除通知，太多就整個清掉重來
+                self._sealed.clear()
+            self._sealed[path] = (base_ts, last_ts)
+        ts, prod = self._decode(path, mm, cap, n, base_ts, base_prod)
+        a, b = np.searchsorted(ts, (lo, hi))
+        if a == b:
+            return None
+        _, _, o_eff, o_st, _ = _regions(cap)
+        eff = mm[o_eff + 2 * a:o_eff + 2 * b].view("<i2") / 100.0
+        st = mm[o_st + a:o_st + b].copy()   # 回傳的都是複本，mmap 隨 mm 釋放
+        return ts[a:b], prod[a:b], eff, st
+
+    def _decode(self, path, mm, cap, n, base_ts, base_prod):
+        with self._cache_lock:
+            hit = self._cache.get(path)
+            if hit is not None:
+                self._cache.move_to_end(path)
+        k = hit[0] if hit is not None else 0
+        if k == n:
+            return hit[1], hit[2]
+        o_ts, o_prod, _, _, _ = _regions(cap)
+        ts = np.cumsum(mm[o_ts + 4 * k:o_ts + 4 * n].view("<u4"), dtype=np.int64)
+        prod = np.cumsum(mm[o_prod + 4 * k:o_prod + 4 * n].view("<i4"), dtype=np.int64)
+        if k:
+            ts = np.concatenate([hit[1], ts + hit[1][-1]])
+            prod = np.concatenate([hit[2], prod + hit[2][-1]])
+        else:
+            ts += base_ts
+            prod += base_prod
+        with self._cache_lock:
+            old = self._cache.pop(path, None)
+            self._cached_rows += n - (old[0] if old is not None else 0)
+            self._cache[path] = (n, ts, prod)
+            while self._cached_rows > CACHE_ROWS and len(self._cache) > 1:
+                _, (m, _, _) = self._cache.popitem(last=False)
+                self._cached_rows -= m
+        return ts, prod
+
+    def _tree(self, lo: int, hi: int, equipment=None):
+        """與 [lo, hi) 有交集的日期：[(當天 00:00 的 µs, {設備: [chunk 路徑]})]；一次查詢只列一次目錄"""
+        out = []
+        for day_us, day_dir in self._days():
+            if day_us + DAY_US <= lo or day_us >= hi:
+                continue
+            dirs = self._equipment_dirs(day_dir)
+            eids = dirs if equipment is None else [eid for eid in equipment if eid in dirs]
+            out.append((day_us, {eid: self._chunks(dirs[eid]) for eid in eids}))
+        return out
+
+    def _load(self, lo: int, hi: int, tree):
+        """
+        [lo, hi)（µs，已限制在 HEAD 以內）的資料，依 (ts, equipment_id) 排序：
+        回傳 (設備 ID 清單, 各列的設備索引, ts, prod, eff, status)
+        """
+        names, parts = [], []
+        for day_us, chunks in tree:
+            if day_us + DAY_US <= lo or day_us >= hi:
+                continue
+            for eid, paths in chunks.items():
+                for path in paths:
+                    part = self._read(path, lo, hi)
+                    if part is not None:
+                        names.append(eid)
+                        parts.append(part)
+        if not parts:
+            return [], np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0), np.empty(0, np.uint8)
+        uniq = sorted(set(names))
+        rank = {eid: i for i, eid in enumerate(uniq)}
+        idx = np.concatenate([np.full(len(p[0]), rank[eid], np.int64) for eid, p in zip(names, parts)])
+        ts, prod, eff, st = (np.concatenate(col) for col in zip(*parts))
+        order = np.lexsort((idx, ts))
+        return uniq, idx[order], ts[order], prod[order], eff[order], st[order]
+
+    def _bounds(self, since=None, until=None):
+        """查詢區間換成 µs，並限制在 HEAD 以內；沒有資料回 None"""
+        head = self._read_head()
+        if head is None:
+            return None
+        lo = _us(since) if since is not None else LO
+        hi = min(_us(until), head + 1) if until is not None else head + 1
+        return (lo, hi) if lo < hi else None
+
+    def _windows(self, lo: int, hi: int, equipment=None):
+        """
+        把 [lo, hi) 切成時間窗逐段 _load（只走有資料的日期）。
+        窗長從 SCAN_WINDOW_US 開始，依上一窗的筆數調整成每窗約 SCAN_ROWS 筆：
+        設備少（單台匯出）或 tick 稀疏時不會為了幾百筆資料逐小時開檔
+        """
+        tree = self._tree(lo, hi, equipment)
+        window = SCAN_WINDOW_US
+        t = lo
+        while tree and t < hi:
+            if t >= tree[0][0] + DAY_US:   # 跳過沒有資料的日子
+                tree = [d for d in tree if d[0] + DAY_US > t]
+                continue
+            t = max(t, tree[0][0])
+            end = min(t + window, hi)
+            w = self._load(t, end, tree)
+            if len(w[2]):
+                yield w
+            window = int(min(max(window * SCAN_ROWS / max(len(w[2]), 1), SCAN_WINDOW_US // 60), DAY_US))
+            t = end
+
+    def production_since(self, db: Session, since: dt.datetime, until: dt.datetime = None):
+        bounds = self._bounds(since, until)
+        if bounds is None:
+            return []
+        out = []
+        for names, idx, ts, prod, _, _ in self._windows(*bounds):
+            out.extend(zip([names[i] for i in idx.tolist()], _datetimes(ts), prod.tolist()))
+        return out
+
+    def production_after(self, db: Session, after: dt.datetime, limit: int):
+        bounds = self._bounds(after)
+        if bounds is None:
+            return []
+        out = []
+        for names, idx, ts, prod, _, _ in self._windows(bounds[0] + 1, bounds[1]):
+            out.extend(zip([names[i] for i in idx.tolist()], _datetimes(ts), prod.tolist()))
+            if len(out) >= limit:
+                break
+        return out[:limit]
+
+    def recent_stamps(self, db: Session, ticks: int):
+        bounds = self._bounds()
+        if bounds is None:
+            return []
+        stamps = np.empty(0, np.int64)
+        for _, day_dir in reversed(self._days()):
+            tails = [stamps]
+            for eqp_dir in self._equipment_dirs(day_dir).values():
+                for path in self._chunks(eqp_dir):
+                    part = self._read(path, *bounds)
+                    if part is not None:
+                        tails.append(part[0][-ticks:])   # 每台最後 ticks 個 ts 的聯集一定涵蓋全體最近的 ticks 個
+            stamps = np.unique(np.concatenate(tails))[-ticks:]
+            if len(stamps) >= ticks:
+                break
+        return _datetimes(stamps[::-1])
+
+    def rows_after(self, db: Session, after: dt.datetime = None, limit: int = None):
+        bounds = self._bounds()
+        if bounds is None:
+            return []
+        lo = _us(after) + 1 if after is not None else LO
+        out = []
+        for names, idx, ts, prod, eff, st in self._windows(lo, bounds[1]):
+            out.extend(zip([names[i] for i in idx.tolist()], _datetimes(ts), _STATUS_NAMES[st].tolist(),
+                           prod.tolist(), eff.tolist()))
+            if limit is not None and len(out) >= limit:
+                break
+        return out[:limit]
+
+    def latest(self, db: Session, before: dt.datetime = None, since: dt.datetime = None):
+        """每台設備（Equipment 表）由新到舊找，該日找到就不再往前翻"""
+        bounds = self._bounds(since, before)
+        if bounds is None:
+            return {}
+        lo, hi = bounds
+        remaining = {eid for (eid,) in db.query(Equipment.equipment_id).distinct()}
+        out = {}
+        for day_us, day_dir in reversed(self._days()):
+            if not remaining or day_us + DAY_US <= lo:
+                break
+            if day_us >= hi:
+                continue
+            dirs = self._equipment_dirs(day_dir)
+            for eid in remaining & dirs.keys():
+                best = None
+                for path in reversed(self._chunks(dirs[eid])):   # 通常最後一個 chunk 就有答案，較早的靠 header 略過
+                    part = self._read(path, lo if best is None else max(lo, int(best[0][-1]) + 1), hi)
+                    if part is not None:
+                        best = part
+                if best is not None:
+                    ts, prod, eff, st = best
+                    out[eid] = (_datetimes(ts[-1:])[0], int(prod[-1]), STATUS[st[-1]], float(eff[-1]))
+            remaining -= out.keys()
+        return out
+
+    def scan(self, db: Session, since: dt.datetime, until: dt.datetime, equipment: str = None, batch_rows: int = 10000):
+        bounds = self._bounds(since, until)
+        if bounds is None:
+            return
+        for names, idx, ts, prod, eff, st in self._windows(*bounds, [equipment] if equipment else None):
+            rows = list(zip(np.datetime_as_string(ts.astype("datetime64[us]"), unit="us").tolist(),
+                            [names[i] for i in idx.tolist()], _STATUS_NAMES[st].tolist(),
+                            prod.tolist(), eff.tolist()))
+            for k in range(0, len(rows), batch_rows):
+                yield rows[k:k + batch_rows]
+
+    def newest_ts(self, db: Session):
+        """HEAD 就是最新一筆的 ts，不必開 chunk"""
+        head = self._read_head()
+        return _datetimes(np.array([head]))[0] if head is not None else None
+
+    def earliest_ts(self, db: Session):
+        bounds = self._bounds()
+        if bounds is None:
+            return None
+        for _, day_dir in self._days():
+            firsts = [part[0][0] for eqp_dir in self._equipment_dirs(day_dir).values()
+                      for path in self._chunks(eqp_dir)
+                      if (part := self._read(path, *bounds)) is not None]
+            if firsts:
+                return _datetimes(np.array([min(firsts)]))[0]
+        return None
+
+    def drop_expired(self, db: Session, now: dt.datetime = None, days: int = partitions.RAW_RETENTION_DAYS):
+        """整個刪掉早於 (今天 - days) 的日期目錄；回傳被刪掉的目錄名"""
+        now = now or dt.datetime.utcnow()
+        cutoff = _us(dt.datetime.combine(now.date() - dt.timedelta(days=days), dt.time.min))
+        dropped = []
+        for day_us, day_dir in self._days():
+            if day_us + DAY_US <= cutoff:
+                shutil.rmtree(day_dir, ignore_errors=True)
+                dropped.append(os.path.basename(day_dir))
+        if dropped:
+            with self._cache_lock:
+                for path in [p for p in self._cache if os.path.basename(os.path.dirname(os.path.dirname(p))) in dropped]:
+                    self._cached_rows -= self._cache.pop(path)[0]
+            for path in [p for p in self._sealed if os.path.basename(os.path.dirname(os.path.dirname(p))) in dropped]:
+                del self._sealed[path]
+        return dropped
+
+
+# ====== 對外介面 ======
+def _backend(url: str):
+    if url in ("", "sqlite://"):
+        return SQLiteStore()
+    if url.startswith("columnar://"):
+        return ColumnarStore(url[len("columnar://"):] or "tsdata")
+    raise ValueError(f"不支援的 STORAGE_URL：{url!r}")
+
+
+STORE = _backend(STORAGE_URL)
+
+
+def in_sqlite() -> bool:
+    return STORE.in_sqlite
+
+
+def append(db: Session, rows):
+    STORE.append(db, rows)
+
+
+def production_since(db: Session, since: dt.datetime, until: dt.datetime = None):
+    return STORE.production_since(db, since, until)
+
+
+def production_after(db: Session, after: dt.datetime, limit: int):
+    return STORE.production_after(db, after, limit)
+
+
+def recent_stamps(db: Session, ticks: int):
+    return STORE.recent_stamps(db, ticks)
+
+
+def rows_after(db: Session, after: dt.datetime = None, limit: int = None):
+    return STORE.rows_after(db, after, limit)
+
+
+def latest(db: Session, before: dt.datetime = None, since: dt.datetime = None):
+    return STORE.latest(db, before, since)
+
+
+def scan(db: Session, since: dt.datetime, until: dt.datetime, equipment: str = None, batch_rows: int = 10000):
+    return STORE.scan(db, since, until, equipment, batch_rows)
+
+
+def newest_ts(db: Session):
+    return STORE.newest_ts(db)
+
+
+def earliest_ts(db: Session):
+    return STORE.earliest_ts(db)
+
+
+def drop_expired(db: Session, now: dt.datetime = None, days: int = partitions.RAW_RETENTION_DAYS):
+    return STORE.drop_expired(db, now, days)